@@ -0,0 +1,776 @@
+"""
+MineralPydiaBench.py
+
+This program benchmarks MineralPydiaImageWrangle.py against a local stand-in for the image host, and the http engine
+of MineralPydiaCrawl.py against a local stand-in for Mineralpedia, so that download and crawl changes can be measured
+without hitting Dakota Matrix Minerals. If Firefox can be started, the Selenium engine's field extraction is also
+timed over saved mineral pages, counting the round trips made to the browser per page. Lookups and filters through
+MineralPydiaQuery.py are timed against loading the whole crawl output with pandas, and MineralPydiaNormalize.py is
+timed against normalizing one row at a time.
+
+The stand-in serves a fixed number of bytes for every path it is asked for after waiting a fixed latency, which is
+roughly what a single image fetch looks like from the wrangler's point of view. It can also be served over HTTPS with
+a throwaway self-signed certificate (made with the openssl command line tool) to measure connection reuse.
+"""
+
+# stand-in server
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import ssl
+
+# https baseline
+import urllib.request
+import subprocess
+import shutil
+
+# timing and scratch files
+import tempfile
+import hashlib
+import time
+import csv
+import os
+
+# selenium extraction baseline
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+
+import MineralPydiaImageWrangle
+import MineralPydiaCrawl
+import MineralPydiaQuery
+import MineralPydiaNormalize
+from MineralPydiaParse import MissingFieldError
+from MineralPydiaBrowser import new_driver
+
+
+"""
+ENVIRONMENT VARIABLES
+
+NUM_IMAGES - the number of images to download in each run.
+IMAGE_SIZE - the size of each served image in bytes.
+LATENCY - the number of seconds the stand-in waits before answering each request.
+WORKER_COUNTS - the worker counts to benchmark, 1 is the serial path.
+PER_HOST - the per host concurrency limit handed to the wrangler.
+POOL_SIZE - the number of kept alive connections per host handed to the wrangler.
+SITE_PAGES - the number of listing pages on the stand-in Mineralpedia.
+SITE_MINERALS - the number of minerals on each stand-in listing page.
+CRAWL_WORKER_COUNTS - the crawl worker counts to benchmark.
+SAVED_PAGES - a directory of saved mineral pages (.html) to time field extraction over. If left None the stand-in's
+              mineral pages are saved and used.
+QUERY_CSV - the crawl output to time queries and normalization over. If it does not exist both benchmarks are skipped.
+QUERY_REPEATS - the number of times each query is timed.
+NORMALIZE_ROWS - the number of rows normalized, the crawl output is repeated until it has at least this many.
+"""
+NUM_IMAGES = 200
+IMAGE_SIZE = 64 * 1024
+LATENCY = 0.05
+WORKER_COUNTS = [1, 4, 8, 16]
+PER_HOST = 16
+POOL_SIZE = 16
+SITE_PAGES = 4
+SITE_MINERALS = 16
+CRAWL_WORKER_COUNTS = [1, 2, 4, 8]
+SAVED_PAGES = None
+QUERY_CSV = "./MineralPydiaCrawlData.csv"
+QUERY_REPEATS = 5
+NORMALIZE_ROWS = 100000
+
+
+# class StandInHandler
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    StandInHandler
+
+    Answers every GET with IMAGE_SIZE bytes after sleeping for LATENCY seconds.
+    Range requests are answered with the requested tail of the image.
+    Connections are kept alive and every accepted connection is counted.
+    """
+
+    # HTTP/1.1 so that clients can keep connections alive
+    protocol_version = "HTTP/1.1"
+
+    # the number of connections accepted so far
+    connections = 0
+    _lock = threading.Lock()
+
+    # the served image, built once
+    body = b"\xff" * IMAGE_SIZE
+
+    # the artificial latency
+    latency = LATENCY
+
+    def setup(self):
+        with StandInHandler._lock:
+            StandInHandler.connections += 1
+        super().setup()
+
+    def do_GET(self):
+        time.sleep(self.latency)
+
+        # honour "Range: bytes=<start>-" so resumed downloads can be exercised
+        start = 0
+        if self.headers.get("Range", "").startswith("bytes="):
+            start = int(self.headers["Range"][6:].split("-")[0])
+
+        if start >= len(self.body):
+            self.send_response(416)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(206 if start > 0 else 200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(self.body) - start))
+        if start > 0:
+            self.send_header(
+                "Content-Range", "bytes " + str(start) + "-" + str(len(self.body) - 1) + "/" + str(len(self.body))
+            )
+        self.end_headers()
+        self.wfile.write(self.body[start:])
+
+    def log_message(self, format, *args):
+        # keep the benchmark output readable
+        pass
+
+
+# class StandInSiteHandler
+class StandInSiteHandler(BaseHTTPRequestHandler):
+    """
+    StandInSiteHandler
+
+    Serves SITE_PAGES listing pages of SITE_MINERALS minerals each, and a mineral page for every mineral, after
+    sleeping for LATENCY seconds. The markup has the same selectors and descriptors the crawler looks for.
+    Every page has an ETag, and conditional requests for an unchanged page are answered with 304 Not Modified.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    # the artificial latency
+    latency = LATENCY
+
+    listing = (
+        "<html><body>{items}"
+        '<ul class="pagination"><li><a href="/mineralpedia?page=2">Next</a></li>'
+        '<li><a href="/mineralpedia?page={pages}">Last</a></li></ul>'
+        "</body></html>"
+    )
+    item = (
+        '<div class="item"><div class="block-title"><h2><a href="/mineralpedia/{name}">{name}</a></h2></div></div>'
+    )
+    mineral = (
+        "<html><body><h1>{name}</h1><dl>"
+        "<dt>Crystal Habit</dt><dd>Blocky, Skeletal, Arborescent</dd>"
+        "<dt>Color</dt><dd>lead gray, gray, iron black</dd>"
+        "<dt>Streak</dt><dd>shining black</dd>"
+        "<dt>Crystal System</dt><dd>Monoclinic</dd>"
+        "<dt>Fracture</dt><dd>Sectile</dd>"
+        "<dt>Hardness</dt><dd><span>2&nbsp;-&nbsp;2.5</span></dd>"
+        "</dl>{thumbs}</body></html>"
+    )
+    thumb = '<a class="catalog-thumb" href="/images/products/{name}{i}.jpg"><img class="ism" src="#"></a>'
+
+    def do_GET(self):
+        time.sleep(self.latency)
+
+        body = None
+        if self.path.startswith("/mineralpedia?page="):
+            page = int(self.path.split("=")[-1])
+            names = ["mineral" + str(page) + "x" + str(i) for i in range(SITE_MINERALS)] if page <= SITE_PAGES else []
+            body = self.listing.format(items="".join(self.item.format(name=name) for name in names), pages=SITE_PAGES)
+
+        elif self.path.startswith("/mineralpedia/"):
+            name = self.path.split("/")[-1]
+            body = self.mineral.format(name=name, thumbs="".join(self.thumb.format(name=name, i=i) for i in range(9)))
+
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = body.encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # keep the benchmark output readable
+        pass
+
+
+# starts the stand-in server
+def start_stand_in(handler=StandInHandler, context=None):
+    """
+    start_stand_in
+
+    Starts the stand-in server on a free local port in a background thread.
+
+    :param handler: the request handler class to serve with.
+    :param context: a server side ssl.SSLContext, if given the stand-in is served over HTTPS.
+    :return: the running server, its base url is http(s)://127.0.0.1:<server.server_port>
+    """
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    if context is not None:
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# creates a self-signed certificate for the https stand-in
+def make_certificate(directory):
+    """
+    make_certificate
+
+    Creates a self-signed certificate for 127.0.0.1 using the openssl command line tool.
+
+    :param directory: the directory the certificate and key are written to.
+    :return: a tuple of the certificate and key paths, or None if openssl is not installed.
+    """
+
+    if shutil.which("openssl") is None:
+        return None
+
+    cert = os.path.join(directory, "stand_in.pem")
+    key = os.path.join(directory, "stand_in.key")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-keyout", key, "-out", cert, "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1"
+        ],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    return cert, key
+
+
+# writes a csv pointing at the stand-in
+def write_csv(path, base_url, num_images):
+    """
+    write_csv
+
+    Writes a csv in the same schema as MineralPydiaCrawlData.csv with every image uri pointing at the stand-in.
+
+    :param path: the path of the csv to write.
+    :param base_url: the base url of the stand-in.
+    :param num_images: the number of rows to write.
+    """
+
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["name", "habit", "color", "streak", "class", "fracture", "hardness", "image_uri", "image_name"])
+        for i in range(num_images):
+            filename = "bench" + str(i) + ".jpg"
+            writer.writerow(
+                ["bench", "Blocky", "gray", "black", "Monoclinic", "", 2.25, base_url + "/images/" + filename, filename]
+            )
+
+
+# times a single wrangler run
+def bench_download(csv_path, img_dump_path, workers, per_host):
+    """
+    bench_download
+
+    Runs the wrangler once and times it.
+
+    :param csv_path: the csv to read image uris from.
+    :param img_dump_path: the directory to download to.
+    :param workers: the worker count handed to the wrangler.
+    :param per_host: the per host limit handed to the wrangler.
+    :return: the wall time of the run in seconds.
+    """
+
+    start = time.perf_counter()
+
+    # the wrangler always exits once it is finished
+    try:
+        MineralPydiaImageWrangle.mineral_pydia_image_wrangler(csv_path, img_dump_path, workers, per_host, None, POOL_SIZE)
+    except SystemExit:
+        pass
+
+    return time.perf_counter() - start
+
+
+# times a download of every image opening a new connection for each one
+def bench_per_request(csv_path, img_dump_path, context):
+    """
+    bench_per_request
+
+    Downloads every image with urllib, one new connection per image, the same way the wrangler used to.
+
+    :param csv_path: the csv to read image uris from.
+    :param img_dump_path: the directory to download to.
+    :param context: the client ssl.SSLContext.
+    :return: the wall time of the run in seconds.
+    """
+
+    start = time.perf_counter()
+
+    with open(csv_path, newline="") as file:
+        for row in csv.DictReader(file):
+            with urllib.request.urlopen(row["image_uri"], context=context) as response:
+                with open(img_dump_path + "/" + row["image_name"], "wb") as image:
+                    shutil.copyfileobj(response, image)
+
+    return time.perf_counter() - start
+
+
+# compares connections opened with and without pooling
+def bench_connections(scratch):
+    """
+    bench_connections
+
+    Serves the stand-in over HTTPS and downloads every image once opening a connection per image, then through the
+    wrangler's connection pool with one worker and with the most workers benchmarked, counting the connections the
+    stand-in accepts each time.
+
+    :param scratch: the scratch directory to work in.
+    :return: a list of (label, connections, seconds) tuples, empty if openssl is not installed.
+    """
+
+    certificate = make_certificate(scratch)
+    if certificate is None:
+        print("openssl was not found, skipping the HTTPS connection benchmark.")
+        return []
+
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(*certificate)
+    server = start_stand_in(context=server_context)
+
+    # the wrangler builds its own default context, point it at the throwaway certificate
+    os.environ["SSL_CERT_FILE"] = certificate[0]
+    client_context = ssl.create_default_context(cafile=certificate[0])
+
+    write_csv("bench_https.csv", "https://127.0.0.1:" + str(server.server_port), NUM_IMAGES)
+
+    results = []
+
+    os.mkdir("img_dump_per_request")
+    StandInHandler.connections = 0
+    elapsed = bench_per_request("bench_https.csv", "img_dump_per_request", client_context)
+    results.append(("per request", StandInHandler.connections, elapsed))
+
+    # pooled with a single worker is a like for like comparison, then with the most workers benchmarked
+    for workers in sorted({1, max(WORKER_COUNTS)}):
+        img_dump_path = "img_dump_pooled_" + str(workers)
+        os.mkdir(img_dump_path)
+        StandInHandler.connections = 0
+        elapsed = bench_download("bench_https.csv", img_dump_path, workers, PER_HOST)
+        results.append(("pooled x" + str(workers), StandInHandler.connections, elapsed))
+
+    del os.environ["SSL_CERT_FILE"]
+    server.shutdown()
+
+    return results
+
+
+# times a single crawl of the stand-in Mineralpedia
+def bench_crawl(base_url, workers, cache_path=None):
+    """
+    bench_crawl
+
+    Crawls the stand-in Mineralpedia once with the http engine and times it.
+
+    :param base_url: the base url of the stand-in Mineralpedia.
+    :param workers: the crawl worker count.
+    :param cache_path: the page cache to crawl with, None to crawl without one.
+    :return: a tuple of the wall time of the crawl in seconds and the number of minerals collected.
+    """
+
+    # point a crawler at the stand-in instead of Dakota Matrix Minerals
+    class StandInCrawl(MineralPydiaCrawl.MineralPydiaCrawl):
+        _base_url = base_url + "/mineralpedia"
+
+    crawl = None
+    start = time.perf_counter()
+
+    # the crawler always exits once it is finished, so keep hold of it before it is initialized
+    try:
+        crawl = StandInCrawl.__new__(StandInCrawl)
+        crawl.__init__(
+            "*", "crawl_" + str(workers) + ".csv", MineralPydiaCrawl.HTTP, workers, None, cache_path
+        )
+    except SystemExit:
+        pass
+
+    return time.perf_counter() - start, len(crawl._mineral_dict)
+
+
+# the extraction the selenium engine used to make, one round trip per field and per thumbnail
+def extract_per_field(driver):
+    """
+    extract_per_field
+
+    Extracts the fields of the mineral page the driver is on with a separate XPath lookup for every field and a
+    separate get_attribute for every thumbnail, the way the Selenium engine used to.
+
+    :param driver: the webdriver currently on a mineral page.
+    :return: a dictionary of the raw fields, a missing field is None.
+    """
+
+    def field(xpath, attribute="innerText"):
+        try:
+            return driver.find_element(By.XPATH, xpath).get_attribute(attribute)
+        except NoSuchElementException:
+            return None
+
+    return {
+        "habit": field("//dt[contains(text(), 'Crystal Habit')]/following-sibling::dd"),
+        "color": field("//dt[contains(text(), 'Color')]/following-sibling::dd"),
+        "streak": field("//dt[contains(text(), 'Streak')]/following-sibling::dd"),
+        "class": field("//dt[contains(text(), 'Crystal System')]/following-sibling::dd"),
+        "hardness": field("//dt[contains(text(), 'Hardness')]/following-sibling::dd/span"),
+        "fracture": field("//dt[text()='Fracture']/following-sibling::dd"),
+        "images": [a.get_attribute("href") for a in driver.find_elements(By.CSS_SELECTOR, "a.catalog-thumb")]
+    }
+
+
+# the extraction the selenium engine makes now, one round trip per page
+def extract_batched(driver):
+    """
+    extract_batched
+
+    Extracts the same fields as extract_per_field through MineralPydiaCrawl._DriverPage.
+
+    :param driver: the webdriver currently on a mineral page.
+    :return: a dictionary of the raw fields, a missing field is None.
+    """
+
+    page = MineralPydiaCrawl._DriverPage(driver)
+
+    def field(lookup, label):
+        try:
+            return lookup(label)
+        except MissingFieldError:
+            return None
+
+    return {
+        "habit": field(page.field, "Crystal Habit"),
+        "color": field(page.field, "Color"),
+        "streak": field(page.field, "Streak"),
+        "class": field(page.field, "Crystal System"),
+        "hardness": field(page.field_span, "Hardness"),
+        "fracture": field(page.exact_field, "Fracture"),
+        "images": page.thumbnails()
+    }
+
+
+def bench_extract(pages_dir):
+    """
+    bench_extract
+
+    Loads every saved mineral page in headless Firefox and extracts its fields both ways, counting the WebDriver
+    commands each makes and checking that both give the same result.
+
+    :param pages_dir: the directory of saved mineral pages.
+    :return: a list of (label, round trips per page, milliseconds per page) for both ways, and whether every page gave
+             the same result both ways.
+    """
+
+    driver = new_driver()
+
+    # every WebDriver command is one round trip to the browser
+    commands = [0]
+    execute = driver.execute
+
+    def counted(*args, **kwargs):
+        commands[0] += 1
+        return execute(*args, **kwargs)
+
+    driver.execute = counted
+
+    ways = [("per field", extract_per_field), ("batched", extract_batched)]
+    totals = dict((label, [0, 0.0]) for label, _ in ways)
+    identical = True
+    pages = sorted(name for name in os.listdir(pages_dir) if name.endswith(".html"))
+
+    try:
+        for name in pages:
+            driver.get("file://" + os.path.abspath(os.path.join(pages_dir, name)))
+
+            results = []
+            for label, extract in ways:
+                commands[0] = 0
+                start = time.perf_counter()
+                results.append(extract(driver))
+                totals[label][1] += time.perf_counter() - start
+                totals[label][0] += commands[0]
+
+            identical = identical and results[0] == results[1]
+    finally:
+        driver.quit()
+
+    return [
+        (label, totals[label][0] / len(pages), 1000 * totals[label][1] / len(pages)) for label, _ in ways
+    ], identical
+
+
+def bench_query(csv_path, index_dir):
+    """
+    bench_query
+
+    Times looking up every mineral by name and one filter by hardness range, crystal system and color, first the way
+    downstream services do it by loading the whole crawl output with pandas, then through the index.
+
+    :param csv_path: the crawl output.
+    :param index_dir: the directory to build the index in.
+    :return: a list of (label, milliseconds) and whether the filter matched the same minerals both ways.
+    """
+
+    import pandas as pd
+
+    results = []
+
+    # the baseline loads the crawl output for every request
+    start = time.perf_counter()
+    for _ in range(QUERY_REPEATS):
+        df = pd.read_csv(csv_path)
+    results.append(("pandas load", 1000 * (time.perf_counter() - start) / QUERY_REPEATS))
+
+    minerals = df.drop_duplicates("name")
+    names = list(minerals["name"])
+
+    start = time.perf_counter()
+    for name in names:
+        df[df["name"] == name].iloc[0].to_dict()
+    results.append(("pandas lookup", 1000 * (time.perf_counter() - start) / len(names)))
+
+    start = time.perf_counter()
+    for _ in range(QUERY_REPEATS):
+        expected = minerals[
+            minerals["hardness"].between(3, 5) & (minerals["class"].str.casefold() == "monoclinic")
+            & minerals["color"].fillna("").str.casefold().str.contains(r"\bred\b")
+        ]
+    results.append(("pandas filter", 1000 * (time.perf_counter() - start) / QUERY_REPEATS))
+
+    # the index is built once, then every request only opens it
+    start = time.perf_counter()
+    MineralPydiaQuery.build_index(csv_path, index_dir)
+    results.append(("index build", 1000 * (time.perf_counter() - start)))
+
+    start = time.perf_counter()
+    for _ in range(QUERY_REPEATS):
+        MineralPydiaQuery.open_index(csv_path, index_dir).close()
+    results.append(("index open", 1000 * (time.perf_counter() - start) / QUERY_REPEATS))
+
+    with MineralPydiaQuery.open_index(csv_path, index_dir) as index:
+        start = time.perf_counter()
+        for name in names:
+            index.get(name)
+        results.append(("index lookup", 1000 * (time.perf_counter() - start) / len(names)))
+
+        start = time.perf_counter()
+        for _ in range(QUERY_REPEATS):
+            matched = index.query((3, 5), crystal_class="monoclinic", color="red")
+        results.append(("index filter", 1000 * (time.perf_counter() - start) / QUERY_REPEATS))
+
+    identical = sorted(record["name"] for record in matched) == sorted(expected["name"])
+
+    return results, identical
+
+
+def bench_normalize(csv_path):
+    """
+    bench_normalize
+
+    Normalizes the hardness, crystal system and descriptors of a large table, first one row at a time the way the
+    crawler parses hardness, then with MineralPydiaNormalize.
+
+    :param csv_path: the crawl output, repeated until it has NORMALIZE_ROWS rows.
+    :return: a tuple of the number of rows, the seconds taken one row at a time, the seconds taken vectorized, and
+             whether both gave the same mean hardness and tokens.
+    """
+
+    import pandas as pd
+    import numpy as np
+    import re
+
+    df = pd.read_csv(csv_path)
+    df = pd.concat([df] * -(-NORMALIZE_ROWS // len(df)), ignore_index=True)
+
+    # hardness as the page shows it, so both ways have to parse it
+    df["hardness"] = df["hardness"].map(lambda h: format(h, "g") + "\xa0")
+
+    pattern = re.compile("^[0-9]+(\\.[0-9]+)*(-[0-9]+(\\.[0-9]+)*)*$")
+    systems = dict((system.casefold(), system) for system in MineralPydiaNormalize.CRYSTAL_SYSTEMS)
+    systems.update(MineralPydiaNormalize.CRYSTAL_SYSTEM_ALIASES)
+
+    fields = MineralPydiaNormalize.TOKEN_FIELDS
+
+    start = time.perf_counter()
+    parsed = []
+    tokens = dict((field, []) for field in fields)
+    for hardness, system, *descriptors in zip(df["hardness"], df["class"], *(df[field] for field in fields)):
+        hardness = hardness.replace("\xa0", "")
+        if re.fullmatch(pattern, hardness) is None:
+            parsed.append((np.nan, np.nan, np.nan))
+        else:
+            values = [float(h) for h in hardness.split("-")]
+            parsed.append((min(values), max(values), np.mean(values)))
+
+        systems.get(str(system).strip().casefold())
+
+        for field, value in zip(fields, descriptors):
+            split = [] if not isinstance(value, str) else (" ".join(p.split()).casefold() for p in value.split(","))
+            tokens[field].append(list(dict.fromkeys(t for t in split if t)))
+    serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table = MineralPydiaNormalize.normalize(df)
+    vectorized_tokens = dict((field, MineralPydiaNormalize.tokenize(df[field])) for field in fields)
+    vectorized = time.perf_counter() - start
+
+    identical = np.allclose(
+        table[["hardness_min", "hardness_max", "hardness_mean"]].to_numpy(), np.array(parsed), equal_nan=True
+    )
+    for field, long in vectorized_tokens.items():
+        grouped = dict()
+        for row, token in zip(long["row"], long["token"].astype(str)):
+            grouped.setdefault(row, []).append(token)
+        identical = identical and all(tokens[field][i] == grouped.get(i, []) for i in range(len(df)))
+
+    return len(df), serial, vectorized, identical
+
+
+def main():
+    """
+    main
+
+    Benchmarks the wrangler at each worker count and prints images per second, then compares the connections opened
+    per 1,000 images with and without pooling over HTTPS, then benchmarks the crawler at each crawl worker count and
+    with a cold and warm page cache, times the Selenium engine's field extraction if Firefox is available, and finally
+    times queries through the index against pandas and normalization against a row at a time if there is a crawl
+    output to use.
+    """
+
+    server = start_stand_in()
+    base_url = "http://127.0.0.1:" + str(server.server_port)
+
+    results = []
+    connection_results = []
+    crawl_results = []
+    recrawl_results = []
+    extract_results = None
+    query_results = None
+    normalize_results = None
+    query_csv = os.path.abspath(QUERY_CSV)
+
+    site = start_stand_in(StandInSiteHandler)
+    site_url = "http://127.0.0.1:" + str(site.server_port)
+
+    # work from a scratch directory so the real logs and images are left alone
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            write_csv("bench.csv", base_url, NUM_IMAGES)
+
+            for workers in WORKER_COUNTS:
+                img_dump_path = "img_dump_" + str(workers)
+                os.mkdir(img_dump_path)
+
+                elapsed = bench_download("bench.csv", img_dump_path, workers, PER_HOST)
+                results.append((workers, elapsed))
+
+            connection_results = bench_connections(scratch)
+
+            for workers in CRAWL_WORKER_COUNTS:
+                crawl_results.append((workers,) + bench_crawl(site_url, workers))
+
+            # a cold crawl fills the page cache, the re-crawl only sends conditional requests
+            for label in ("cold cache", "re-crawl"):
+                recrawl_results.append((label,) + bench_crawl(site_url, 1, "pages.sqlite"))
+
+            # save the stand-in's mineral pages unless real saved pages are given
+            pages_dir = SAVED_PAGES
+            if pages_dir is None:
+                pages_dir = "saved_pages"
+                os.mkdir(pages_dir)
+                for i in range(SITE_MINERALS):
+                    name = "mineral" + str(i)
+                    with open(os.path.join(pages_dir, name + ".html"), "w", encoding="utf-8") as file:
+                        file.write(StandInSiteHandler.mineral.format(
+                            name=name,
+                            thumbs="".join(StandInSiteHandler.thumb.format(name=name, i=i) for i in range(9))
+                        ))
+
+            try:
+                extract_results = bench_extract(pages_dir)
+            except (WebDriverException, TypeError, OSError) as e:
+                print("Skipping the extraction benchmark, Firefox could not be started: " + str(e))
+
+            if os.path.isfile(query_csv):
+                query_results = bench_query(query_csv, "query.index")
+                normalize_results = bench_normalize(query_csv)
+            else:
+                print("Skipping the query and normalization benchmarks, there is no crawl output at " + query_csv)
+
+        finally:
+            os.chdir(cwd)
+
+    server.shutdown()
+    site.shutdown()
+
+    print("\nworkers\tseconds\timages/sec")
+    for workers, elapsed in results:
+        print(str(workers) + "\t" + format(elapsed, ".2f") + "\t" + format(NUM_IMAGES / elapsed, ".1f"))
+
+    if connection_results:
+        print("\nhttps\t\tconnections/1000 images\timages/sec")
+        for label, connections, elapsed in connection_results:
+            print(
+                label + "\t" + format(1000 * connections / NUM_IMAGES, ".1f") + "\t\t\t"
+                + format(NUM_IMAGES / elapsed, ".1f")
+            )
+
+    print("\ncrawl workers\tseconds\tminerals\tpages/sec\tspeedup")
+    for workers, elapsed, minerals in crawl_results:
+        pages = SITE_PAGES + minerals
+        print(
+            str(workers) + "\t\t" + format(elapsed, ".2f") + "\t" + str(minerals) + "\t\t"
+            + format(pages / elapsed, ".1f") + "\t\t" + format(crawl_results[0][1] / elapsed, ".2f") + "x"
+        )
+
+    print("\npage cache\tseconds\tminerals")
+    for label, elapsed, minerals in recrawl_results:
+        print(label + "\t" + format(elapsed, ".2f") + "\t" + str(minerals))
+
+    if extract_results is not None:
+        ways, identical = extract_results
+        print("\nextraction\tround trips/page\tms/page")
+        for label, round_trips, milliseconds in ways:
+            print(label + "\t" + format(round_trips, ".1f") + "\t\t\t" + format(milliseconds, ".2f"))
+        print("identical results: " + str(identical))
+
+    if query_results is not None:
+        timings, identical = query_results
+        print("\nquery\t\tms")
+        for label, milliseconds in timings:
+            print(label + "\t" + format(milliseconds, ".4f"))
+        print("identical results: " + str(identical))
+
+    if normalize_results is not None:
+        rows, serial, vectorized, identical = normalize_results
+        print("\nnormalize " + str(rows) + " rows\tseconds")
+        print("row at a time\t\t" + format(serial, ".3f"))
+        print("vectorized\t\t" + format(vectorized, ".3f"))
+        print("identical results: " + str(identical))
+
+
+if __name__ == "__main__":
+    """
+    Executes main if not being imported.
+    """
+    main()
@@ -0,0 +1,294 @@
+"""
+MineralPydiaBrowser.py
+
+Pool of headless Firefox webdrivers used by the Selenium engine of MineralPydiaCrawl.py.
+
+Firefox grows the longer it is used, so every browser is recycled once it has rendered a number of pages or once its
+own process tree (geckodriver and the Firefox processes under it) is using more than a given amount of memory. Only
+the browser being recycled is shut down, other browsers on the machine are left alone. Replacement browsers are
+started ahead of time on a background thread, so a recycle hands over a browser that is already running rather than
+stalling the crawl while a new one starts.
+"""
+
+# pooling
+import threading
+
+# process tree memory
+import psutil
+
+# selenium
+from selenium import webdriver
+from selenium.webdriver.firefox.options import Options
+
+
+# browsers are recycled after MAX_PAGES pages or once their process tree uses MAX_RSS megabytes
+MAX_PAGES = 250
+MAX_RSS = 1024
+
+# number of browsers kept started and waiting to be handed out
+PREWARM = 1
+
+
+# creates a new headless Firefox
+def new_driver(binary=None):
+    """
+    new_driver
+
+    Creates a new headless Firefox webdriver.
+
+    :param binary: the path of the Firefox executable, if None Selenium finds it.
+    :return: the webdriver.
+    """
+
+    options = Options()
+    options.set_preference("dom.disable_open_during_load", False)
+
+    # hide Selenium window
+    options.add_argument("-headless")
+
+    if binary is not None:
+        options.binary_location = binary
+
+    return webdriver.Firefox(options=options)
+
+
+# memory used by a browser
+def browser_rss(driver):
+    """
+    browser_rss
+
+    Gets the memory used by a webdriver's own process tree, geckodriver and every Firefox process started under it.
+
+    :param driver: the webdriver.
+    :return: the resident set size of the process tree in megabytes, 0 if it cannot be read.
+    """
+
+    try:
+        service = psutil.Process(driver.service.process.pid)
+        processes = [service] + service.children(recursive=True)
+    except (AttributeError, psutil.Error):
+        return 0.0
+
+    rss = 0
+    for process in processes:
+        try:
+            rss += process.memory_info().rss
+        except psutil.Error:
+            pass
+
+    return rss / (1024 * 1024)
+
+
+# class BrowserPool
+class BrowserPool:
+    """
+    BrowserPool
+
+    Hands out webdrivers, recycles them by page count and memory, and keeps replacements started ahead of time.
+    """
+
+    def __init__(self, factory=new_driver, max_pages=MAX_PAGES, max_rss=MAX_RSS, prewarm=PREWARM, metrics=None):
+        """
+        __init__
+
+        Starts warming the first browsers straight away.
+
+        :param factory: a callable creating a new webdriver.
+        :param max_pages: the number of pages a browser renders before it is recycled, None to not recycle on pages.
+        :param max_rss: the megabytes a browser's process tree may use before it is recycled, None to not recycle on
+                        memory.
+        :param prewarm: the number of browsers kept started and waiting.
+        :param metrics: the MineralPydiaMetrics.Metrics browser starts and recycles are recorded in, None to not record
+                        them.
+        """
+
+        self._factory = factory
+        self._max_pages = max_pages
+        self._max_rss = max_rss
+        self._prewarm = max(0, int(prewarm))
+        self._metrics = metrics
+
+        # browsers started and waiting, the number being started, and the number of pages each handed out has rendered
+        self._spares = []
+        self._warming = 0
+        self._pages = dict()
+
+        # threads starting or quitting browsers in the background
+        self._threads = []
+
+        self._closed = False
+        self._condition = threading.Condition()
+
+        with self._condition:
+            self._fill()
+
+    def _start(self):
+        """
+        _start
+
+        Starts a browser.
+
+        :return: the webdriver.
+        """
+
+        if self._metrics is None:
+            return self._factory()
+
+        with self._metrics.time("browser_start"):
+            return self._factory()
+
+    def _background(self, target, *args):
+        """
+        _background
+
+        Runs a function on a background thread that close waits for.
+
+        :param target: the function.
+        :param args: the arguments to the function.
+        """
+
+        thread = threading.Thread(target=target, args=args, name="browser-pool", daemon=True)
+        self._threads = [t for t in self._threads if t.is_alive()] + [thread]
+        thread.start()
+
+    def _fill(self):
+        """
+        _fill
+
+        Starts warming browsers until enough are waiting or being started, must be called holding the condition.
+        """
+
+        while not self._closed and len(self._spares) + self._warming < self._prewarm:
+            self._warming += 1
+            self._background(self._warm)
+
+    def _warm(self):
+        """
+        _warm
+
+        Body of a warming thread, starts a browser and adds it to the spares. A browser that fails to start is not
+        retried here, acquire starts one itself if no spare is waiting.
+        """
+
+        try:
+            driver = self._start()
+        except Exception:
+            driver = None
+
+        with self._condition:
+            self._warming -= 1
+
+            if driver is not None:
+                if self._closed:
+                    self._background(_quit, driver)
+                else:
+                    self._spares.append(driver)
+
+            self._condition.notify_all()
+
+    def acquire(self):
+        """
+        acquire
+
+        Takes a waiting browser, waiting for one being warmed if none is ready yet, or starts one if none is coming.
+
+        :return: the webdriver.
+        """
+
+        with self._condition:
+            while not self._spares and self._warming:
+                self._condition.wait()
+
+            driver = self._spares.pop() if self._spares else None
+            self._fill()
+
+        if driver is None:
+            driver = self._start()
+
+        with self._condition:
+            self._pages[driver] = 0
+
+        return driver
+
+    def recycle(self, driver):
+        """
+        recycle
+
+        Counts a page about to be rendered by a browser. If the browser has rendered max_pages pages or its process tree
+        uses more than max_rss megabytes it is quit in the background and a waiting browser is handed back instead.
+
+        :param driver: the webdriver about to render a page.
+        :return: the webdriver to render the page with.
+        """
+
+        with self._condition:
+            pages = self._pages.get(driver, 0)
+            self._pages[driver] = pages + 1
+
+        if not (
+                (self._max_pages is not None and pages >= self._max_pages)
+                or (self._max_rss is not None and browser_rss(driver) >= self._max_rss)
+        ):
+            return driver
+
+        if self._metrics is not None:
+            self._metrics.count("browser_recycles")
+
+        replacement = self.acquire()
+        self.release(driver)
+
+        with self._condition:
+            self._pages[replacement] = 1
+
+        return replacement
+
+    def release(self, driver):
+        """
+        release
+
+        Gives a browser back once it is no longer used, it is quit in the background.
+
+        :param driver: the webdriver.
+        """
+
+        with self._condition:
+            self._pages.pop(driver, None)
+            self._background(_quit, driver)
+
+    def close(self):
+        """
+        close
+
+        Quits every waiting browser, waits for browsers still being started or quit, and stops warming new ones.
+        Browsers still handed out must be released first.
+        """
+
+        with self._condition:
+            self._closed = True
+            while self._warming:
+                self._condition.wait()
+
+            spares, self._spares = self._spares, []
+            threads = list(self._threads)
+
+        for driver in spares:
+            _quit(driver)
+
+        for thread in threads:
+            thread.join()
+
+
+# quits a browser
+def _quit(driver):
+    """
+    _quit
+
+    Quits a webdriver, shutting down its own geckodriver and Firefox processes only.
+
+    :param driver: the webdriver.
+    """
+
+    try:
+        driver.quit()
+    except Exception:
+        pass
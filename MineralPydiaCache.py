@@ -0,0 +1,121 @@
+"""
+MineralPydiaCache.py
+
+On-disk page cache used by the http engine of MineralPydiaCrawl.py for incremental re-crawls.
+
+Every listing and mineral page is stored keyed by its url together with the ETag and Last-Modified validators the
+server sent and the record parsed from it (the mineral urls of a listing page, or the mineral data of a mineral page).
+A re-crawl sends conditional requests using the stored validators and only re-parses pages the server says have
+changed.
+"""
+
+# storage
+import sqlite3
+import threading
+import json
+
+# timestamps
+from datetime import datetime
+
+
+# class PageCache
+class PageCache:
+    """
+    PageCache
+
+    Thread safe wrapper around the page cache database.
+    """
+
+    def __init__(self, path):
+        """
+        __init__
+
+        Opens the cache, creating it if it does not already exist.
+
+        :param path: path of the cache database.
+        """
+
+        self._path = path
+
+        # a single connection shared by all crawl workers, every access goes through the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, "
+            "etag TEXT, "
+            "last_modified TEXT, "
+            "fetched TEXT NOT NULL, "
+            "record TEXT)"
+        )
+        self._conn.commit()
+
+    def get(self, url):
+        """
+        get
+
+        Looks up a cached page.
+
+        :param url: the url of the page.
+        :return: a dictionary with the etag, last_modified, fetched time and parsed record, or None if not cached.
+        """
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, fetched, record FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "etag": row[0],
+            "last_modified": row[1],
+            "fetched": row[2],
+            "record": json.loads(row[3]) if row[3] is not None else None
+        }
+
+    def put(self, url, etag, last_modified, record):
+        """
+        put
+
+        Stores a page, replacing any earlier entry.
+
+        :param url: the url of the page.
+        :param etag: the ETag the server sent, if any.
+        :param last_modified: the Last-Modified the server sent, if any.
+        :param record: the record parsed from the page, must be JSON serializable. None for a page with nothing usable.
+        """
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, fetched, record) VALUES (?, ?, ?, ?, ?)",
+                (
+                    url, etag, last_modified, datetime.now().isoformat(),
+                    json.dumps(record) if record is not None else None
+                )
+            )
+            self._conn.commit()
+
+    def touch(self, url):
+        """
+        touch
+
+        Records that a cached page was confirmed unchanged just now.
+
+        :param url: the url of the page.
+        """
+
+        with self._lock:
+            self._conn.execute("UPDATE pages SET fetched = ? WHERE url = ?", (datetime.now().isoformat(), url))
+            self._conn.commit()
+
+    def close(self):
+        """
+        close
+
+        Closes the cache.
+        """
+
+        with self._lock:
+            self._conn.close()
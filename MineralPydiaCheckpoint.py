@@ -0,0 +1,169 @@
+"""
+MineralPydiaCheckpoint.py
+
+Checkpoint file used by MineralPydiaCrawl.py to resume a crawl where the last run stopped.
+
+The checkpoint is a JSON lines file appended to as the crawl goes, one record per line:
+    * {"type": "count", "pages": <n>} - the number of listing pages found on the site
+    * {"type": "page", "page": <n>, "urls": [...]} - the mineral urls collected from listing page n
+    * {"type": "mineral", "url": <url>, "name": <name>, "info": {...}} - a mineral that was scraped
+    * {"type": "skipped", "url": <url>, "name": <name>} - a mineral skipped for missing required information
+
+Every record is flushed as soon as it is written. A line cut off by a crash is dropped from the file when the
+checkpoint is resumed.
+"""
+
+# storage
+import threading
+import json
+import os
+
+
+# records are forced to disk every FSYNC_EVERY records
+FSYNC_EVERY = 50
+
+
+# class CrawlCheckpoint
+class CrawlCheckpoint:
+    """
+    CrawlCheckpoint
+
+    Thread safe reader and writer of a crawl checkpoint.
+    """
+
+    def __init__(self, path, resume=False):
+        """
+        __init__
+
+        Opens the checkpoint. When resuming, everything already recorded is loaded and new records are appended,
+        otherwise the checkpoint is started over.
+
+        :param path: path of the checkpoint file.
+        :param resume: True to continue from the records already in the checkpoint.
+        """
+
+        self.path = path
+
+        # number of listing pages found on the site, None until it is found
+        self.page_count = None
+
+        # listing page number to the urls collected from it
+        self.pages = dict()
+
+        # mineral url to its record, None for a skipped mineral
+        self.minerals = dict()
+
+        if resume and os.path.isfile(path):
+            self._load()
+
+        self._lock = threading.Lock()
+        self._records = 0
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self):
+        """
+        _load
+
+        Reads every complete record in the checkpoint, and cuts off a last line left unfinished by a crash so the
+        records appended after it start on a line of their own.
+        """
+
+        # the end of the last line ending in a newline
+        end = 0
+
+        with open(self.path, "rb+") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                end += len(line)
+
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    continue
+
+                if record["type"] == "count":
+                    self.page_count = record["pages"]
+                elif record["type"] == "page":
+                    self.pages[record["page"]] = record["urls"]
+                elif record["type"] == "mineral":
+                    self.minerals[record["url"]] = record["info"]
+                elif record["type"] == "skipped":
+                    self.minerals[record["url"]] = None
+
+            file.truncate(end)
+
+    def _write(self, record):
+        """
+        _write
+
+        Appends a record.
+
+        :param record: the JSON serializable record.
+        """
+
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+
+            self._records += 1
+            if self._records % FSYNC_EVERY == 0:
+                os.fsync(self._file.fileno())
+
+    def count(self, pages):
+        """
+        count
+
+        Records the number of listing pages found on the site.
+
+        :param pages: the number of listing pages.
+        """
+
+        self.page_count = pages
+        self._write({"type": "count", "pages": pages})
+
+    def page(self, page, urls):
+        """
+        page
+
+        Records the mineral urls collected from a listing page.
+
+        :param page: the listing page number.
+        :param urls: the mineral urls on the page.
+        """
+
+        self.pages[page] = urls
+        self._write({"type": "page", "page": page, "urls": urls})
+
+    def mineral(self, url, name, mineral_info):
+        """
+        mineral
+
+        Records a scraped mineral, or a mineral that was skipped.
+
+        :param url: the url of the mineral page.
+        :param name: the name of the mineral.
+        :param mineral_info: the dictionary of mineral data, None if the mineral was skipped.
+        """
+
+        self.minerals[url] = mineral_info
+
+        if mineral_info is None:
+            self._write({"type": "skipped", "url": url, "name": name})
+        else:
+            self._write({"type": "mineral", "url": url, "name": name, "info": mineral_info})
+
+    def close(self):
+        """
+        close
+
+        Forces every record to disk and closes the checkpoint.
+        """
+
+        with self._lock:
+            if self._file.closed:
+                return
+
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
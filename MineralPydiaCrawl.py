@@ -16,36 +16,111 @@ author: Reis Mercer Gadsden
 
 # logging usage
 from datetime import datetime
+from MineralPydiaLog import Logger, INFO, WARNING, ERROR
+from MineralPydiaMetrics import Metrics
+from MineralPydiaProgress import Progress
+import time
 
 # user input validation
 import re
 import os
 
-# data manipulation and storage
-import pandas as pd
-import numpy as np
+# parallel crawling
+import threading
+import queue
 
-# selenium imports
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as ec
-from selenium.webdriver.firefox.options import Options
-from selenium.common.exceptions import NoSuchElementException
+# selenium, and the browser pool with psutil, are imported by the selenium engine when it is used
 
-import psutil
+# http engine imports
+from MineralPydiaHTTP import HTTPPool
+from MineralPydiaFetch import Fetcher, FetchFailed
+from MineralPydiaParse import MineralPage, MissingFieldError, parse_listing, parse_page_count
+from MineralPydiaCache import PageCache
+from MineralPydiaCheckpoint import CrawlCheckpoint
+
+# output
+from MineralPydiaOutput import open_output, table_paths, FORMATS, CSV
 
 
 """
 ENVIRONMENT VARIABLES
 
-OUTPUT - The output file to write to, must be a csv. If left None use default path (./MineralPydiaCrawlData.csv).
-NUM_PAGES - The number of pages to gather from. If the value is "*" then the maximum amount of pages are crawled to.
-            All other values must be an integer.
+OUTPUT - The output file to write to, its extension must match FORMAT. If left None use default path
+         (./MineralPydiaCrawlData.csv, or .parquet/.feather for the columnar formats).
+NUM_PAGES - The number of pages to gather from. If the value is "*" then every listing page is crawled, the number of
+            listing pages is read from the pager of the first one. All other values must be an integer.
+ENGINE - How pages are fetched. "selenium" renders every page in headless Firefox, "http" fetches the page source over
+         plain HTTP and parses it without a browser.
+WORKERS - The number of workers mineral pages are shared between, each with its own browser or connection.
+LISTING_WORKERS - The number of workers listing pages are shared between. Minerals are scraped by the WORKERS as soon
+                  as the listing page they are on has been read.
+RATE_LIMIT - The most page requests per second made across all workers. If left None requests are not limited until
+             the site answers 429 or 503.
+ADAPTIVE - If True the request rate is lowered whenever the site answers 429 or 503, and raised again while it answers
+           quickly.
+RETRIES - The number of times a page that failed to load (a timeout, a dropped connection, a 5xx) is retried.
+DEAD_LETTERS - The file pages that could not be loaded are recorded in, one JSON object per line. If left None it is
+               kept next to OUTPUT.
+CACHE_PATH - The page cache used by the http engine for incremental re-crawls. If left None pages are not cached.
+REFRESH - How cached pages are refreshed. "conditional" asks the server if each page has changed since it was cached
+          and only re-parses pages that have, "full" fetches and re-parses every page.
+SINCE - An ISO timestamp, cached pages checked at or after this time are used without asking the server at all.
+        If left None every page is checked.
+FORMAT - The output format. "csv" writes one row per image with the mineral's data repeated, "parquet" and "feather"
+         write a normalized minerals table and images table next to OUTPUT (these need pyarrow).
+CHECKPOINT - The checkpoint file recording the crawl as it goes. If left None it is kept next to OUTPUT.
+RESUME - If True continue from the checkpoint left by the last run rather than starting from page 1.
+BROWSER_PAGES - The Selenium engine replaces each browser after it has rendered this many pages. If left None browsers
+                are not replaced on page count.
+BROWSER_RSS - The Selenium engine replaces each browser once its own geckodriver and Firefox processes use this many
+              megabytes. If left None browsers are not replaced on memory.
+BROWSER_PREWARM - The number of browsers the Selenium engine keeps started ahead of time, ready to replace one.
+FIREFOX - The path of the Firefox executable. If left None Selenium finds Firefox itself.
+LOG_LEVEL - The lowest level of message written to the log, "DEBUG", "INFO", "WARNING" or "ERROR".
+LOG_FORMAT - "text" for the plain text log, "json" for one JSON object per line.
+METRICS - The JSON report of stage timings and counters written at the end of the crawl. If left None it is kept next
+          to OUTPUT.
+METRICS_PORT - A local port the live metrics are served on in the Prometheus text format while crawling. If left None
+               they are not served.
+SNAPSHOTS - A directory the minerals of every crawl are kept in as a versioned snapshot, with the changeset from the
+            crawl before, see MineralPydiaSnapshot.py. If left None no snapshots are kept. A crawl that could not read
+            some of its listing or mineral pages is not snapshotted, so the minerals on them are not taken as removed.
 """
 OUTPUT = None
 NUM_PAGES = "*"
-RAM_USAGE_CAP = 60.0
+ENGINE = "selenium"
+WORKERS = 1
+LISTING_WORKERS = 1
+RATE_LIMIT = None
+ADAPTIVE = True
+RETRIES = 3
+DEAD_LETTERS = None
+CACHE_PATH = None
+REFRESH = "conditional"
+SINCE = None
+FORMAT = "csv"
+CHECKPOINT = None
+RESUME = False
+BROWSER_PAGES = 250
+BROWSER_RSS = 1024
+BROWSER_PREWARM = 1
+FIREFOX = None
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "text"
+METRICS = None
+METRICS_PORT = None
+SNAPSHOTS = None
+
+# crawl engines
+SELENIUM = "selenium"
+HTTP = "http"
+
+# cache refresh modes
+CONDITIONAL = "conditional"
+FULL = "full"
+
+# user agent sent by the http engine
+USER_AGENT = "Mozilla/5.0 (compatible; MineralPydiaCrawl)"
 
 
 # class MineralPydiaCrawl
@@ -56,14 +131,47 @@ class MineralPydiaCrawl:
     Master class that makes all calls to needed functions.
     """
 
-    # number of pages to crawl
-    _num_page = 0
+    # number of pages to crawl, None until it is found for "*"
+    _num_page = None
 
     # base url for the wiki
     _base_url = "https://www.dakotamatrix.com/mineralpedia"
 
-    # variable that will hold the webdriver object once user input is validated
-    _driver = None
+    # the engine used to fetch pages, either SELENIUM or HTTP
+    _engine = SELENIUM
+
+    # number of workers the mineral pages are shared between
+    _workers = 1
+
+    # number of workers the listing pages are shared between
+    _listing_workers = 1
+
+    # keeps the combined request rate of all workers polite, and retries pages that fail to load
+    _fetcher = Fetcher()
+
+    # per thread state, every worker has its own driver or connection pool
+    _local = threading.local()
+
+    # serializes progress updates and output writes between workers
+    _lock = threading.Lock()
+
+    # writes the log from a background thread
+    _logger = Logger("./MineralPydiaCrawl.log", LOG_LEVEL, LOG_FORMAT)
+
+    # times every stage of the crawl
+    _metrics = Metrics("mineralpydia_crawl")
+
+    # page cache used by the http engine for incremental re-crawls
+    _cache = None
+
+    # browsers used by the selenium engine
+    _browsers = None
+
+    # how cached pages are refreshed, either CONDITIONAL or FULL
+    _refresh = CONDITIONAL
+
+    # cached pages checked at or after this ISO timestamp are not requested again
+    _since = None
 
     # holds all the mineral urls
     _urls = []
@@ -74,7 +182,33 @@ class MineralPydiaCrawl:
     # csv that the output will be written to
     _outfile = "./MineralPydiaCrawlData.csv"
 
-    def __init__(self, num_page, outfile):
+    # True if this crawl writes the output, it is replaced as soon as the crawl starts
+    _writes_output = True
+
+    # format of the output, one of MineralPydiaOutput.FORMATS
+    _format = CSV
+
+    # writer the minerals are streamed to as they are scraped
+    _output = None
+
+    # records the crawl as it goes so that it can be resumed
+    _checkpoint = None
+
+    # called with every mineral as it is written, e.g. to download its images while the crawl carries on
+    _on_mineral = None
+
+    # directory the minerals of the crawl are snapshotted in
+    _snapshots = None
+
+    # number of listing pages and minerals the crawl could not read, a crawl missing any is not snapshotted
+    _incomplete = 0
+
+    def __init__(
+            self, num_page, outfile, engine=SELENIUM, workers=1, rate_limit=None, cache_path=None, refresh=CONDITIONAL,
+            since=None, output_format=CSV, checkpoint=None, resume=False, listing_workers=1, metrics_path=None,
+            metrics_port=None, browser_pages=250, browser_rss=1024, browser_prewarm=1, firefox=None, adaptive=True,
+            retries=3, dead_letters=None, on_mineral=None, snapshots=None
+    ):
         """
         __init__
 
@@ -82,19 +216,94 @@ class MineralPydiaCrawl:
 
         :param num_page: the number of pages to crawl to.
         :param outfile: output path of the resultant data.
+        :param engine: SELENIUM to render pages in Firefox, HTTP to fetch and parse them without a browser.
+        :param workers: the number of workers mineral pages are shared between.
+        :param rate_limit: the most page requests per second across all workers, None for no limit.
+        :param cache_path: the page cache for incremental re-crawls with the http engine, None to not cache pages.
+        :param refresh: CONDITIONAL to only re-parse pages that changed since they were cached, FULL to re-parse all.
+        :param since: an ISO timestamp, cached pages checked at or after it are used without a request.
+        :param output_format: CSV for the flat csv, or PARQUET or FEATHER for normalized columnar tables.
+        :param checkpoint: the checkpoint file, if None it is kept next to the output.
+        :param resume: True to continue from the checkpoint left by the last run.
+        :param listing_workers: the number of workers listing pages are shared between.
+        :param metrics_path: the metrics report, if None it is kept next to the output.
+        :param metrics_port: a local port to serve the live metrics on, None to not serve them.
+        :param browser_pages: the pages each browser renders before it is replaced, None to not replace on pages.
+        :param browser_rss: the megabytes each browser may use before it is replaced, None to not replace on memory.
+        :param browser_prewarm: the number of browsers kept started ahead of time.
+        :param firefox: the path of the Firefox executable, None for Selenium to find it.
+        :param adaptive: True to lower the request rate when the site answers 429 or 503 and raise it while it is
+                         healthy.
+        :param retries: the number of times a page that failed to load is retried.
+        :param dead_letters: the file pages that could not be loaded are recorded in, if None it is kept next to the
+                             output.
+        :param on_mineral: a callable given the name and dictionary of every mineral as it is written to the output,
+                           in output order. It is called holding the crawl's lock, so a callable that blocks holds back
+                           every worker, None to not call anything.
+        :param snapshots: the directory the minerals are snapshotted in once the crawl is finished, None to not keep
+                          snapshots.
         """
 
+        # every crawl starts with its own state
+        self._local = threading.local()
+        self._urls = []
+        self._mineral_dict = dict()
+        self._metrics = Metrics("mineralpydia_crawl")
+
+        # validate the engine before anything else, an unknown engine is a fatal error
+        if engine not in (SELENIUM, HTTP):
+            self._log("Invalid crawl engine " + str(engine) + ", exiting crawl.", -1, ERROR)
+        self._engine = engine
+
+        # a worker count that is not a positive integer is a fatal error
+        if not (str(workers).isdigit() and int(workers) >= 1):
+            self._log("Invalid number of workers " + str(workers) + ", exiting crawl.", -1, ERROR)
+        self._workers = int(workers)
+
+        if not (str(listing_workers).isdigit() and int(listing_workers) >= 1):
+            self._log("Invalid number of listing workers " + str(listing_workers) + ", exiting crawl.", -1, ERROR)
+        self._listing_workers = int(listing_workers)
+
+        # an unknown refresh mode or unreadable timestamp is a fatal error
+        if refresh not in (CONDITIONAL, FULL):
+            self._log("Invalid refresh mode " + str(refresh) + ", exiting crawl.", -1, ERROR)
+        self._refresh = refresh
+
+        if since is not None:
+            try:
+                self._since = datetime.fromisoformat(since).isoformat()
+            except (TypeError, ValueError):
+                self._log("Invalid since timestamp " + str(since) + ", exiting crawl.", -1, ERROR)
+
+        # only the http engine can make conditional requests, so the cache is only used with it
+        if cache_path is not None:
+            if engine == HTTP:
+                self._cache = PageCache(cache_path)
+            else:
+                self._log("The page cache is only used by the http engine, crawling without it.", level=WARNING)
+
+        # an unknown output format is a fatal error
+        if output_format not in FORMATS:
+            self._log("Invalid output format " + str(output_format) + ", exiting crawl.", -1, ERROR)
+        self._format = output_format
+
+        # the default path takes the extension of the format
+        self._outfile = os.path.splitext(self._outfile)[0] + "." + self._format
+
         # sanitize outfile input if it is not left empty
         if not (outfile is None):
 
-            # verifies that the outfile is csv format
+            # verifies that the outfile matches the output format
             # also verifies that the path is a valid one
             try:
-                if not(outfile.strip()[-3:] == "csv"):
+                if not(outfile.strip().endswith("." + self._format)):
                     raise OSError
 
-                with open(outfile, "w") as file:
-                    file.close()
+                # the columnar formats write two tables next to the output path
+                if self._writes_output:
+                    for path in ([outfile] if self._format == CSV else table_paths(outfile)):
+                        with open(path, "w") as file:
+                            file.close()
 
                 self._outfile = outfile
 
@@ -103,34 +312,67 @@ class MineralPydiaCrawl:
                 self._log(
                     "Path name provided for output file was not a valid path."
                     "Using the following default path and file name:\n"
-                    "File name: MineralPydiaData.csv\n"
-                    "Absolute path: " + os.path.abspath(self._outfile)
+                    "File name: " + os.path.basename(self._outfile) + "\n"
+                    "Absolute path: " + os.path.abspath(self._outfile),
+                    level=WARNING
                 )
 
         # attempt to sanitize num pages input
-        # if the input is "*" set to the max number of pages (293 as of 2023/03/17)
+        # if the input is "*" the number of pages is found once the first listing page is read
         if num_page == '*':
-            self._num_page = 293
+            self._num_page = None
 
         # if the input passed is an integer or the string of integer, make sure it is within acceptable parameters
         elif str(type(num_page)) == "<class 'int'>" or re.compile("^[0-9]+$").fullmatch(num_page) is not None:
 
             # if the value is less then one, log the runtime error and EXIT
             if int(num_page) < 1:
-                self._log("Must crawl at least one page.", -1)
-
-            # if the value is greater than the max, log it and DO NOT exit. Use max number of pages instead
-            elif int(num_page) > 293:
-                self._log("Number of pages exceed actual pages, crawling max number of pages.")
-                self._num_page = 293
+                self._log("Must crawl at least one page.", -1, ERROR)
 
             # if the value is within possible values, set class variable as input
+            # a value greater than the number of pages there are is capped once the first listing page is read
             else:
-                self._num_page = num_page
+                self._num_page = int(num_page)
 
         # catch any invalid input, log it, and EXIT
         else:
-            self._log("Invalid value for number of pages, exiting crawl.", -1)
+            self._log("Invalid value for number of pages, exiting crawl.", -1, ERROR)
+
+        # open the checkpoint, picking up where the last run stopped if resuming
+        if checkpoint is None:
+            checkpoint = self._side_path(".checkpoint.jsonl")
+        self._checkpoint = CrawlCheckpoint(checkpoint, resume)
+        self._on_mineral = on_mineral
+        self._snapshots = snapshots
+
+        # every page load is rate limited and retried, pages that fail for good are set aside next to the output
+        if dead_letters is None:
+            dead_letters = self._side_path(".dead_letters.jsonl")
+        transient = ()
+        if self._engine == SELENIUM:
+            from selenium.common.exceptions import TimeoutException, WebDriverException
+            transient = (TimeoutException, WebDriverException)
+        self._fetcher = Fetcher(rate_limit, adaptive, retries, dead_letters, self._metrics, self._log, transient)
+
+        # serve the live metrics if asked for, the report is written next to the output
+        if metrics_port is not None:
+            self._metrics.serve(metrics_port)
+        if metrics_path is None:
+            metrics_path = self._side_path(".metrics.json")
+
+        if resume:
+            self._log(
+                "Resuming crawl from the checkpoint at " + os.path.abspath(checkpoint) + " with "
+                + str(len(self._checkpoint.pages)) + " listing pages and " + str(len(self._checkpoint.minerals))
+                + " minerals already crawled."
+            )
+
+        # browsers are started ahead of time, the first is warming while the crawl is initialized
+        if self._engine == SELENIUM:
+            from MineralPydiaBrowser import BrowserPool, new_driver
+            self._browsers = BrowserPool(
+                lambda: new_driver(firefox), browser_pages, browser_rss, browser_prewarm, self._metrics
+            )
 
         print("Initializing Crawl...")
 
@@ -141,193 +383,667 @@ class MineralPydiaCrawl:
             + os.path.abspath(self._outfile)
         )
 
-        # set up the Firefox profile
-        profile = webdriver.FirefoxProfile()
-        profile.set_preference("dom.disable_open_during_load", False)
+        # open a browser or connection pool for the main thread
+        self._open_session()
 
-        # define the executable location for Firefox (this maybe commented out if it is throwing errors)
-        options = Options()
-        options.binary_location = r'C:\Program Files\Mozilla Firefox\firefox.exe'
+        # initialize the crawl
+        self._crawl()
 
-        # hide Selenium window
-        options.add_argument("--headless")
+        # terminate Selenium window or the connection pool
+        self._close_session()
 
-        # create the webdriver object with given profile and options
-        self._driver = webdriver.Firefox(firefox_profile=profile, options=options)
+        if self._cache is not None:
+            self._cache.close()
 
-        # initialize the crawl
-        self._crawl()
+        if self._browsers is not None:
+            self._browsers.close()
 
-        # terminate Selenium window
-        self._driver.close()
+        self._checkpoint.close()
+
+        # write the metrics of the crawl
+        self._metrics.write(metrics_path)
+        self._metrics.close()
+        self._log("Crawl metrics have been written to the following path: " + os.path.abspath(metrics_path))
 
         # log that the crawl has completed and EXIT
         self._log("The crawl has completed without fatal error", 0)
 
+    # path of a file kept next to the output
+    def _side_path(self, suffix):
+        """
+        _side_path
+
+        :param suffix: the suffix of the file, e.g. ".checkpoint.jsonl".
+        :return: the path of the file, the output path with its extension replaced by the suffix.
+        """
+
+        return os.path.splitext(self._outfile)[0] + suffix
+
+    # the current thread's webdriver
+    @property
+    def _driver(self):
+        return getattr(self._local, "driver", None)
+
+    @_driver.setter
+    def _driver(self, driver):
+        self._local.driver = driver
+
+    # the current thread's connection pool, used by the http engine
+    @property
+    def _http(self):
+        return getattr(self._local, "http", None)
+
+    @_http.setter
+    def _http(self, http):
+        self._local.http = http
+
+    # url of the page the current thread most recently navigated to, used for logging
+    @property
+    def _page_url(self):
+        return getattr(self._local, "page_url", None)
+
+    @_page_url.setter
+    def _page_url(self, page_url):
+        self._local.page_url = page_url
+
+    # opens a browser or connection pool for the current thread
+    def _open_session(self):
+        """
+        _open_session
+
+        Gives the current thread its own webdriver, or its own connection pool for the http engine.
+        """
+
+        if self._engine == HTTP:
+            self._http = HTTPPool(1, metrics=self._metrics)
+        else:
+            self._driver = self._browsers.acquire()
+
+    # closes the current thread's browser or connection pool
+    def _close_session(self):
+        """
+        _close_session
+
+        Gives back the current thread's browser, which is quit, or closes its connection pool.
+        """
+
+        if self._engine == HTTP:
+            self._http.close()
+            self._http = None
+        else:
+            self._browsers.release(self._driver)
+            self._driver = None
+
+    # loads a page in the current thread's browser
+    def _visit(self, url):
+        """
+        _visit
+
+        Loads a page in the current thread's browser, first swapping the browser for a warm one if it has rendered too
+        many pages or is using too much memory.
+
+        :param url: the url of the page.
+        """
+
+        self._driver = self._browsers.recycle(self._driver)
+
+        with self._metrics.time("fetch"):
+            self._driver.get(url)
+        self._page_url = url
+
+    # loads a page in the current thread's browser and waits for it
+    def _load(self, url, selector):
+        """
+        _load
+
+        Loads a page in the current thread's browser and waits until every element matching a selector is present,
+        through the fetcher so a page that times out or crashes the browser is retried.
+
+        :param url: the url of the page.
+        :param selector: the CSS selector of the elements to wait for.
+        """
+
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as ec
+
+        def load():
+            self._visit(url)
+            with self._metrics.time("wait"):
+                WebDriverWait(self._driver, 30).until(ec.presence_of_all_elements_located((By.CSS_SELECTOR, selector)))
+
+        self._fetcher.call(url, load, on_retry=self._replace_browser)
+
+    # replaces a browser that stopped working
+    def _replace_browser(self, error):
+        """
+        _replace_browser
+
+        Swaps the current thread's browser for a fresh one before a retry, unless the page only timed out.
+
+        :param error: the error the page load failed with.
+        """
+
+        from selenium.common.exceptions import TimeoutException, WebDriverException
+
+        if isinstance(error, WebDriverException) and not isinstance(error, TimeoutException):
+            self._browsers.release(self._driver)
+            self._driver = self._browsers.acquire()
+
     # starts the crawl
     def _crawl(self):
         """
         _crawl
 
-        Crawls the 'page' pages of Mineralpedia, collects all mineral urls, makes calls to extract and output data.
+        Crawls the listing pages of Mineralpedia and the mineral pages found on them, and outputs the mineral data.
+
+        The first listing page is read on the calling thread to find how many listing pages there are, then the rest
+        are read by the listing workers while the mineral workers are already scraping the minerals found so far.
+        """
+
+        # open the output so minerals are written as soon as they are scraped
+        try:
+            self._output = open_output(self._outfile, self._format)
+        except ImportError as ie:
+            self._log(str(ie) + ", exiting crawl.", -1, ERROR)
+
+        # find the number of listing pages, and the minerals on the first one
+        # if the first page cannot be read the rest are still crawled, until one without minerals
+        try:
+            first = self._count_pages()
+        except FetchFailed as ff:
+            self._log("The first listing page could not be read: " + str(ff), level=ERROR)
+            self._metrics.count("errors")
+            first = None
+
+        # list the remaining pages and scrape the minerals found on them at the same time
+        self._crawl_pipeline(first)
+
+        # finishes the csv
+        self._fill_csv()
+
+        # keep the minerals of this crawl and what changed since the last one
+        self._snapshot()
+
+    # finds the number of listing pages
+    def _count_pages(self):
         """
+        _count_pages
 
-        # iterate over the number of pages, this can be down with range due to the format of the page url(s)
-        for i in range(1, self._num_page + 1):
+        Reads the first listing page and finds the number of listing pages from its pager. If more pages were asked
+        for than there are only the pages there are are crawled, and if the page has no pager the listing pages are
+        crawled until one without any minerals.
 
-            # progress bar to make us feel better
-            os.system("cls")
-            size = round(50 * (i / self._num_page))
-            print(
-                "Accessing page " + str(i) + " out of " + str(self._num_page)
-                + "\n\nProgress:\t| " + '█' * size + ' ' * (50 - size) + " |"
+        :return: the mineral urls on the first listing page.
+        """
+
+        # the count was found by the last run
+        pages = self._checkpoint.page_count
+
+        if pages is None or 1 not in self._checkpoint.pages:
+            urls, found = self._list_page(1, count=True)
+            if found is not None and found != pages:
+                self._checkpoint.count(found)
+            pages = self._checkpoint.page_count
+        else:
+            urls = self._checkpoint.pages[1]
+
+        # without a pager the listing pages are crawled until one without minerals, or as many as asked for
+        if pages is None:
+            self._log(
+                "Could not find the number of listing pages, listing pages will be crawled until one without minerals.",
+                level=WARNING
             )
+            return urls
+
+        # "*" crawls every listing page there is
+        if self._num_page is None:
+            self._num_page = pages
+
+        # if the value is greater than the number of pages, log it and DO NOT exit. Use max number of pages instead
+        elif self._num_page > pages:
+            self._log("Number of pages exceed actual pages, crawling max number of pages.", level=WARNING)
+            self._num_page = pages
+
+        self._log("Crawler found " + str(pages) + " listing pages, crawling " + str(self._num_page) + " of them.")
+
+        return urls
+
+    # gets the mineral urls on a listing page
+    def _list_page(self, i, count=False):
+        """
+        _list_page
+
+        Gets the mineral urls on the ith listing page with the current thread's browser or connection pool, and records
+        the page in the checkpoint.
 
-            # get the ith page
-            page_url = self._base_url + "?page=" + str(i)
+        :param i: the listing page number.
+        :param count: True to also find the number of listing pages from the page's pager.
+        :return: a tuple of the mineral urls in page order and the number of listing pages, which is None if it was not
+                 asked for, the page has no pager, or the page was read from the checkpoint.
+        """
+
+        # the page was collected by the last run, the checkpoint does not have its pager though
+        if i in self._checkpoint.pages and not count:
+            self._log("Crawler resumes page #" + str(i) + " from the checkpoint")
+            return self._checkpoint.pages[i], None
 
-            # proceed to ith page, and log it
-            self._driver.get(page_url)
+        # get the ith page
+        page_url = self._base_url + "?page=" + str(i)
+        pages = None
+
+        # fetch and parse the ith page, and log it
+        if self._engine == HTTP:
+            html, cached = self._fetch(page_url)
             self._log("Crawler proceeds to page #" + str(i))
 
-            # wait until all anchor tags associated with minerals have loaded
-            WebDriverWait(self._driver, 30).until(
-                ec.presence_of_all_elements_located((By.CSS_SELECTOR, "div.block-title h2 a"))
-            )
+            # the page has not changed since it was cached, reuse its urls
+            # pages cached before the page count was stored only have their urls
+            if html is None:
+                record = cached["record"] or []
+                urls, pages = (record["urls"], record["pages"]) if isinstance(record, dict) else (record, None)
+                self._metrics.count("cache_hits")
 
-            # cast generator to list to avoid potential stale elements
-            urls = list(self._driver.find_elements(By.CSS_SELECTOR, "div.block-title h2 a"))
+            else:
+                with self._metrics.time("parse"):
+                    urls = parse_listing(html, page_url)
+                    pages = parse_page_count(html, page_url)
+                self._store(page_url, cached, {"urls": urls, "pages": pages})
+
+        else:
+            # proceed to ith page, wait until all anchor tags associated with minerals have loaded, and log it
+            self._load(page_url, "div.block-title h2 a")
+            self._log("Crawler proceeds to page #" + str(i))
 
-            # append the urls to class list
-            self._urls += [u.get_attribute("href") for u in urls]
+            # read every href in one round trip rather than one per anchor
+            with self._metrics.time("extract"):
+                urls = self._driver.execute_script(
+                    "return Array.prototype.map.call(document.querySelectorAll('div.block-title h2 a'), "
+                    "function (a) { return a.getAttribute('href') === null ? null : a.href; });"
+                )
 
-        # gets the mineral info for each url collected
-        index = 1
-        for url in self._urls:
+                # reading the pager needs the whole page source, so only do it when asked
+                if count:
+                    pages = parse_page_count(self._driver.page_source, page_url)
 
-            # if ram usage exceeds cap:
-            # * kill all firefox processes
-            # * kill all geckodriver processes
-            # * reinitialize the driver
-            # this will free memory being used by Selenium allowing, trading off a little time
-            ram_used = psutil.virtual_memory()[2]
-            if ram_used >= RAM_USAGE_CAP:
-                os.system("tskill firefox")
-                os.system("tskill geckodriver")
+        # record the page
+        self._checkpoint.page(i, urls)
+        self._metrics.count("listing_pages")
 
-                # set up the Firefox profile
-                profile = webdriver.FirefoxProfile()
-                profile.set_preference("dom.disable_open_during_load", False)
+        return urls, pages if count else None
 
-                # define the executable location for Firefox (this maybe commented out if it is throwing errors)
-                options = Options()
-                options.binary_location = r'C:\Program Files\Mozilla Firefox\firefox.exe'
+    # lists the pages and crawls the mineral pages at the same time
+    def _crawl_pipeline(self, first):
+        """
+        _crawl_pipeline
 
-                # hide Selenium window
-                options.add_argument("--headless")
+        Lists the remaining listing pages with LISTING_WORKERS workers, the calling thread being the first of them,
+        while WORKERS mineral workers scrape the mineral urls put on a shared queue as each listing page is read.
 
-                # create the webdriver object with given profile and options
-                self._driver = webdriver.Firefox(firefox_profile=profile, options=options)
+        Finished minerals are added to the class dictionary and written to the output in the order the urls are listed
+        on the site, as soon as every mineral before them is finished, so the output does not depend on which worker
+        finished first. A worker that fails is logged and stops, the other workers carry on and keep their results.
 
-            self._fill_dict(url)
+        :param first: the mineral urls on the first listing page, None if it could not be read.
+        """
 
-            # progress bar to make us feel better
-            os.system('cls')
-            size = round(50 * (index / len(self._urls)))
-            print(
-                "Accessing mineral " + str(index) + " out of " + str(len(self._urls))
-                + "\n\nProgress:\t| " + '█' * size + ' ' * (50 - size) + " |"
+        # mineral urls waiting for a mineral worker, as (page, position on the page, url), None tells a worker to stop
+        work = queue.Queue()
+
+        # mineral urls of every listing page read so far, a page that could not be read has none
+        listed = dict()
+
+        # minerals finished out of order, keyed on the page and position of their url, waiting for the ones before them
+        pending = dict()
+
+        # the next listing page to read, and the last one there is, unknown if the site has no pager
+        # the page and position of the next url to be written
+        # lists so the workers can update them
+        next_page = [2]
+        last_page = [self._num_page if self._num_page is not None else float("inf")]
+        position = [1, 0]
+
+        # minerals finished by every worker, drawn from a background thread
+        progress = Progress("Crawling", unit="minerals", metrics=self._metrics)
+
+        # urls that were never crawled because a worker failed
+        missed = []
+
+        # urls of mineral pages that could not be loaded, they are in the dead-letter file
+        failed = []
+
+        def emit():
+            # write every finished mineral that is next in url order, must be called holding the lock
+            while position[0] <= last_page[0] and position[0] in listed:
+                if position[1] >= len(listed[position[0]]):
+                    position[0] += 1
+                    position[1] = 0
+                    continue
+
+                if tuple(position) not in pending:
+                    return
+
+                name, mineral_info = pending.pop(tuple(position))
+                if mineral_info is not None:
+                    self._mineral_dict[name] = mineral_info
+                    with self._metrics.time("write"):
+                        self._output.write(name, mineral_info)
+                    if self._on_mineral is not None:
+                        with self._metrics.time("hand_off"):
+                            self._on_mineral(name, mineral_info)
+                position[1] += 1
+
+        # listing pages that could not be read
+        missed_pages = []
+
+        def found(i, urls):
+            # hand the urls of a listing page to the mineral workers, must be called holding the lock
+            if i > last_page[0]:
+                return
+
+            # without a pager the first page without minerals is past the end
+            if not urls and last_page[0] == float("inf") and i not in missed_pages:
+                last_page[0] = i - 1
+
+            listed[i] = urls
+            for p, url in enumerate(urls):
+                work.put((i, p, url))
+            emit()
+
+            progress.set_total(sum(len(urls) for urls in listed.values()))
+            progress.set_note(
+                "found on " + str(len(listed)) + " of "
+                + (str(last_page[0]) if last_page[0] != float("inf") else "?") + " listing pages"
             )
 
-            index += 1
+        def list_pages(n):
+            if n > 0:
+                try:
+                    self._open_session()
+                except Exception as e:
+                    self._log("Listing worker #" + str(n) + " could not start: " + repr(e), level=ERROR)
+                    return
 
-        # fills the csv with all mineral data
-        self._fill_csv()
+            try:
+                while True:
+                    with self._lock:
+                        i = next_page[0]
+                        if i > last_page[0]:
+                            return
+                        next_page[0] += 1
+
+                    try:
+                        urls, _ = self._list_page(i)
+
+                    # a page that could not be loaded is set aside, the worker carries on with the next one
+                    except FetchFailed as ff:
+                        self._log("Listing page #" + str(i) + " could not be read: " + str(ff), level=ERROR)
+                        self._metrics.count("errors")
+                        with self._lock:
+                            missed_pages.append(i)
+                            found(i, [])
+                        continue
+
+                    except Exception as e:
+                        self._log("Listing worker #" + str(n) + " failed on page #" + str(i) + ": " + repr(e), level=ERROR)
+                        self._metrics.count("errors")
+                        with self._lock:
+                            missed_pages.append(i)
+                            found(i, [])
+                        return
+
+                    with self._lock:
+                        found(i, urls)
+            finally:
+                if n > 0:
+                    try:
+                        self._close_session()
+                    except Exception:
+                        pass
+
+        def scrape(n):
+            try:
+                self._open_session()
+            except Exception as e:
+                self._log("Crawl worker #" + str(n) + " could not start: " + repr(e), level=ERROR)
+                return
+
+            try:
+                while True:
+                    item = work.get()
+                    if item is None:
+                        return
+
+                    i, p, url = item
+
+                    try:
+                        mineral_info = self._fill_dict(url)
+
+                    # a page that could not be loaded is set aside, the worker carries on with the next one
+                    except FetchFailed as ff:
+                        self._log("Mineral page " + url + " could not be read: " + str(ff), level=ERROR)
+                        self._metrics.count("errors")
+                        with self._lock:
+                            failed.append(url)
+                        mineral_info = None
+
+                    except Exception as e:
+                        self._log("Crawl worker #" + str(n) + " failed on " + url + ": " + repr(e), level=ERROR)
+                        self._metrics.count("errors")
+                        with self._lock:
+                            missed.append(item)
+                        return
+
+                    with self._lock:
+                        pending[(i, p)] = (url.split("/")[-1], mineral_info)
+                        emit()
+
+                    # progress bar to make us feel better
+                    progress.advance(failed=mineral_info is None)
+            finally:
+                try:
+                    self._close_session()
+                except Exception:
+                    pass
+
+        # the minerals on the first page can be scraped straight away
+        progress.start()
+        with self._lock:
+            if first is None:
+                missed_pages.append(1)
+            found(1, first or [])
+
+        scrapers = [
+            threading.Thread(target=scrape, args=(n,), name="crawl-worker-" + str(n)) for n in range(self._workers)
+        ]
+        listers = [
+            threading.Thread(target=list_pages, args=(n,), name="listing-worker-" + str(n))
+            for n in range(1, self._listing_workers)
+        ]
+        for thread in scrapers + listers:
+            thread.start()
+
+        # the calling thread lists pages too, with the browser or connection pool it already has
+        list_pages(0)
+        for thread in listers:
+            thread.join()
+
+        # every url has been found, let the mineral workers finish the queue and stop
+        for _ in scrapers:
+            work.put(None)
+        for thread in scrapers:
+            thread.join()
+        progress.close()
+
+        # urls left on the queue were never reached because every mineral worker failed
+        while not work.empty():
+            item = work.get()
+            if item is not None:
+                missed.append(item)
+
+        # urls whose worker failed leave gaps, skip over them to write everything after
+        with self._lock:
+            for i, p, _ in missed:
+                pending[(i, p)] = (None, None)
+            emit()
+
+        # every url found, in the order they are listed on the site
+        self._urls = [url for i in sorted(listed) if i <= last_page[0] for url in listed[i]]
+        self._incomplete = len(missed_pages) + len(missed) + len(failed)
+
+        # log any pages that could not be read and any urls that were never reached because their worker failed
+        if missed_pages:
+            self._log(
+                str(len(missed_pages)) + " listing pages could not be read: "
+                + ", ".join(str(i) for i in sorted(missed_pages)),
+                level=ERROR
+            )
+        if missed:
+            self._log(
+                str(len(missed)) + " mineral pages were not crawled because their worker failed:\n"
+                + "\n".join(url for _, _, url in sorted(missed)),
+                level=ERROR
+            )
+        if failed:
+            self._log(
+                str(len(failed)) + " mineral pages could not be read, they are listed in: "
+                + os.path.abspath(self._fetcher.dead_letters.path),
+                level=ERROR
+            )
 
     # fills class dictionary
     def _fill_dict(self, url):
         """
         _fill_dict
 
-        Gets the mineral data from each inputted url.
+        Gets the mineral data from each inputted url, and records it in the checkpoint. Minerals already in the
+        checkpoint are not crawled again. The caller adds the mineral to the class dictionary, in listing order.
+
+        :param url: mineral url to collect data from
+        :return: the dictionary of mineral data, or None if the mineral was skipped
+        """
+
+        # get the name of mineral
+        name = url.split("/")[-1]
+
+        # the mineral was crawled by the last run
+        if url in self._checkpoint.minerals:
+            self._log("Crawler resumes the following mineral from the checkpoint: " + name)
+            mineral_info = self._checkpoint.minerals[url]
+
+        else:
+            mineral_info = self._scrape(url, name)
+            self._checkpoint.mineral(url, name, mineral_info)
+
+        return mineral_info
+
+    # scrapes a mineral page
+    def _scrape(self, url, name):
+        """
+        _scrape
+
+        Scrapes the mineral data from a mineral page.
 
         :param url: mineral url to collect data from
+        :param name: the name of the mineral
+        :return: the dictionary of mineral data, or None if the page is missing required information
         """
 
         # create a dictionary to hold all data for one mineral
         mineral_info = dict()
 
-        # proceed to the url
-        self._driver.get(url)
+        # validators of the page for the cache, only set by the http engine
+        cached = None
 
-        # wait until all images have loaded
-        WebDriverWait(self._driver, 30).until(
-            ec.presence_of_all_elements_located((By.CSS_SELECTOR, "img.ism"))
-        )
+        # fetch and parse the page
+        if self._engine == HTTP:
+            html, cached = self._fetch(url)
 
-        # get the name of mineral, and log it
-        name = url.split("/")[-1]
+            # the page has not changed since it was cached, reuse its record rather than parsing it again
+            if html is None:
+                self._log("Crawler is reusing the cached entry page for the following mineral: " + name)
+
+                if cached["record"] is None:
+                    self._log(
+                        "The crawler encountered a page missing required information for the following mineral: "
+                        + name
+                    )
+
+                self._metrics.count("cache_hits")
+                return cached["record"]
+
+            with self._metrics.time("parse"):
+                page = MineralPage(html, url)
+
+        else:
+            # proceed to the url and wait until all images have loaded
+            self._load(url, "img.ism")
+
+            # everything the field lookups need is read from the browser in one round trip
+            with self._metrics.time("parse"):
+                page = _DriverPage(self._driver)
+
+        # log the name of the mineral
         self._log("Crawler is accessing entry page for the following mineral: " + name)
 
+        # the field lookups are timed together
+        start = time.perf_counter()
+
         # this data is essential, so if one of these elements is not present we want to skip over it
         try:
 
             # gets the habit of the mineral
             # https://en.wikipedia.org/wiki/Crystal_habit
-            habit = self._driver.find_element_by_xpath("//dt[contains(text(), 'Crystal Habit')]/following-sibling::dd")\
-                .get_attribute("innerText")
+            habit = page.field("Crystal Habit")
 
             # gets the color descriptor of the mineral
-            color = self._driver.find_element_by_xpath("//dt[contains(text(), 'Color')]/following-sibling::dd")\
-                .get_attribute("innerText")
+            color = page.field("Color")
 
             # gets the streak descriptor of the mineral
             # the streak is the color of a crushed minerals powder
-            streak = self._driver.find_element_by_xpath("//dt[contains(text(), 'Streak')]/following-sibling::dd")\
-                .get_attribute("innerText")
+            streak = page.field("Streak")
 
             # gets the class of mineral that it belongs to
             # https://en.wikipedia.org/wiki/Crystal_system
-            class_type = self._driver\
-                .find_element_by_xpath("//dt[contains(text(), 'Crystal System')]/following-sibling::dd")\
-                .get_attribute("innerText")
+            class_type = page.field("Crystal System")
 
             # gets the hardness of mineral
             # https://en.wikipedia.org/wiki/Hardness
-            hardness = self._driver\
-                .find_element_by_xpath("//dt[contains(text(), 'Hardness')]/following-sibling::dd/span")\
-                .get_attribute("innerText")
+            hardness = page.field_span("Hardness")
 
             pattern = re.compile("^[0-9]+(\\.[0-9]+)*(-[0-9]+(\\.[0-9]+)*)*$")
             if re.fullmatch(pattern, hardness.replace("\xa0", "")) is None:
-                raise NoSuchElementException
+                raise MissingFieldError("Hardness")
 
         # if one to elements are not present return to go to the next url, log that the mineral had insufficient data
-        except NoSuchElementException:
-            self._log("The crawler encountered a page missing required information for the following mineral: " + name)
-            return
+        except MissingFieldError:
+            self._log(
+                "The crawler encountered a page missing required information for the following mineral: " + name,
+                level=WARNING, mineral=name
+            )
+            self._metrics.observe("extract", time.perf_counter() - start)
+            self._metrics.count("skipped")
+            self._store(url, cached, None)
+            return None
 
         # this value was decided to be non-essential, but still wanted it to be included
         try:
 
             # gets the fracture descriptor of the mineral
             # https://en.wikipedia.org/wiki/Fracture_(mineralogy)
-            fracture = self._driver.find_element_by_xpath("//dt[text()='Fracture']/following-sibling::dd")\
-                .get_attribute("innerText")
+            fracture = page.exact_field("Fracture")
 
         # if this element is not present, log it, and set it to None
-        except NoSuchElementException:
+        except MissingFieldError:
             self._log(
                 "The crawler encountered a page missing a fracture descriptor for the following mineral: " + name
                 + "\nThe crawler will still include this entry, this log message is for debugging purposes."
             )
             fracture = None
 
-        # gets all the images present on a mineral page
-        images = self._driver.find_elements_by_css_selector("a.catalog-thumb")
-
-        # list comprehension to create a list of image uris
-        img_urls = [image.get_attribute("href") for image in images]
+        # gets the uris of all the images present on a mineral page
+        img_urls = page.thumbnails()
+        self._metrics.observe("extract", time.perf_counter() - start)
 
         # insert all data into necessary
         # need to strip \xa0, which is equivalent to &nbsp;
@@ -345,95 +1061,153 @@ class MineralPydiaCrawl:
 
         # trick to get around some issues with extracting string from generator
         # hardness sometimes is given as a range of value i.e. 2-2.5
-        # we will use the median value of range
-        mineral_info["hardness"] = hardness.replace("\xa0", "")
-        mineral_info["hardness"] = np.mean([float(h) for h in mineral_info["hardness"].replace("\xa0", "").split("-")])
+        # the text is kept as the page gives it, and we will use the median value of range as the hardness
+        mineral_info["hardness_text"] = hardness.replace("\xa0", "")
+        hardness = [float(h) for h in mineral_info["hardness_text"].split("-")]
+        mineral_info["hardness"] = sum(hardness) / len(hardness)
 
-        # add the dictionary to the classes master dictionary keyed on the mineral's name
-        self._mineral_dict[name] = mineral_info
+        # store the dictionary in the cache
+        self._store(url, cached, mineral_info)
+        self._metrics.count("minerals")
 
         # log that the page has been scraped, include the name and total number of image uris gathered
         self._log(
             "Crawler has collected data for the following mineral\nName: " + name + "\nNumber of Image URIs: "
-            + str(len(mineral_info["images"]))
+            + str(len(mineral_info["images"])),
+            mineral=name, images=len(mineral_info["images"])
         )
 
+        return mineral_info
+
     # output data to csv
     def _fill_csv(self):
         """
         _fill_csv
 
-        Fills the output target with the data collected,
+        Finishes the output target. Every mineral has already been handed to the output as it was scraped, so this only
+        forces the last of the rows to disk and closes the file, or writes the tables for the columnar formats.
+        """
+
+        self._output.close()
+
+        # log that the data has been successfully dumped to a csv
+        self._log(
+            "Resultant data has been successfully written to the following path: " + os.path.abspath(self._outfile)
+        )
+
+    # snapshots the crawled minerals
+    def _snapshot(self):
         """
+        _snapshot
 
-        # holds the names of minerals
-        names = []
+        Stores the crawled minerals as a new snapshot and writes the changeset from the snapshot before it, if snapshots
+        are kept.
+        """
 
-        # holds the habits of minerals
-        habits = []
+        if self._snapshots is None:
+            return
+
+        # minerals on pages that could not be read would look removed, and their images be dropped downstream
+        if self._incomplete:
+            self._log(
+                "The crawl missed " + str(self._incomplete) + " listing or mineral pages, it is not snapshotted so "
+                "the minerals on them are not recorded as removed.",
+                level=WARNING
+            )
+            return
 
-        # holds the colors of minerals
-        colors = []
+        from MineralPydiaSnapshot import record, read_changeset, summary
 
-        # holds the streaks of minerals
-        streaks = []
+        # the snapshot holds what was written, the csv does not keep hardness_text
+        minerals = self._mineral_dict
+        if self._format == CSV:
+            minerals = dict((name, dict(info, hardness_text=None)) for name, info in minerals.items())
 
-        # holds the classes/systems of minerals
-        classes = []
+        with self._metrics.time("snapshot"):
+            version, changeset = record(self._snapshots, minerals, self._outfile)
 
-        # holds the fracture of minerals
-        fractures = []
+        if changeset is None:
+            self._log("The crawl is snapshot " + version + ", there is no earlier snapshot or nothing has changed.")
+        else:
+            self._log(
+                "The crawl is snapshot " + version + ", " + summary(read_changeset(changeset))
+                + ". The changeset is at the following path: " + os.path.abspath(changeset)
+            )
 
-        # holds the hardness of minerals
-        hardnesses = []
+    # fetches a page for the http engine
+    def _fetch(self, url):
+        """
+        _fetch
 
-        # holds the image uris
-        images = []
+        Fetches the source of a page over plain HTTP.
 
-        # holds the actual filename of the image uris
-        filenames = []
+        If the page is cached the request is made conditional on the cached ETag and Last-Modified, and if the page was
+        checked at or after the since timestamp no request is made at all.
 
-        # looping over each mineral in the dictionary
-        for mineral in self._mineral_dict:
+        :param url: the url of the page.
+        :return: a tuple of the decoded page source and the page's cache entry. The page source is None when the record
+                 in the cache entry is still good, otherwise the cache entry holds the validators to store the parsed
+                 record under.
+        """
 
-            # we want to loop over each image uri and duplicate its information
-            for url in self._mineral_dict[mineral]["images"]:
-                names.append(mineral)
-                habits.append(self._mineral_dict[mineral]["habit"])
-                colors.append(self._mineral_dict[mineral]["color"])
-                streaks.append(self._mineral_dict[mineral]["streak"])
-                classes.append(self._mineral_dict[mineral]["class"])
-                fractures.append(self._mineral_dict[mineral]["fracture"])
-                hardnesses.append(self._mineral_dict[mineral]["hardness"])
-                images.append(url)
-                filenames.append(url.split("/")[-1])
+        headers = {"User-Agent": USER_AGENT}
 
-        # sets up a dictionary object to dumped to csv
-        dump = {
-            "name": names,
-            "habit": habits,
-            "color": colors,
-            "streak": streaks,
-            "class": classes,
-            "fracture": fractures,
-            "hardness": hardnesses,
-            "image_uri": images,
-            "image_name": filenames
+        # make the request conditional on what is in the cache
+        entry = self._cache.get(url) if self._cache is not None else None
+        if entry is not None and self._refresh == CONDITIONAL:
+            self._page_url = url
+
+            if self._since is not None and entry["fetched"] >= self._since:
+                return None, entry
+
+            if entry["etag"] is not None:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"] is not None:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        def fetch():
+            with self._metrics.time("fetch"):
+                with self._http.request(url, headers) as response:
+                    return response, response.read()
+
+        # rate limited, and retried if the request fails
+        response, body = self._fetcher.call(url, fetch)
+        charset = response.headers.get_content_charset() or "utf-8"
+
+        self._page_url = url
+        self._metrics.count("bytes", len(body))
+
+        # the page has not changed since it was cached
+        if response.status == 304 and entry is not None:
+            self._cache.touch(url)
+            self._metrics.count("not_modified")
+            return None, entry
+
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "record": None
         }
 
-        # casts the dictionary to a Panda's DataFrame
-        df = pd.DataFrame.from_dict(dump)
+        return body.decode(charset, errors="replace"), validators
 
-        # outputs Panda's DataFrame to a csv
-        df.to_csv(self._outfile, index=False)
+    # stores a parsed page in the cache
+    def _store(self, url, validators, record):
+        """
+        _store
 
-        # log that the data has been successfully dumped to a csv
-        self._log(
-            "Resultant data has been successfully written to the following path: " + os.path.abspath(self._outfile)
-        )
+        Stores the record parsed from a page in the cache, if the crawl is using one.
+
+        :param url: the url of the page.
+        :param validators: the cache entry returned by _fetch, None if the page was not fetched by the http engine.
+        :param record: the record parsed from the page, None if the page had nothing usable.
+        """
+
+        if self._cache is not None and validators is not None:
+            self._cache.put(url, validators["etag"], validators["last_modified"], record)
 
     # logging function
-    def _log(self, log_string, exit_code=None):
+    def _log(self, log_string, exit_code=None, level=INFO, **fields):
         """
         _log
 
@@ -441,33 +1215,108 @@ class MineralPydiaCrawl:
 
         :param log_string: the string to be dumped to log file
         :param exit_code: allows us to log an exit code and exit with that code, logs both errors and successes
+        :param level: the level of the message
+        :param fields: extra fields written with the message when logging JSON
         """
 
-        # append to the log
-        with open("./MineralPydiaCrawl.log", 'a') as file:
+        # the url of the page this thread last navigated to is tracked locally, so it costs nothing to include
+        self._logger.log(log_string, level, self._page_url, **fields)
 
-            # if the driver has not been initialized yet, we do not want to include a url
-            if self._driver is None:
-                file.write(
-                    "[" + datetime.now().isoformat() + "]> "
-                    + log_string.strip().replace("\n", "\n\t") + "\n"
-                )
-            # if the driver has been initialized we can get the current url for more accurate logging
-            elif exit_code is None:
-                file.write(
-                    "[" + datetime.now().isoformat() + " @ " + self._driver.current_url + "]> "
-                    + log_string.strip().replace("\n", "\n\t") + "\n"
-                )
+        # if an exit code is provided we can log that exit code and exit using that code
+        if exit_code is not None:
+            self._logger.log("The program exited with exit code: " + str(exit_code), ERROR if exit_code else INFO)
+            self._logger.close()
+            exit(exit_code)
 
-            # if an exit code is provided we can log that exit code and exit using that code
-            if exit_code is not None:
-                file.write(
-                    "[" + datetime.now().isoformat() + "]> The program exited with exit code: " + str(exit_code) + "\n"
-                )
-                file.close()
-                exit(exit_code)
 
-            file.close()
+# class _DriverPage
+class _DriverPage:
+    """
+    _DriverPage
+
+    Answers the mineral page queries made by _fill_dict through a Selenium driver, mirroring MineralPage.
+
+    Every dt's text and following dd siblings, the innerText of every dd and of its first span, and the href of every
+    "a.catalog-thumb" are read in a single execute_script call, rather than one round trip to the browser per field
+    and per thumbnail. The queries are then answered the way the XPath lookups they replace would.
+    """
+
+    # collects everything the queries need in one round trip
+    _SCRIPT = """
+        var dds = Array.prototype.slice.call(document.getElementsByTagName("dd"));
+        var dts = Array.prototype.map.call(document.getElementsByTagName("dt"), function (dt) {
+            var texts = [];
+            for (var node = dt.firstChild; node; node = node.nextSibling) {
+                if (node.nodeType === Node.TEXT_NODE || node.nodeType === Node.CDATA_SECTION_NODE) {
+                    texts.push(node.nodeValue);
+                }
+            }
+            var following = [];
+            for (var sibling = dt.nextElementSibling; sibling; sibling = sibling.nextElementSibling) {
+                if (sibling.tagName === "DD") {
+                    following.push(dds.indexOf(sibling));
+                }
+            }
+            return [texts, following];
+        });
+        return {
+            "dts": dts,
+            "dds": dds.map(function (dd) {
+                var spans = Array.prototype.filter.call(dd.children, function (c) { return c.tagName === "SPAN"; });
+                return [dd.innerText, spans.length ? spans[0].innerText : null];
+            }),
+            "thumbnails": Array.prototype.map.call(document.querySelectorAll("a.catalog-thumb"), function (a) {
+                return a.getAttribute("href") === null ? null : a.href;
+            })
+        };
+    """
+
+    def __init__(self, driver):
+        """
+        __init__
+
+        :param driver: the webdriver currently on a mineral page.
+        """
+
+        page = driver.execute_script(self._SCRIPT)
+
+        # each dt as its text nodes and the positions of its following dd siblings in dds
+        self._dts = page["dts"]
+
+        # each dd as its innerText and the innerText of its first span, None if it has none
+        self._dds = page["dds"]
+
+        self._thumbnails = page["thumbnails"]
+
+    def field(self, label):
+        # //dt[contains(text(), label)]/following-sibling::dd
+        for texts, following in self._dts:
+            if texts and label in texts[0] and following:
+                return self._dds[following[0]][0]
+
+        raise MissingFieldError(label)
+
+    def field_span(self, label):
+        # //dt[contains(text(), label)]/following-sibling::dd/span
+        for texts, following in self._dts:
+            if texts and label in texts[0]:
+                for i in following:
+                    if self._dds[i][1] is not None:
+                        return self._dds[i][1]
+
+        raise MissingFieldError(label)
+
+    def exact_field(self, label):
+        # //dt[text()=label]/following-sibling::dd
+        for texts, following in self._dts:
+            if label in texts and following:
+                return self._dds[following[0]][0]
+
+        raise MissingFieldError(label)
+
+    def thumbnails(self):
+        # the href of every "a.catalog-thumb"
+        return list(self._thumbnails)
 
 
 def main():
@@ -476,7 +1325,11 @@ def main():
 
     Initializes the crawl with given environment variables.
     """
-    MineralPydiaCrawl(NUM_PAGES, OUTPUT)
+    MineralPydiaCrawl(
+        NUM_PAGES, OUTPUT, ENGINE, WORKERS, RATE_LIMIT, CACHE_PATH, REFRESH, SINCE, FORMAT, CHECKPOINT, RESUME,
+        LISTING_WORKERS, METRICS, METRICS_PORT, BROWSER_PAGES, BROWSER_RSS, BROWSER_PREWARM, FIREFOX, ADAPTIVE, RETRIES,
+        DEAD_LETTERS, None, SNAPSHOTS
+    )
 
 
 if __name__ == "__main__":
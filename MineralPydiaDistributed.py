@@ -0,0 +1,501 @@
+"""
+MineralPydiaDistributed.py
+
+Distributed mode of MineralPydiaCrawl.py, spreading the mineral pages and image downloads of one crawl over any number
+of processes on any number of machines through a shared MineralPydiaQueue.WorkQueue.
+
+One coordinator reads the listing pages and seeds every mineral url into the queue. Every node, the coordinator
+included, then claims mineral urls with a lease, scrapes them with its own WORKERS workers, and seeds the image uris of
+each mineral it scraped; once there are no minerals left to claim the nodes claim and download images the same way.
+Leases are renewed while a node is alive, so the work of a node that dies or is cut off is claimed again by another
+node once its leases run out, and a node that comes back after losing a lease has its result dropped. Every url is
+stored in the queue once, and every item has exactly one accepted result.
+
+Once every item is finished the coordinator merges the results into one crawl output, in the order the minerals are
+listed on the site, and records every mineral an image belongs to in the content store. The queue, and the image dump
+when images are downloaded, must be on storage every node can reach.
+
+Each node is started with this program, ROLE set to "coordinator" on one and "worker" on the rest.
+"""
+
+# crawl
+from MineralPydiaCrawl import MineralPydiaCrawl, SELENIUM
+from MineralPydiaFetch import Fetcher, FetchFailed
+from MineralPydiaOutput import open_output
+from MineralPydiaQueue import WorkQueue, MINERAL, IMAGE, QUEUED, LEASED, DONE, FAILED
+
+# images
+from MineralPydiaImageWrangle import download_image
+from MineralPydiaStore import ImageStore
+from MineralPydiaHTTP import HTTPPool
+
+# workers
+import threading
+import socket
+
+# logging
+from MineralPydiaLog import WARNING, ERROR
+import time
+import os
+
+
+"""
+ENVIRONMENT VARIABLES
+
+ROLE - "coordinator" to seed the queue, work it and merge the results, "worker" to only work it.
+QUEUE_PATH - the shared work queue.
+WORKER_ID - the name this node claims work under. If left None the host name and process id are used.
+LEASE - the number of seconds claimed work is held for before other nodes may claim it, renewed while the node lives.
+POLL - the number of seconds a node waits before asking again when there is no work to claim.
+MAX_ATTEMPTS - the number of times an item is claimed before it is given up on.
+NUM_PAGES - the number of listing pages to crawl, "*" for all of them. Only read by the coordinator.
+OUTPUT - the merged crawl output. Only written by the coordinator, if left None the crawler's default path is used.
+         Every node keeps its checkpoint, metrics and dead letters next to it, a worker's named with its WORKER_ID,
+         e.g. MineralPydiaCrawlData.host-1234.metrics.json, so nodes on shared storage do not overwrite each other's.
+ENGINE - "selenium" to render pages in Firefox, "http" to fetch and parse them without a browser.
+WORKERS - the number of workers on this node.
+RATE_LIMIT - the most page requests per second made by this node. If left None requests are not limited until the
+             site answers 429 or 503.
+IMG_DUMP_PATH - the content store images are downloaded to. If left None images are not downloaded.
+"""
+ROLE = "worker"
+QUEUE_PATH = "./MineralPydiaQueue.sqlite"
+WORKER_ID = None
+LEASE = 60
+POLL = 2
+MAX_ATTEMPTS = 3
+NUM_PAGES = "*"
+OUTPUT = None
+ENGINE = SELENIUM
+WORKERS = 1
+RATE_LIMIT = None
+IMG_DUMP_PATH = None
+
+# roles
+COORDINATOR = "coordinator"
+WORKER = "worker"
+
+
+# class DistributedCrawl
+class DistributedCrawl(MineralPydiaCrawl):
+    """
+    DistributedCrawl
+
+    A MineralPydiaCrawl that shares its work with other nodes through a work queue.
+    """
+
+    def __init__(
+            self, role, queue_path, worker_id=None, lease=60, poll=2, max_attempts=3, img_dump_path=None, *args,
+            **kwargs
+    ):
+        """
+        __init__
+
+        Starts the node, which runs until every item in the queue is finished.
+
+        :param role: COORDINATOR or WORKER.
+        :param queue_path: the path of the shared work queue.
+        :param worker_id: the name this node claims work under, None for the host name and process id.
+        :param lease: the seconds claimed work is held for before other nodes may claim it.
+        :param poll: the seconds to wait before asking again when there is no work to claim.
+        :param max_attempts: the number of times an item is claimed before it is given up on.
+        :param img_dump_path: the content store to download images to, None to not download images.
+        :param args: the arguments of MineralPydiaCrawl.
+        :param kwargs: the keyword arguments of MineralPydiaCrawl.
+        """
+
+        if role not in (COORDINATOR, WORKER):
+            self._log("Invalid role " + str(role) + ", exiting crawl.", -1, ERROR)
+
+        self._role = role
+        self._queue_path = queue_path
+        self._owner = worker_id if worker_id is not None else socket.gethostname() + "-" + str(os.getpid())
+        self._lease = lease
+        self._poll = poll
+        self._max_attempts = max_attempts
+        self._img_dump_path = img_dump_path
+
+        # (kind, key) of every item a worker of the node is working on, only these leases are renewed
+        self._held = set()
+
+        # only the coordinator writes the output, a worker must not replace it
+        self._writes_output = role == COORDINATOR
+
+        super().__init__(*args, **kwargs)
+
+    # path of a file kept next to the output
+    def _side_path(self, suffix):
+        """
+        _side_path
+
+        :param suffix: the suffix of the file, e.g. ".checkpoint.jsonl".
+        :return: the path of the file, named with the worker's name on a worker node.
+        """
+
+        if self._role == WORKER:
+            suffix = "." + self._owner + suffix
+
+        return super()._side_path(suffix)
+
+    # crawls the share of the work this node claims
+    def _crawl(self):
+        """
+        _crawl
+
+        Seeds the queue if coordinating, works the queue until every item is finished, and merges the results if
+        coordinating.
+        """
+
+        work_queue = WorkQueue(self._queue_path)
+
+        if self._role == COORDINATOR:
+            try:
+                self._output = open_output(self._outfile, self._format)
+            except ImportError as ie:
+                self._log(str(ie) + ", exiting crawl.", -1, ERROR)
+
+            self._seed(work_queue)
+
+        self._log(
+            "Node " + self._owner + " is working the queue at " + os.path.abspath(self._queue_path) + " with "
+            + str(self._workers) + " workers."
+        )
+        self._work(work_queue)
+
+        if self._role == COORDINATOR:
+            self._merge(work_queue)
+            self._fill_csv()
+            self._snapshot()
+
+        work_queue.close()
+
+    # seeds the queue with every mineral url
+    def _seed(self, work_queue):
+        """
+        _seed
+
+        Reads the listing pages and seeds every mineral url with its page and position, so the results can be merged in
+        the order the minerals are listed. Seeding a queue that was seeded before only adds the urls it is missing.
+
+        :param work_queue: the WorkQueue.
+        """
+
+        try:
+            urls = self._count_pages()
+        except FetchFailed as ff:
+            self._log("The first listing page could not be read, exiting crawl: " + str(ff), -1, ERROR)
+
+        page = 1
+        while True:
+            added = work_queue.seed(MINERAL, ((url, {"page": page, "position": p}) for p, url in enumerate(urls)))
+            self._log("Seeded " + str(added) + " new mineral urls from listing page #" + str(page))
+
+            # without a pager the listing pages are read until one without minerals
+            page += 1
+            if (self._num_page is not None and page > self._num_page) or (self._num_page is None and not urls):
+                break
+
+            try:
+                urls, _ = self._list_page(page)
+            except FetchFailed as ff:
+                self._log("Listing page #" + str(page) + " could not be read: " + str(ff), level=ERROR)
+                self._metrics.count("errors")
+                self._incomplete += 1
+                urls = []
+
+        work_queue.set("seeded", True)
+
+    # works the queue until every item is finished
+    def _work(self, work_queue):
+        """
+        _work
+
+        Runs the node's workers, renewing the leases of the work they hold until they are all finished.
+
+        :param work_queue: the WorkQueue.
+        """
+
+        # set by the last worker to finish, the number of workers still running is a list so they can update it
+        stop = threading.Event()
+        running = [self._workers]
+
+        # images are downloaded into the shared content store, every worker of the node shares a fetcher and pool
+        images = None
+        if self._img_dump_path is not None:
+            images = (
+                ImageStore(self._img_dump_path),
+                HTTPPool(self._workers, metrics=self._metrics),
+                Fetcher(
+                    None, True, 3, os.path.join(self._img_dump_path, "dead_letters." + self._owner + ".jsonl"),
+                    self._metrics, self._log
+                )
+            )
+
+        workers = [
+            threading.Thread(target=self._worker, args=(work_queue, images, stop, running), name="crawl-worker-" + str(n))
+            for n in range(self._workers)
+        ]
+        for thread in workers:
+            thread.start()
+
+        # the leases of the items being worked on are renewed well before they run out, an item a worker abandoned is
+        # left to run out so another worker can claim it, the queue's progress is logged at the same time
+        while not stop.wait(self._lease / 3):
+            with self._lock:
+                held = list(self._held)
+            work_queue.renew(self._owner, self._lease, held)
+            self._log("Queue progress: " + str(work_queue.counts(MINERAL)) + " minerals, "
+                      + str(work_queue.counts(IMAGE)) + " images.")
+
+        for thread in workers:
+            thread.join()
+
+        if images is not None:
+            images[0].close()
+            images[1].close()
+
+    # one worker of the node
+    def _worker(self, work_queue, images, stop, running):
+        """
+        _worker
+
+        Claims and finishes minerals, then images, one at a time until every item in the queue is finished.
+
+        :param work_queue: the WorkQueue.
+        :param images: a tuple of the ImageStore, HTTPPool and Fetcher images are downloaded with, None to not download
+                       images.
+        :param stop: the Event set once every worker of the node has finished.
+        :param running: a list holding the number of workers of the node still running.
+        """
+
+        try:
+            self._open_session()
+        except Exception as e:
+            self._log("Worker could not start: " + repr(e), level=ERROR)
+            self._finished(stop, running)
+            return
+
+        try:
+            while True:
+                claimed = work_queue.claim(self._owner, MINERAL, 1, self._lease, self._max_attempts)
+                if claimed:
+                    self._finish(work_queue, MINERAL, claimed[0], images)
+                    continue
+
+                if images is not None:
+                    claimed = work_queue.claim(self._owner, IMAGE, 1, self._lease, self._max_attempts)
+                    if claimed:
+                        self._finish(work_queue, IMAGE, claimed[0], images)
+                        continue
+
+                # nothing is left to claim, the work is finished once the queue is seeded and nothing is leased
+                counts = work_queue.counts(None if images is not None else MINERAL)
+                if work_queue.get("seeded", False) and not counts.get(QUEUED) and not counts.get(LEASED):
+                    return
+
+                time.sleep(self._poll)
+        finally:
+            try:
+                self._close_session()
+            except Exception:
+                pass
+            self._finished(stop, running)
+
+    # works on a claimed item
+    def _finish(self, work_queue, kind, item, images):
+        """
+        _finish
+
+        Scrapes a claimed mineral or downloads a claimed image, renewing its lease while it is worked on. An item that
+        fails unexpectedly anywhere, including in the queue, is given back, and if even that fails its lease is left to
+        run out, so a worker never keeps an item it is not working on.
+
+        :param work_queue: the WorkQueue.
+        :param kind: MINERAL or IMAGE.
+        :param item: the (key, payload, token) it was claimed as.
+        :param images: a tuple of the ImageStore, HTTPPool and Fetcher images are downloaded with.
+        """
+
+        key, _, token = item
+
+        with self._lock:
+            self._held.add((kind, key))
+
+        try:
+            if kind == MINERAL:
+                self._mineral(work_queue, *item)
+            else:
+                self._image(work_queue, images, *item)
+
+        except Exception as e:
+            self._log("Worker failed on " + kind + " " + key + ": " + repr(e), level=ERROR)
+            self._metrics.count("errors")
+            try:
+                self._give_back(work_queue, kind, key, token, e)
+            except Exception as ge:
+                self._log("Could not give " + key + " back, its lease is left to run out: " + repr(ge), level=ERROR)
+
+        finally:
+            with self._lock:
+                self._held.discard((kind, key))
+
+    # counts a worker out
+    def _finished(self, stop, running):
+        """
+        _finished
+
+        :param stop: the Event set once every worker of the node has finished.
+        :param running: a list holding the number of workers of the node still running.
+        """
+
+        with self._lock:
+            running[0] -= 1
+            if running[0] == 0:
+                stop.set()
+
+    # scrapes a claimed mineral
+    def _mineral(self, work_queue, url, payload, token):
+        """
+        _mineral
+
+        Scrapes a mineral and seeds its images.
+
+        :param work_queue: the WorkQueue.
+        :param url: the mineral url.
+        :param payload: the page and position of the url.
+        :param token: the token the mineral was claimed with.
+        """
+
+        name = url.split("/")[-1]
+
+        try:
+            mineral_info = self._scrape(url, name)
+
+        except FetchFailed as ff:
+            self._metrics.count("errors")
+            work_queue.complete(self._owner, MINERAL, url, token, status=FAILED, error=str(ff))
+            return
+
+        except Exception as e:
+            self._log("Worker failed on " + url + ": " + repr(e), level=ERROR)
+            self._metrics.count("errors")
+            self._give_back(work_queue, MINERAL, url, token, e)
+            return
+
+        # the images are seeded before the mineral is completed, so they are never lost, seeding twice is harmless
+        if mineral_info is not None:
+            for uri in mineral_info["images"]:
+                work_queue.reference(uri, name)
+            work_queue.seed(IMAGE, ((uri, {"filename": uri.split("/")[-1]}) for uri in mineral_info["images"]))
+
+        if not work_queue.complete(self._owner, MINERAL, url, token, mineral_info):
+            self._log("The lease on " + url + " ran out before it was scraped, its result was dropped.", level=WARNING)
+            self._metrics.count("lost_leases")
+
+    # downloads a claimed image
+    def _image(self, work_queue, images, uri, payload, token):
+        """
+        _image
+
+        Downloads an image into the content store.
+
+        :param work_queue: the WorkQueue.
+        :param images: a tuple of the ImageStore, HTTPPool and Fetcher the image is downloaded with.
+        :param uri: the image uri.
+        :param payload: the filename of the image.
+        :param token: the token the image was claimed with.
+        """
+
+        store, pool, fetcher = images
+        names = [mineral for _, mineral in work_queue.references(uri)]
+
+        try:
+            downloaded = download_image(uri, payload["filename"], names, self._img_dump_path, store, pool, fetcher)
+        except Exception as e:
+            self._log("Worker failed on image " + uri + ": " + repr(e), level=ERROR)
+            self._metrics.count("errors")
+            self._give_back(work_queue, IMAGE, uri, token, e)
+            return
+
+        if not downloaded:
+            work_queue.complete(self._owner, IMAGE, uri, token, status=FAILED, error="dead letter")
+        elif not work_queue.complete(self._owner, IMAGE, uri, token, store.get(uri)):
+            self._log("The lease on " + uri + " ran out before it was downloaded.", level=WARNING)
+            self._metrics.count("lost_leases")
+
+    # gives a failed item back to the queue
+    def _give_back(self, work_queue, kind, key, token, error):
+        """
+        _give_back
+
+        Gives an item that failed unexpectedly back to the queue, or gives up on it once it has been claimed
+        max_attempts times.
+
+        :param work_queue: the WorkQueue.
+        :param kind: MINERAL or IMAGE.
+        :param key: the key of the item.
+        :param token: the token the item was claimed with, which is also the number of times it has been claimed.
+        :param error: the error the item failed with.
+        """
+
+        if token >= self._max_attempts:
+            work_queue.complete(self._owner, kind, key, token, status=FAILED, error=repr(error))
+        else:
+            work_queue.release(self._owner, kind, key, token, repr(error))
+
+    # merges the results of every node
+    def _merge(self, work_queue):
+        """
+        _merge
+
+        Writes every scraped mineral to the output in the order they are listed on the site, and records every mineral
+        each downloaded image belongs to in the content store.
+
+        :param work_queue: the WorkQueue.
+        """
+
+        minerals = work_queue.results(MINERAL)
+        minerals.sort(key=lambda item: (item[1]["page"], item[1]["position"]))
+
+        self._urls = [url for url, _, _, _ in minerals]
+        for url, _, status, mineral_info in minerals:
+            if status == DONE and mineral_info is not None:
+                name = url.split("/")[-1]
+                self._mineral_dict[name] = mineral_info
+                with self._metrics.time("write"):
+                    self._output.write(name, mineral_info)
+
+        failed = [url for url, _, status, _ in minerals if status == FAILED]
+        self._incomplete += sum(1 for _, _, status, _ in minerals if status != DONE)
+        if failed:
+            self._log(str(len(failed)) + " mineral pages could not be read:\n" + "\n".join(failed), level=ERROR)
+
+        if self._img_dump_path is not None:
+            store = ImageStore(self._img_dump_path)
+            for uri, mineral in work_queue.references():
+                store.reference(mineral, uri)
+            store.close()
+
+        self._log(
+            "Merged " + str(len(self._mineral_dict)) + " minerals of " + str(len(minerals)) + " urls, images: "
+            + str(work_queue.counts(IMAGE))
+        )
+
+
+def main():
+    """
+    main
+
+    Starts a node with the given environment variables.
+    """
+    DistributedCrawl(
+        ROLE, QUEUE_PATH, WORKER_ID, LEASE, POLL, MAX_ATTEMPTS, IMG_DUMP_PATH, NUM_PAGES, OUTPUT, ENGINE, WORKERS,
+        RATE_LIMIT
+    )
+
+
+if __name__ == "__main__":
+    """
+    Executes main if not being imported.
+    """
+    main()
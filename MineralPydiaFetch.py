@@ -0,0 +1,579 @@
+"""
+MineralPydiaFetch.py
+
+Fetch layer shared by MineralPydiaCrawl.py and MineralPydiaImageWrangle.py, wrapped around every page and image fetch.
+
+Every fetch goes through a Fetcher, which for each host keeps:
+    * a token bucket rate limit. In adaptive mode it halves its rate whenever the host answers 429 or 503 (waiting out
+      any Retry-After first), and raises it again a little at a time while responses come back within the latency
+      target. Without a configured rate the bucket starts unlimited and only limits once the host pushes back.
+    * a circuit breaker. After a run of consecutive failures (timeouts, refused connections, 5xx) the host is given a
+      cool down, with every fetch against it waiting, then a single probe is let through. A probe that fails doubles
+      the cool down, and once the breaker has tripped MAX_TRIPS times in a row the host is given up on for the rest of
+      the run.
+Transient errors are retried with exponential backoff and full jitter. Fetches that fail for good (a 404, retries
+used up, a host given up on) are appended to a dead-letter file, one JSON object per line, and raised as FetchFailed so
+the caller can carry on with the next page or image.
+"""
+
+# retries and backoff
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import threading
+import random
+import time
+import json
+
+# errors and urls
+from urllib.error import URLError, HTTPError
+from urllib.parse import urlsplit
+
+# token bucket
+from MineralPydiaHTTP import RateLimiter
+
+# log level of retries and trips
+from MineralPydiaLog import WARNING
+
+
+# number of times a transient error is retried, and the base and largest backoff in seconds
+RETRIES = 3
+BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+
+# consecutive failures that trip a host's breaker, the first cool down in seconds, and the trips in a row after which
+# the host is given up on
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 10.0
+MAX_TRIPS = 5
+
+# responses slower than this many seconds do not count as healthy
+LATENCY_TARGET = 2.0
+
+# the adaptive rate is multiplied by DECREASE when throttled and by INCREASE after each healthy response, but is not
+# raised again for HOLD seconds after being throttled and never falls below MIN_RATE requests per second
+DECREASE = 0.5
+INCREASE = 1.02
+HOLD = 5.0
+MIN_RATE = 0.1
+
+# kinds of fetch errors
+PERMANENT = "permanent"
+TRANSIENT = "transient"
+THROTTLED = "throttled"
+
+# http statuses worth retrying, and the ones that mean the host wants fewer requests
+_TRANSIENT_STATUSES = (408, 500, 502, 504)
+_THROTTLE_STATUSES = (429, 503)
+
+
+# class FetchFailed
+class FetchFailed(Exception):
+    """
+    FetchFailed
+
+    Raised once a fetch has failed for good and has been written to the dead-letter file.
+    """
+
+    def __init__(self, url, error, attempts):
+        """
+        __init__
+
+        :param url: the url that could not be fetched.
+        :param error: the last error raised by the fetch.
+        :param attempts: the number of attempts made.
+        """
+
+        super().__init__(url + " failed after " + str(attempts) + " attempts: " + repr(error))
+        self.url = url
+        self.error = error
+        self.attempts = attempts
+
+
+# class CircuitOpenError
+class CircuitOpenError(URLError):
+    """
+    CircuitOpenError
+
+    Raised instead of fetching from a host whose breaker has tripped too many times in a row.
+    """
+
+
+# class AdaptiveRateLimiter
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    AdaptiveRateLimiter
+
+    Token bucket whose rate is lowered when the host pushes back and raised again while it is healthy.
+    """
+
+    def __init__(self, rate=None, burst=1, adaptive=True):
+        """
+        __init__
+
+        :param rate: the number of requests allowed per second, None to start unlimited. A configured rate is also the
+                     most the adaptive rate is ever raised to.
+        :param burst: the number of requests that may be made back to back after an idle period.
+        :param adaptive: False to keep the rate fixed, Retry-After is still waited out.
+        """
+
+        super().__init__(rate, burst)
+        self._ceiling = rate
+        self._adaptive = adaptive
+
+        # no request is let through before this time, the last time the rate was lowered, and the average time between
+        # requests, used to find the rate requests were actually being made at when an unlimited bucket is throttled
+        self._paused_until = 0.0
+        self._lowered = 0.0
+        self._interval = None
+        self._previous = None
+
+    @property
+    def rate(self):
+        """
+        rate
+
+        :return: the current number of requests allowed per second, None for no limit.
+        """
+
+        return self._rate
+
+    def acquire(self):
+        """
+        acquire
+
+        Waits out any Retry-After, then takes a token.
+        """
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._paused_until - now
+
+                if wait <= 0:
+                    if self._previous is not None:
+                        interval = now - self._previous
+                        self._interval = interval if self._interval is None else 0.8 * self._interval + 0.2 * interval
+                    self._previous = now
+                    break
+
+            time.sleep(wait)
+
+        super().acquire()
+
+    def slow_down(self, retry_after=None):
+        """
+        slow_down
+
+        Lowers the rate after the host answered 429 or 503.
+
+        :param retry_after: the seconds the host asked to wait before the next request, if it said.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+            # one burst of throttled responses lowers the rate once
+            if not self._adaptive or now - self._lowered < 1.0:
+                return
+
+            current = self._rate
+            if not current:
+                current = 1 / self._interval if self._interval else 1.0
+
+            self._rate = max(MIN_RATE, current * DECREASE)
+            self._tokens = min(self._tokens, 1.0)
+            self._last = now
+            self._lowered = now
+
+    def speed_up(self):
+        """
+        speed_up
+
+        Raises the rate a little after a healthy response. An unlimited bucket is left unlimited, and without a
+        configured rate the limit is lifted again once it is well above the rate requests are actually made at.
+        """
+
+        with self._lock:
+            if not self._adaptive or not self._rate or time.monotonic() - self._lowered < HOLD:
+                return
+
+            self._rate *= INCREASE
+
+            if self._ceiling:
+                self._rate = min(self._rate, self._ceiling)
+            elif self._interval and self._rate * self._interval > 2:
+                self._rate = None
+
+
+# class CircuitBreaker
+class CircuitBreaker:
+    """
+    CircuitBreaker
+
+    Breaker of one host, shared between every thread fetching from it.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, max_trips=MAX_TRIPS):
+        """
+        __init__
+
+        :param threshold: the consecutive failures that trip the breaker.
+        :param cooldown: the seconds of the first cool down, doubled by every trip in a row.
+        :param max_trips: the trips in a row after which the host is given up on, None to never give up.
+        """
+
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._max_trips = max_trips
+
+        self._failures = 0
+        self._trips = 0
+        self._open_until = 0.0
+        self._probing = False
+        self._condition = threading.Condition()
+
+    def before(self):
+        """
+        before
+
+        Waits until a fetch may be made, through a cool down and while another thread's probe is out.
+        """
+
+        with self._condition:
+            while True:
+                if self._max_trips is not None and self._trips >= self._max_trips:
+                    raise CircuitOpenError("the host failed " + str(self._trips) + " cool downs in a row")
+
+                wait = self._open_until - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                elif self._trips and self._probing:
+                    self._condition.wait()
+                else:
+                    # after a cool down only one fetch goes through to probe the host
+                    self._probing = self._trips > 0
+                    return
+
+    def success(self):
+        """
+        success
+
+        Records that the host answered, closing the breaker.
+        """
+
+        with self._condition:
+            self._failures = 0
+            self._trips = 0
+            self._probing = False
+            self._condition.notify_all()
+
+    def failure(self):
+        """
+        failure
+
+        Records a failed fetch, tripping the breaker after threshold failures in a row or a failed probe.
+
+        :return: True if the breaker tripped.
+        """
+
+        with self._condition:
+            self._failures += 1
+            probe, self._probing = self._probing, False
+
+            tripped = probe or self._failures >= self._threshold
+            if tripped:
+                self._trips += 1
+                self._failures = 0
+                self._open_until = time.monotonic() + min(MAX_BACKOFF * 10, self._cooldown * 2 ** (self._trips - 1))
+
+            self._condition.notify_all()
+            return tripped
+
+    def release(self):
+        """
+        release
+
+        Lets another thread probe if this thread's fetch ended without saying anything about the host.
+        """
+
+        with self._condition:
+            self._probing = False
+            self._condition.notify_all()
+
+
+# class DeadLetters
+class DeadLetters:
+    """
+    DeadLetters
+
+    Append only file of the fetches that failed for good, so they can be looked at or retried later.
+    """
+
+    def __init__(self, path):
+        """
+        __init__
+
+        :param path: the dead-letter file, appended to. Nothing is created until the first failure.
+        """
+
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, url, error, attempts, **fields):
+        """
+        add
+
+        Records a fetch that failed for good.
+
+        :param url: the url.
+        :param error: the last error raised.
+        :param attempts: the number of attempts made.
+        :param fields: extra fields to record, e.g. the image's name.
+        """
+
+        record = {
+            "time": datetime.now().isoformat(),
+            "url": url,
+            "error": repr(error),
+            "status": getattr(error, "code", None),
+            "attempts": attempts
+        }
+        record.update(fields)
+
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record, default=str) + "\n")
+            self.count += 1
+
+
+# class Fetcher
+class Fetcher:
+    """
+    Fetcher
+
+    Rate limits, retries and breaks the fetches of any number of threads, per host.
+    """
+
+    def __init__(
+            self, rate=None, adaptive=True, retries=RETRIES, dead_letters=None, metrics=None, log=None, transient=(),
+            backoff=BACKOFF, latency_target=LATENCY_TARGET, breaker_threshold=BREAKER_THRESHOLD,
+            breaker_cooldown=BREAKER_COOLDOWN, max_trips=MAX_TRIPS
+    ):
+        """
+        __init__
+
+        :param rate: the most requests per second against each host, None to start unlimited.
+        :param adaptive: True to lower the rate on 429 and 503 and raise it again while responses are healthy.
+        :param retries: the number of times a transient error is retried.
+        :param dead_letters: the path of the dead-letter file, None to not keep one.
+        :param metrics: the MineralPydiaMetrics.Metrics waits, backoffs and failures are recorded in, None to not
+                        record them.
+        :param log: a function logging a message with a level keyword, None to not log.
+        :param transient: extra exception types that are retried, e.g. Selenium's TimeoutException.
+        :param backoff: the backoff of the first retry in seconds, doubled for every retry after it.
+        :param latency_target: responses slower than this many seconds do not raise the rate.
+        :param breaker_threshold: the consecutive failures that trip a host's breaker.
+        :param breaker_cooldown: the seconds of a host's first cool down.
+        :param max_trips: the trips in a row after which a host is given up on, None to never give up.
+        """
+
+        self._rate = rate
+        self._adaptive = adaptive
+        self._retries = max(0, int(retries))
+        self._metrics = metrics
+        self._log = log
+        self._transient = tuple(transient)
+        self._backoff = backoff
+        self._latency_target = latency_target
+        self._breaker = (breaker_threshold, breaker_cooldown, max_trips)
+        self.dead_letters = DeadLetters(dead_letters) if dead_letters is not None else None
+
+        self._hosts = dict()
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        """
+        _host
+
+        :param url: a url.
+        :return: the rate limiter and breaker of the url's host, created the first time the host is seen.
+        """
+
+        host = urlsplit(url).netloc
+
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = (
+                    AdaptiveRateLimiter(self._rate, adaptive=self._adaptive), CircuitBreaker(*self._breaker)
+                )
+            return self._hosts[host]
+
+    def limiter(self, url):
+        """
+        limiter
+
+        :param url: a url.
+        :return: the AdaptiveRateLimiter of the url's host.
+        """
+
+        return self._host(url)[0]
+
+    def classify(self, error):
+        """
+        classify
+
+        :param error: an exception raised by a fetch.
+        :return: THROTTLED, TRANSIENT or PERMANENT, or None if the exception is not a fetch error.
+        """
+
+        if isinstance(error, CircuitOpenError):
+            return PERMANENT
+
+        if isinstance(error, HTTPError):
+            if error.code in _THROTTLE_STATUSES:
+                return THROTTLED
+            return TRANSIENT if error.code in _TRANSIENT_STATUSES else PERMANENT
+
+        if isinstance(error, URLError) or isinstance(error, self._transient):
+            return TRANSIENT
+
+        return None
+
+    def call(self, url, fetch, on_retry=None, **fields):
+        """
+        call
+
+        Fetches a url under its host's rate limit and breaker, retrying transient errors.
+
+        :param url: the url being fetched, its host picks the rate limit and breaker.
+        :param fetch: a function taking no arguments that makes the fetch and returns its result.
+        :param on_retry: a function called with the error before every retry, e.g. to replace a stuck browser.
+        :param fields: extra fields recorded with the url if it ends up in the dead-letter file.
+        :return: the result of fetch.
+        """
+
+        limiter, breaker = self._host(url)
+        attempts = 0
+
+        while True:
+            try:
+                breaker.before()
+            except CircuitOpenError as e:
+                self._fail(url, e, attempts, fields)
+
+            self._time("rate_limit", limiter.acquire)
+            attempts += 1
+            start = time.perf_counter()
+
+            try:
+                result = fetch()
+
+            except Exception as e:
+                kind = self.classify(e)
+                if kind is None:
+                    breaker.release()
+                    raise
+
+                # the host answered, it is up even if this url is no good or it wants fewer requests
+                if kind == THROTTLED:
+                    limiter.slow_down(_retry_after(e))
+                    self._count("throttled")
+                    self._say("Throttled by " + url + ", the rate is now " + _rate_name(limiter.rate), e)
+
+                if kind == TRANSIENT or getattr(e, "code", None) == 503:
+                    if breaker.failure():
+                        self._count("circuit_trips")
+                        self._say("Too many failures fetching " + url + ", cooling the host down", e)
+                else:
+                    breaker.success()
+
+                if kind == PERMANENT or attempts > self._retries:
+                    self._fail(url, e, attempts, fields)
+
+                # exponential backoff with full jitter, or longer if the host asked
+                delay = random.uniform(0, min(MAX_BACKOFF, self._backoff * 2 ** (attempts - 1)))
+                delay = max(delay, _retry_after(e) or 0)
+                self._count("backoffs")
+                self._say("Retrying " + url + " in " + format(delay, ".2f") + " seconds", e)
+                self._time("backoff", time.sleep, delay)
+
+                if on_retry is not None:
+                    on_retry(e)
+                continue
+
+            breaker.success()
+            if time.perf_counter() - start <= self._latency_target:
+                limiter.speed_up()
+
+            return result
+
+    def _fail(self, url, error, attempts, fields):
+        """
+        _fail
+
+        Records a fetch that failed for good and raises FetchFailed.
+        """
+
+        if self.dead_letters is not None:
+            self.dead_letters.add(url, error, attempts, **fields)
+        self._count("dead_letters")
+        raise FetchFailed(url, error, attempts) from error
+
+    def _say(self, message, error):
+        # logs a retry or breaker message, if there is a log
+        if self._log is not None:
+            self._log(message + ": " + repr(error), level=WARNING)
+
+    def _count(self, name):
+        # counts an event, if there are metrics
+        if self._metrics is not None:
+            self._metrics.count(name)
+
+    def _time(self, stage, function, *args):
+        # times a wait, if there are metrics
+        if self._metrics is None:
+            return function(*args)
+
+        with self._metrics.time(stage):
+            return function(*args)
+
+
+# seconds a response asked to wait
+def _retry_after(error):
+    """
+    _retry_after
+
+    :param error: an exception raised by a fetch.
+    :return: the seconds of the error's Retry-After header, None if it has none.
+    """
+
+    headers = getattr(error, "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+# readable rate
+def _rate_name(rate):
+    """
+    _rate_name
+
+    :param rate: a rate in requests per second, or None.
+    :return: the rate as text.
+    """
+
+    return "unlimited" if not rate else format(rate, ".2f") + " requests per second"
@@ -0,0 +1,418 @@
+"""
+MineralPydiaHTTP.py
+
+Small keep-alive connection pool used for every image and page fetch, and a token bucket rate limiter used to keep
+concurrent fetches polite.
+
+urllib opens a brand new TCP (and TLS) connection for each request, which for a few thousand small images means most
+of the time is spent on handshakes. HTTPPool keeps a bounded number of open connections per host and hands them out
+again once a response has been read in full.
+"""
+
+# connections
+import http.client
+import socket
+import ssl
+
+# pooling and rate limiting
+import threading
+import time
+
+# errors and urls
+from urllib.error import URLError, HTTPError
+from urllib.parse import urlsplit, urljoin
+
+
+# how many redirects are followed before giving up
+MAX_REDIRECTS = 5
+
+# errors that mean a kept alive connection was closed by the server while it sat in the pool
+_STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+
+# class PooledResponse
+class PooledResponse:
+    """
+    PooledResponse
+
+    Wraps an http.client.HTTPResponse, returning its connection to the pool when the response is closed.
+    """
+
+    def __init__(self, pool, conn, response, url):
+        """
+        __init__
+
+        :param pool: the ConnectionPool the connection belongs to.
+        :param conn: the connection the response was read from.
+        :param response: the http.client.HTTPResponse.
+        :param url: the path of the request, replaced with the full url by HTTPPool.request.
+        """
+
+        self._pool = pool
+        self._conn = conn
+        self._response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        """
+        read
+
+        Reads from the body of the response.
+
+        :param amt: the maximum number of bytes to read, if None the rest of the body is read.
+        :return: the bytes read, empty once the body is exhausted.
+        """
+
+        try:
+            return self._response.read(amt)
+        except (http.client.HTTPException, OSError) as e:
+            self.close()
+            raise URLError(e)
+
+    def close(self):
+        """
+        close
+
+        Closes the response. The connection is only reused if the body was read in full and the server did not ask for
+        it to be closed, otherwise it is thrown away.
+        """
+
+        if self._conn is None:
+            return
+
+        reusable = self._response.isclosed() and not self._response.will_close
+        self._response.close()
+        self._pool.put(self._conn, reusable)
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# class ConnectionPool
+class ConnectionPool:
+    """
+    ConnectionPool
+
+    Bounded pool of keep-alive connections to a single host. At most size connections are open at once, callers asking
+    for one while they are all in use wait until one is returned.
+    """
+
+    def __init__(self, scheme, host, port, size, timeout, context, metrics=None):
+        """
+        __init__
+
+        :param scheme: http or https.
+        :param host: the host name.
+        :param port: the port, None for the scheme's default.
+        :param size: the maximum number of open connections.
+        :param timeout: the socket timeout in seconds.
+        :param context: the ssl.SSLContext used for https connections.
+        :param metrics: the MineralPydiaMetrics.Metrics new connections are timed with, None to not time them.
+        """
+
+        self._scheme = scheme
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        self._context = context
+        self._metrics = metrics
+
+        # idle connections, reused last in first out so the warmest connection is used first
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, size))
+
+        # number of connections this pool has ever opened
+        self.opened = 0
+
+    def get(self):
+        """
+        get
+
+        Takes an idle connection, or opens a new one if none are idle.
+
+        :return: a tuple of the connection and whether it was reused.
+        """
+
+        self._slots.acquire()
+
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+            self.opened += 1
+
+        if self._scheme == "https":
+            conn = http.client.HTTPSConnection(self._host, self._port, timeout=self._timeout, context=self._context)
+        else:
+            conn = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+
+        # resolve the host separately so the lookup is timed apart from the connect
+        if self._metrics is not None:
+            conn._create_connection = self._create_connection
+
+        return conn, False
+
+    def _create_connection(self, address, timeout, source_address=None):
+        """
+        _create_connection
+
+        Stands in for socket.create_connection when connections are timed, timing the host lookup as the dns stage.
+
+        :param address: the host and port to connect to.
+        :param timeout: the socket timeout in seconds.
+        :param source_address: the local address to bind to, if any.
+        :return: the connected socket.
+        """
+
+        host, port = address
+        with self._metrics.time("dns"):
+            addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+
+        error = OSError("could not resolve " + str(host))
+        for _, _, _, _, sockaddr in addresses:
+            try:
+                return socket.create_connection(sockaddr[:2], timeout, source_address)
+            except OSError as e:
+                error = e
+
+        raise error
+
+    def put(self, conn, reusable):
+        """
+        put
+
+        Returns a connection to the pool.
+
+        :param conn: the connection taken with get.
+        :param reusable: if False the connection is closed rather than kept.
+        """
+
+        if reusable:
+            with self._lock:
+                self._idle.append(conn)
+        else:
+            conn.close()
+
+        self._slots.release()
+
+    def close(self):
+        """
+        close
+
+        Closes every idle connection.
+        """
+
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._idle = []
+
+
+# class HTTPPool
+class HTTPPool:
+    """
+    HTTPPool
+
+    Hands out pooled connections for any number of hosts. Errors are raised as URLError and HTTPError so callers can
+    treat it the same as urllib.request.urlopen.
+    """
+
+    def __init__(self, pool_size=4, timeout=30, context=None, metrics=None):
+        """
+        __init__
+
+        :param pool_size: the maximum number of open connections per host.
+        :param timeout: the socket timeout in seconds.
+        :param context: the ssl.SSLContext used for https, if None the default context is used.
+        :param metrics: the MineralPydiaMetrics.Metrics that host lookups, connects and retries are recorded in, None
+                        to not record them.
+        """
+
+        self._pool_size = pool_size
+        self._metrics = metrics
+        self._timeout = timeout
+        self._context = context if context is not None else ssl.create_default_context()
+        self._pools = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def connections_opened(self):
+        """
+        connections_opened
+
+        :return: the total number of connections opened across every host.
+        """
+
+        with self._lock:
+            return sum(pool.opened for pool in self._pools.values())
+
+    def _pool(self, scheme, netloc):
+        """
+        _pool
+
+        Gets the pool for a host, creating it the first time the host is seen.
+
+        :param scheme: http or https.
+        :param netloc: the host and optional port.
+        :return: the ConnectionPool for the host.
+        """
+
+        key = (scheme, netloc)
+
+        with self._lock:
+            if key not in self._pools:
+                parts = urlsplit(scheme + "://" + netloc)
+                self._pools[key] = ConnectionPool(
+                    scheme, parts.hostname, parts.port, self._pool_size, self._timeout, self._context, self._metrics
+                )
+
+            return self._pools[key]
+
+    def request(self, url, headers=None, method="GET"):
+        """
+        request
+
+        Makes a request over a pooled connection, following redirects. The body is not read, the caller streams it
+        with read and must close the response (or use it as a context manager) to give the connection back.
+
+        :param url: the url to request.
+        :param headers: a dictionary of extra request headers.
+        :param method: the HTTP method.
+        :return: a PooledResponse.
+        """
+
+        headers = dict(headers or {})
+
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ("http", "https"):
+                raise URLError("unsupported url scheme: " + parts.scheme)
+
+            pool = self._pool(parts.scheme, parts.netloc)
+            target = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+
+            response = self._send(pool, method, target, headers)
+            response.url = url
+
+            # follow redirects the same way urlopen would
+            if response.status in (301, 302, 303, 307, 308) and response.headers.get("Location"):
+                location = response.headers["Location"]
+                response.read()
+                response.close()
+                url = urljoin(url, location)
+                continue
+
+            if response.status >= 400:
+                response.close()
+                raise HTTPError(url, response.status, response.reason, response.headers, None)
+
+            return response
+
+        raise URLError("too many redirects: " + url)
+
+    def _send(self, pool, method, target, headers):
+        """
+        _send
+
+        Sends one request. If a reused connection turns out to have been closed by the server the request is sent once
+        more over a fresh connection.
+
+        :param pool: the ConnectionPool to use.
+        :param method: the HTTP method.
+        :param target: the path and query of the request.
+        :param headers: the request headers.
+        :return: a PooledResponse.
+        """
+
+        while True:
+            conn, reused = pool.get()
+
+            try:
+                # open new connections up front so the connect, including the host lookup and TLS, is timed on its own
+                if not reused and self._metrics is not None:
+                    with self._metrics.time("connect"):
+                        conn.connect()
+
+                conn.request(method, target, headers=headers)
+                response = conn.getresponse()
+                return PooledResponse(pool, conn, response, target)
+
+            except _STALE_ERRORS as e:
+                pool.put(conn, False)
+                if not reused:
+                    raise URLError(e)
+
+                if self._metrics is not None:
+                    self._metrics.count("retries")
+
+            except (http.client.HTTPException, socket.timeout, OSError) as e:
+                pool.put(conn, False)
+                raise URLError(e)
+
+    def close(self):
+        """
+        close
+
+        Closes every idle connection in every pool.
+        """
+
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+
+
+# class RateLimiter
+class RateLimiter:
+    """
+    RateLimiter
+
+    Token bucket shared between threads to keep the combined request rate polite. Tokens refill at rate per second up
+    to burst, and every request takes one token, waiting for it if the bucket is empty.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        __init__
+
+        :param rate: the number of requests allowed per second, None or 0 for no limit.
+        :param burst: the number of requests that may be made back to back after an idle period.
+        """
+
+        self._rate = rate
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        acquire
+
+        Takes a token, sleeping until one is available.
+        """
+
+        while True:
+            with self._lock:
+
+                # the rate is read again every pass, it may have been lifted while this thread was waiting
+                if not self._rate:
+                    return
+
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+                self._last = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self._rate
+
+            time.sleep(wait)
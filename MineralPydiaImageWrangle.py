@@ -5,96 +5,655 @@ This program will download all images from the image URIs collected in MineralPy
 """
 
 # http requests
-import urllib.request
-from urllib.error import URLError
+from MineralPydiaHTTP import HTTPPool
+from MineralPydiaFetch import Fetcher, FetchFailed
+from urllib.error import URLError, HTTPError
+from urllib.parse import urlparse
+
+# resumable downloads
+from MineralPydiaManifest import ImageManifest, MANIFEST_NAME, PARTIAL, COMPLETE, FAILED
+from MineralPydiaStore import ImageStore
+import hashlib
+
+# concurrent downloads
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
+import threading
+import queue
 
 # access csv
-import pandas as pd
+from MineralPydiaOutput import read_images
 
-# logging
-from datetime import datetime
+# logging and metrics
+from MineralPydiaLog import Logger, INFO, WARNING, ERROR
+from MineralPydiaMetrics import Metrics
+from MineralPydiaProgress import Progress
+import time
 import os
 
 
 """
 ENVIRONMENT VARIABLES.
 
-CSV_PATH - the csv to load in.
+CSV_PATH - the crawl output to load in, either the csv or a .parquet/.feather output (only its images table is read).
 IMG_DUMP_PATH - the directory to download images to.
+STORE - how images are stored. "content" keeps every image once under the SHA-256 of its bytes with an index of which
+        minerals and uris it belongs to, "flat" names every image after the last segment of its uri.
+LINKS - a directory to make named hard links of the content store's images in, as LINKS/<mineral>/<image name>.
+        If left None no links are made.
+WORKERS - the number of images downloaded at once. A value of 1 downloads images one at a time.
+PER_HOST - the maximum number of downloads allowed against a single host at once, only used when WORKERS > 1.
+MANIFEST_PATH - the download manifest used to skip and resume images, the index of the content store.
+                If left None use IMG_DUMP_PATH/manifest.sqlite, or IMG_DUMP_PATH/index.sqlite for the content store.
+POOL_SIZE - the maximum number of kept alive connections per host.
+RATE_LIMIT - the most image requests per second made against each host. If left None requests are not limited until
+             a host answers 429 or 503.
+ADAPTIVE - if True the rate against a host is lowered whenever it answers 429 or 503, and raised again while it answers
+           quickly.
+RETRIES - the number of times a download that failed with a timeout, a dropped connection or a 5xx is retried.
+DEAD_LETTERS - the file images that could not be downloaded are recorded in, one JSON object per line.
+               If left None use IMG_DUMP_PATH/dead_letters.jsonl.
+LOG_LEVEL - the lowest level of message written to the log, "DEBUG", "INFO", "WARNING" or "ERROR".
+LOG_FORMAT - "text" for the plain text log, "json" for one JSON object per line.
+METRICS - the JSON report of stage timings and counters written at the end of the run.
+          If left None use IMG_DUMP_PATH/metrics.json.
+METRICS_PORT - a local port the live metrics are served on in the Prometheus text format while downloading.
+               If left None they are not served.
+SHARDS - a directory to pack the downloaded images into training shards in once the downloads are done, see
+         MineralPydiaShard.py. If left None no shards are packed.
+CHANGESET - a changeset written by MineralPydiaSnapshot.py. If given only the images it adds are downloaded, and the
+            images it removes are dropped from the minerals they belonged to in the content store. If left None every
+            image of CSV_PATH is downloaded.
 """
 CSV_PATH = "./MineralPydiaCrawlData.csv"
 IMG_DUMP_PATH = "./img_dump"
+STORE = "content"
+LINKS = None
+WORKERS = 1
+PER_HOST = 4
+MANIFEST_PATH = None
+POOL_SIZE = 4
+RATE_LIMIT = None
+ADAPTIVE = True
+RETRIES = 3
+DEAD_LETTERS = None
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "text"
+METRICS = None
+METRICS_PORT = None
+SHARDS = None
+CHANGESET = None
+
+# size of each block read from a response and written to disk
+CHUNK_SIZE = 64 * 1024
+
+# image stores
+CONTENT = "content"
+FLAT = "flat"
+
+# guards the progress bar when downloading concurrently
+_LOCK = threading.Lock()
+
+# writes the log from a background thread
+_LOGGER = Logger("MineralPydiaImageWrangle.log", LOG_LEVEL, LOG_FORMAT)
+
+# times every stage of the downloads
+_METRICS = Metrics("mineralpydia_download")
 
 
 # downloads the images
-def mineral_pydia_image_wrangler(csv_path, img_dump_path):
+def mineral_pydia_image_wrangler(
+        csv_path, img_dump_path, workers=1, per_host=4, manifest_path=None, pool_size=4, metrics_path=None,
+        metrics_port=None, store=CONTENT, links=None, shards=None, rate_limit=None, adaptive=True, retries=3,
+        dead_letters=None, changeset=None
+):
     """
     metal_pydia_image_wrangler
 
     Uses the image URIs gathered to download mineral images.
 
-    :param csv_path: the path of the csv to read from.
+    :param csv_path: the path of the csv, or of the parquet or feather output, to read from.
     :param img_dump_path: the directory path which all images will be downloaded to.
+    :param workers: the number of images to download at once, 1 downloads serially.
+    :param per_host: the maximum number of simultaneous downloads against a single host.
+    :param manifest_path: the download manifest or content store index, if None it is kept in the image dump
+                          directory.
+    :param pool_size: the maximum number of kept alive connections per host.
+    :param metrics_path: the metrics report, if None it is written to the image dump directory.
+    :param metrics_port: a local port to serve the live metrics on, None to not serve them.
+    :param store: CONTENT to store images by the hash of their bytes, FLAT to name them after their uri.
+    :param links: a directory to make named hard links of the content store's images in, None to not make them.
+    :param shards: a directory to pack the images into training shards in, None to not pack them.
+    :param rate_limit: the most requests per second against each host, None to not limit until a host pushes back.
+    :param adaptive: True to lower the rate against a host that answers 429 or 503 and raise it while it is healthy.
+    :param retries: the number of times a download that failed transiently is retried.
+    :param dead_letters: the file images that could not be downloaded are recorded in, if None it is kept in the image
+                         dump directory.
+    :param changeset: the path of a changeset to apply instead of downloading every image, None to download every image.
     """
 
+    # an unknown store is a fatal error
+    if store not in (CONTENT, FLAT):
+        log("Invalid image store " + str(store) + ", exiting download.", -6, ERROR)
+
+    # start the metrics of this run, served live if asked for
+    _METRICS.reset()
+    if metrics_port is not None:
+        _METRICS.serve(metrics_port)
+
     # initializes df variable, not necessary but wanted to avoid PEP8 warnings in PyCharm
     df = ""
 
-    # attempt to read the csv and store in df variable
+    # attempt to read only the image columns of the csv and store in df variable
     try:
-        df = pd.read_csv(csv_path)
+        df = read_images(csv_path)
 
     # if the file does not exist log the path and EXIT
     except FileNotFoundError:
-        log("Could not find the csv located at the following path: " + os.path.abspath(csv_path), -4)
+        log("Could not find the csv located at the following path: " + os.path.abspath(csv_path), -4, ERROR)
 
     # if the filename is not a valid file name, log the path and EXIT
     except OSError:
-        log("The file path, " + os.path.abspath(csv_path) + " is not a valid path.", -5)
+        log("The file path, " + os.path.abspath(csv_path) + " is not a valid path.", -5, ERROR)
 
     # if the image dump path does not exist, log that it does not exist and use default directory instead
     if not os.path.exists(img_dump_path):
         log(
             "Could not find the image dump directory located at the following path: "
-            + os.path.abspath(img_dump_path) + ". Using the default directory instead."
+            + os.path.abspath(img_dump_path) + ". Using the default directory instead.",
+            level=WARNING
         )
         img_dump_path = "./img_dump"
 
-    # create a subset of the data only containing the image uri and name and loop over it
-    index = 1
-    for uri, filename in df[["image_uri", "image_name"]].itertuples(index=False):
+    # open the manifest or content store so images finished by an earlier run are not downloaded again
+    if store == CONTENT:
+        manifest = ImageStore(img_dump_path, manifest_path)
+    else:
+        if manifest_path is None:
+            manifest_path = os.path.join(img_dump_path, MANIFEST_NAME)
+        manifest = ImageManifest(manifest_path)
+
+    # only apply what changed since the last snapshot, the images of minerals that are gone are dropped from them
+    if changeset is not None:
+        from MineralPydiaSnapshot import read_changeset, summary
 
-        # attempt to download the image, log the attempt and log if it is successfully
         try:
-            log("Attempting to fetch the following:\n" + "URL: " + uri + "\n" + "Filename: " + filename)
+            changes = read_changeset(changeset)
+        except (OSError, ValueError):
+            log("Could not read the changeset at the following path: " + os.path.abspath(changeset), -4, ERROR)
 
-            # start download in new thread to allow command line spinning wheel
-            urllib.request.urlretrieve(uri, img_dump_path + "/" + filename)
+        log("Applying changeset " + os.path.abspath(changeset) + ": " + summary(changes))
 
-            # progress bar to make us feel better
-            os.system("cls")
-            size = round(50 * (index / len(df)))
-            print(
-                "Download image " + str(index) + " out of " + str(len(df))
-                + "\n\nProgress:\t| " + '█' * size + ' ' * (50 - size) + " |"
-            )
+        added = set((name, uri) for name, uri in changes["images"]["added"])
+        df = df[[(name, uri) in added for name, uri in zip(df["name"], df["image_uri"])]]
 
-            log(
-                "Image " + filename + " downloaded successfully to the following path: "
-                + os.path.abspath(img_dump_path + "/" + filename)
-            )
-            index += 1
+        if store == CONTENT:
+            for name, uri in changes["images"]["removed"]:
+                manifest.unreference(name, uri)
+
+    # the content store downloads every uri once, however many minerals it belongs to
+    # the flat store downloads every row, as a uri belonging to several minerals is stored under one name anyway
+    tasks = dict()
+    for name, uri, filename in df[["name", "image_uri", "image_name"]].itertuples(index=False):
+        key = uri if store == CONTENT else len(tasks)
+        tasks.setdefault(key, (uri, filename, []))[2].append(name)
+    tasks = list(tasks.values())
+
+    # connections are kept alive and shared between images from the same host
+    pool = HTTPPool(pool_size, metrics=_METRICS)
+
+    # every download is rate limited, retried and broken per host, images that fail for good are set aside
+    if dead_letters is None:
+        dead_letters = os.path.join(img_dump_path, "dead_letters.jsonl")
+    fetcher = Fetcher(rate_limit, adaptive, retries, dead_letters, _METRICS, log)
+
+    # progress bar to make us feel better, drawn from a background thread
+    progress = Progress("Downloading", len(tasks), "images", metrics=_METRICS).start()
+
+    try:
+        # download each image one at a time
+        if workers <= 1:
 
-        # if an error is caught, log it and EXIT
-        except URLError as ue:
-            log("Encountered unexpected URLError: " + str(ue), -1)
+            # loop over every image uri and name
+            for uri, filename, names in tasks:
+
+                # attempt to download the image, if it could not be downloaded carry on with the next one
+                downloaded = download_image(uri, filename, names, img_dump_path, manifest, pool, fetcher)
+                progress.advance(failed=not downloaded)
+
+        # download several images at once
+        else:
+            _download_concurrent(tasks, img_dump_path, workers, per_host, manifest, pool, fetcher, progress)
+
+    finally:
+        progress.close()
+
+    # log the images that could not be downloaded
+    if fetcher.dead_letters.count:
+        log(
+            str(fetcher.dead_letters.count) + " images could not be downloaded, they are listed in: "
+            + os.path.abspath(dead_letters),
+            level=WARNING, failed=fetcher.dead_letters.count
+        )
+
+    # make named links to the stored images, and log how much the content store saved
+    if store == CONTENT:
+        if links is not None:
+            log(str(manifest.link(links)) + " named links were made in " + os.path.abspath(links))
+
+        counts = manifest.counts()
+        log(
+            "The image store holds " + str(counts["images"]) + " distinct images (" + str(counts["stored_bytes"])
+            + " bytes) for " + str(counts.get(COMPLETE, 0)) + " uris (" + str(counts["uri_bytes"]) + " bytes) and "
+            + str(counts["references"]) + " mineral references.",
+            **counts
+        )
+
+    manifest.close()
+    pool.close()
+
+    # write the metrics of the run
+    if metrics_path is None:
+        metrics_path = os.path.join(img_dump_path, "metrics.json")
+    _METRICS.write(metrics_path)
+    _METRICS.close()
+    log("Download metrics have been written to the following path: " + os.path.abspath(metrics_path))
+
+    # pack the images into training shards, Pillow is only imported when they are asked for
+    if shards is not None:
+        from MineralPydiaShard import pack_shards
+        index = pack_shards(csv_path, img_dump_path, shards)
+        log(str(len(index)) + " shards were packed in " + os.path.abspath(shards))
 
     # log that all images have been downloaded and EXIT
     log("All image URIs have been processed. Resultant images are stored in: " + os.path.abspath(img_dump_path), 0)
 
 
+# downloads a single image through the fetcher
+def download_image(uri, filename, names, img_dump_path, manifest, pool, fetcher):
+    """
+    download_image
+
+    Downloads one image through the fetcher, so it is rate limited and retried, see _download.
+
+    :param uri: the image uri to download.
+    :param filename: the name the image will be saved under in the flat store.
+    :param names: the names of the minerals the image belongs to.
+    :param img_dump_path: the directory path the image will be downloaded to.
+    :param manifest: the ImageManifest, or ImageStore, recording the download.
+    :param pool: the HTTPPool the image is fetched through.
+    :param fetcher: the Fetcher the image is fetched through.
+    :return: True if the image is downloaded, False if it could not be and was logged and set aside as a dead letter.
+    """
+
+    try:
+        fetcher.call(uri, lambda: _download(uri, filename, names, img_dump_path, manifest, pool), image=filename)
+    except FetchFailed as ff:
+        log("Could not download image " + filename + ": " + str(ff), level=ERROR, uri=uri, image=filename)
+        return False
+
+    return True
+
+
+# downloads a single image
+def _download(uri, filename, names, img_dump_path, manifest, pool):
+    """
+    _download
+
+    Downloads one image and logs the attempt and its success.
+
+    Images the manifest already has as complete are skipped. The image is first written to a .part file, if one is
+    left over from an earlier run only the missing bytes are requested using a Range header. Once every byte has
+    arrived the .part file is renamed to the final filename and the manifest is updated, or for the content store
+    it is moved under its hash (or dropped if the same bytes are already stored) and referenced by every mineral.
+
+    :param uri: the image uri to download.
+    :param filename: the name the image will be saved under in the flat store.
+    :param names: the names of the minerals the image belongs to.
+    :param img_dump_path: the directory path the image will be downloaded to.
+    :param manifest: the ImageManifest, or ImageStore, recording the download.
+    :param pool: the HTTPPool the image is fetched through.
+    """
+
+    content = isinstance(manifest, ImageStore)
+
+    # the content store tracks images by uri and downloads them to a temporary file until their hash is known
+    if content:
+        part = manifest.part_path(uri)
+        complete = manifest.is_complete(uri)
+
+        def mark(status, size=None, sha256=None):
+            manifest.mark(uri, status, size, sha256)
+
+    else:
+        path = img_dump_path + "/" + filename
+        part = path + ".part"
+        complete = manifest.is_complete(filename, path)
+
+        def mark(status, size=None, sha256=None):
+            manifest.mark(filename, uri, status, size, sha256)
+
+    # skip images that were finished by an earlier run
+    if complete:
+        log("Image " + filename + " has already been downloaded, skipping.", uri=uri, image=filename)
+        _METRICS.count("skipped")
+
+        if content:
+            for name in names:
+                manifest.reference(name, uri)
+        return
+
+    log("Attempting to fetch the following:\n" + "URL: " + uri + "\n" + "Filename: " + filename, uri=uri, image=filename)
+
+    # if part of the image is already on disk hash what is there and ask only for the rest
+    sha256 = hashlib.sha256()
+    offset = 0
+    if os.path.isfile(part):
+        with open(part, "rb") as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                sha256.update(chunk)
+                offset += len(chunk)
+
+    headers = dict()
+    if offset > 0:
+        headers["Range"] = "bytes=" + str(offset) + "-"
+
+    mark(PARTIAL, offset)
+
+    try:
+        with _METRICS.time("request"):
+            response = pool.request(uri, headers)
+
+    # the server will not serve the range, the .part file is no good so start over
+    # a 416 when no range was asked for is a plain failure, starting over would only ask again
+    except HTTPError as he:
+        if he.code != 416 or offset == 0:
+            mark(FAILED, offset)
+            _METRICS.count("errors")
+            raise
+        os.remove(part)
+        return _download(uri, filename, names, img_dump_path, manifest, pool)
+
+    except URLError:
+        mark(FAILED, offset)
+        _METRICS.count("errors")
+        raise
+
+    with response:
+
+        # the server ignored the Range header and is sending the whole image
+        if offset > 0 and response.status != 206:
+            sha256 = hashlib.sha256()
+            offset = 0
+        elif offset > 0:
+            _METRICS.count("resumes")
+
+        # stream the body to disk in fixed size chunks
+        start = time.perf_counter()
+        received = 0
+        with open(part, "ab" if offset > 0 else "wb") as file:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                file.write(chunk)
+                sha256.update(chunk)
+                received += len(chunk)
+
+        offset += received
+        _METRICS.observe("transfer", time.perf_counter() - start)
+        _METRICS.count("bytes", received)
+
+    # move the image under its hash, the same bytes are only kept once
+    if content:
+        path = manifest.blob_path(sha256.hexdigest())
+        if not manifest.commit(uri, part, sha256.hexdigest(), offset):
+            _METRICS.count("duplicates")
+
+        for name in names:
+            manifest.reference(name, uri)
+
+    else:
+        os.replace(part, path)
+        mark(COMPLETE, offset, sha256.hexdigest())
+
+    _METRICS.count("images")
+
+    log(
+        "Image " + filename + " downloaded successfully to the following path: " + os.path.abspath(path),
+        uri=uri, image=filename, bytes=offset
+    )
+
+
+# downloads images using a pool of worker threads
+def _download_concurrent(tasks, img_dump_path, workers, per_host, manifest, pool, fetcher, progress):
+    """
+    _download_concurrent
+
+    Downloads all images using a bounded pool of worker threads. Each host gets its own semaphore so that no more
+    than per_host downloads are ever made against it at once, regardless of the number of workers.
+
+    :param tasks: a list of (image uri, image name, names of the minerals it belongs to).
+    :param img_dump_path: the directory path which all images will be downloaded to.
+    :param workers: the number of worker threads.
+    :param per_host: the maximum number of simultaneous downloads against a single host.
+    :param manifest: the ImageManifest, or ImageStore, recording the downloads.
+    :param pool: the HTTPPool the images are fetched through.
+    :param fetcher: the Fetcher every download is made through.
+    :param progress: the Progress every finished download is counted in.
+    """
+
+    # one semaphore per host, created the first time the host is seen
+    host_limits = dict()
+
+    def work(uri, filename, names):
+        host = urlparse(uri).netloc
+
+        with _LOCK:
+            if host not in host_limits:
+                host_limits[host] = threading.BoundedSemaphore(max(1, per_host))
+
+        # an image that could not be downloaded is logged, the other downloads carry on
+        with host_limits[host]:
+            downloaded = download_image(uri, filename, names, img_dump_path, manifest, pool, fetcher)
+
+        progress.advance(failed=not downloaded)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = [executor.submit(work, uri, filename, names) for uri, filename, names in tasks]
+
+    # wait for every download, or stop early on the first unexpected failure
+    finished, _ = wait(futures, return_when=FIRST_EXCEPTION)
+
+    # if an unexpected error is caught, drop the queued downloads, log it and raise it
+    for future in futures:
+        if future in finished and future.exception() is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+            manifest.close()
+            pool.close()
+
+            log("Encountered unexpected error: " + repr(future.exception()), level=ERROR)
+            raise future.exception()
+
+    executor.shutdown(wait=True)
+
+
+# class ImageDownloader
+class ImageDownloader:
+    """
+    ImageDownloader
+
+    Downloads images as they are handed to it, while whatever produces them is still running, e.g. the crawl in
+    MineralPydiaPipeline.py. Images wait on a bounded queue for a pool of worker threads, so a producer that runs
+    ahead of the downloads is blocked until there is room again. Every download is made through the same fetcher, host
+    limits, manifest or content store, and metrics as mineral_pydia_image_wrangler.
+    """
+
+    def __init__(
+            self, img_dump_path, workers=4, per_host=4, queue_size=256, manifest_path=None, pool_size=4, store=CONTENT,
+            rate_limit=None, adaptive=True, retries=3, dead_letters=None
+    ):
+        """
+        __init__
+
+        Opens the manifest or content store and starts the worker threads.
+
+        :param img_dump_path: the directory path which all images will be downloaded to, created if missing.
+        :param workers: the number of worker threads.
+        :param per_host: the maximum number of simultaneous downloads against a single host.
+        :param queue_size: the most images waiting for a worker before put blocks.
+        :param manifest_path: the download manifest or content store index, if None it is kept in the image dump
+                              directory.
+        :param pool_size: the maximum number of kept alive connections per host.
+        :param store: CONTENT to store images by the hash of their bytes, FLAT to name them after their uri.
+        :param rate_limit: the most requests per second against each host, None to not limit until a host pushes back.
+        :param adaptive: True to lower the rate against a host that answers 429 or 503 and raise it while it is healthy.
+        :param retries: the number of times a download that failed transiently is retried.
+        :param dead_letters: the file images that could not be downloaded are recorded in, if None it is kept in the
+                             image dump directory.
+        """
+
+        if store not in (CONTENT, FLAT):
+            raise ValueError("Invalid image store " + str(store))
+
+        os.makedirs(img_dump_path, exist_ok=True)
+        self.img_dump_path = img_dump_path
+        self._store = store
+        _METRICS.reset()
+
+        if store == CONTENT:
+            self._manifest = ImageStore(img_dump_path, manifest_path)
+        else:
+            self._manifest = ImageManifest(
+                manifest_path if manifest_path is not None else os.path.join(img_dump_path, MANIFEST_NAME)
+            )
+
+        self._pool = HTTPPool(pool_size, metrics=_METRICS)
+        self.fetcher = Fetcher(
+            rate_limit, adaptive, retries,
+            dead_letters if dead_letters is not None else os.path.join(img_dump_path, "dead_letters.jsonl"),
+            _METRICS, log
+        )
+
+        # images waiting for a worker as (uri, filename, names), None tells a worker to stop
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+
+        # every image handed over so far, so an image belonging to several minerals is downloaded once
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._host_limits = dict()
+        self._per_host = max(1, per_host)
+
+        # images handed over, and images finished or given up on
+        self.queued = 0
+        self.done = 0
+
+        self._workers = [
+            threading.Thread(target=self._work, name="download-worker-" + str(n), daemon=True)
+            for n in range(max(1, workers))
+        ]
+        for thread in self._workers:
+            thread.start()
+
+    def put(self, name, uri, filename):
+        """
+        put
+
+        Hands an image over to be downloaded, blocking while the queue is full. The content store downloads every uri
+        once and only records the mineral against uris it has already been given, the flat store downloads every
+        filename once.
+
+        :param name: the name of the mineral the image belongs to.
+        :param uri: the uri of the image.
+        :param filename: the name the image is saved under in the flat store.
+        """
+
+        key = uri if self._store == CONTENT else filename
+        with self._lock:
+            seen = key in self._seen
+            self._seen.add(key)
+
+        if seen:
+            if self._store == CONTENT:
+                self._manifest.reference(name, uri)
+            return
+
+        with _METRICS.time("queue_wait"):
+            self._queue.put((uri, filename, [name]))
+
+        with self._lock:
+            self.queued += 1
+
+    def put_mineral(self, name, mineral_info):
+        """
+        put_mineral
+
+        Hands over every image of a mineral, the callback MineralPydiaCrawl calls as each mineral is written.
+
+        :param name: the name of the mineral.
+        :param mineral_info: the dictionary of mineral data built by MineralPydiaCrawl._fill_dict.
+        """
+
+        for uri in mineral_info["images"]:
+            self.put(name, uri, uri.split("/")[-1])
+
+    def close(self, metrics_path=None):
+        """
+        close
+
+        Waits for every image handed over to be downloaded or given up on, then closes the manifest and connections.
+
+        :param metrics_path: the metrics report of the downloads, if None it is written to the image dump directory.
+        :return: the number of images that could not be downloaded.
+        """
+
+        for _ in self._workers:
+            self._queue.put(None)
+        for thread in self._workers:
+            thread.join()
+
+        self._manifest.close()
+        self._pool.close()
+
+        if metrics_path is None:
+            metrics_path = os.path.join(self.img_dump_path, "metrics.json")
+        _METRICS.write(metrics_path)
+        _METRICS.close()
+        log("Download metrics have been written to the following path: " + os.path.abspath(metrics_path))
+
+        return self.fetcher.dead_letters.count
+
+    def _work(self):
+        """
+        _work
+
+        Downloads images from the queue until told to stop. Any error is logged and the image skipped, a worker never
+        stops early, so a producer blocked on a full queue is always let through again.
+        """
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            uri, filename, names = item
+            host = urlparse(uri).netloc
+
+            with self._lock:
+                if host not in self._host_limits:
+                    self._host_limits[host] = threading.BoundedSemaphore(self._per_host)
+
+            with self._host_limits[host]:
+                try:
+                    download_image(
+                        uri, filename, names, self.img_dump_path, self._manifest, self._pool, self.fetcher
+                    )
+                except Exception as e:
+                    log("Encountered unexpected error on image " + filename + ": " + repr(e), level=ERROR, uri=uri)
+                    _METRICS.count("errors")
+
+            with self._lock:
+                self.done += 1
+
+
 # logging
-def log(log_string, exit_code=None):
+def log(log_string, exit_code=None, level=INFO, **fields):
     """
     log
 
@@ -102,26 +661,17 @@ def log(log_string, exit_code=None):
 
     :param log_string: the string to be dumped to log file
     :param exit_code: allows us to log an exit code and exit with that code, logs both errors and successes
+    :param level: the level of the message
+    :param fields: extra fields written with the message when logging JSON
     """
 
-    # append to log
-    with open("MineralPydiaImageWrangle.log", "a") as file:
-
-        # log a string with no exit code
-        file.write(
-            "[" + datetime.now().isoformat() + "]>" + log_string.strip().replace("\n", "\n\t") + "\n"
-        )
-
-        # if an exit code is provided we can log that exit code and exit using that code
-        if exit_code is not None:
-            file.write(
-                "[" + datetime.now().isoformat() + "]> The program exited with exit code: " + str(exit_code) + "\n"
-            )
-
-            file.close()
-            exit(exit_code)
+    _LOGGER.log(log_string, level, **fields)
 
-        file.close()
+    # if an exit code is provided we can log that exit code and exit using that code
+    if exit_code is not None:
+        _LOGGER.log("The program exited with exit code: " + str(exit_code), ERROR if exit_code else INFO)
+        _LOGGER.close()
+        exit(exit_code)
 
 
 def main():
@@ -130,7 +680,10 @@ def main():
 
     Initializes the downloads.
     """
-    mineral_pydia_image_wrangler(CSV_PATH, IMG_DUMP_PATH)
+    mineral_pydia_image_wrangler(
+        CSV_PATH, IMG_DUMP_PATH, WORKERS, PER_HOST, MANIFEST_PATH, POOL_SIZE, METRICS, METRICS_PORT, STORE, LINKS,
+        SHARDS, RATE_LIMIT, ADAPTIVE, RETRIES, DEAD_LETTERS, CHANGESET
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,246 @@
+"""
+MineralPydiaLog.py
+
+Logging shared by MineralPydiaCrawl.py and MineralPydiaImageWrangle.py.
+
+Opening the log file, writing one line and closing it again for every message costs a few system calls per message,
+which adds up to tens of thousands of file opens over a full crawl and download. Logger instead hands each message to
+a background thread which keeps the file open and writes messages in batches, flushing them every FLUSH_INTERVAL
+seconds or every BATCH_SIZE messages, whichever comes first.
+
+Messages have a level and can be written either in the existing text format:
+    [<timestamp> @ <url>]> <message>
+or as one JSON object per line with the timestamp, level, url, message and any extra fields.
+"""
+
+# background writing
+import threading
+import atexit
+import queue
+import json
+import time
+
+# timestamps
+from datetime import datetime
+
+
+# log levels
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+
+# output formats
+TEXT = "text"
+JSON = "json"
+
+# the writer flushes at least every FLUSH_INTERVAL seconds, or as soon as BATCH_SIZE messages are waiting
+FLUSH_INTERVAL = 0.5
+BATCH_SIZE = 256
+
+# every logger that has been started, closed when the interpreter exits so nothing queued is lost
+_loggers = []
+
+# every logger that has been created, reconfigured together by configure
+_created = []
+
+
+# class Logger
+class Logger:
+    """
+    Logger
+
+    Buffered logger writing to a single file from a background thread. The thread is only started when the first
+    message is logged, so creating a Logger is cheap.
+    """
+
+    def __init__(self, path, level=INFO, output_format=TEXT, flush_interval=FLUSH_INTERVAL, batch_size=BATCH_SIZE):
+        """
+        __init__
+
+        :param path: the log file, appended to.
+        :param level: the lowest level written, one of the level constants or its name.
+        :param output_format: TEXT or JSON.
+        :param flush_interval: the most seconds a message waits before being written.
+        :param batch_size: the number of waiting messages that triggers an early write.
+        """
+
+        self.path = path
+        self.level = LEVELS.get(level, level)
+        self._format = output_format
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        _created.append(self)
+
+    def log(self, message, level=INFO, url=None, **fields):
+        """
+        log
+
+        Queues a message. The timestamp is taken now, not when the message is written.
+
+        :param message: the message.
+        :param level: the level of the message.
+        :param url: the url the message is about, if any.
+        :param fields: extra fields, only written in the JSON format.
+        """
+
+        if level < self.level:
+            return
+
+        line = self._render(datetime.now().isoformat(), message, level, url, fields)
+
+        # under the lock a close cannot stop the writer between starting it and queueing the line
+        with self._lock:
+            self._start()
+            self._queue.put(line)
+
+    def _render(self, timestamp, message, level, url, fields):
+        """
+        _render
+
+        Renders one message as a line of the log.
+
+        :return: the line, ending in a newline.
+        """
+
+        if self._format == JSON:
+            record = {"time": timestamp, "level": _level_name(level), "message": message.strip()}
+            if url is not None:
+                record["url"] = url
+            record.update(fields)
+            return json.dumps(record, default=str) + "\n"
+
+        return (
+            "[" + timestamp + ("" if url is None else " @ " + url) + "]> "
+            + message.strip().replace("\n", "\n\t") + "\n"
+        )
+
+    def _start(self):
+        """
+        _start
+
+        Starts the writer thread if it has not been started yet, called with the lock held.
+        """
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._write, name="log-writer", daemon=True)
+            self._thread.start()
+            _loggers.append(self)
+
+    def _write(self):
+        """
+        _write
+
+        Body of the writer thread. Lines are collected from the queue and written together, a threading.Event in the
+        queue is set once everything before it is on disk, and None stops the thread.
+        """
+
+        with open(self.path, "a", encoding="utf-8") as file:
+            while True:
+                lines = []
+                waiters = []
+                stop = False
+                deadline = time.monotonic() + self._flush_interval
+
+                # collect until the interval runs out, the batch is full, or someone is waiting on a flush
+                while len(lines) < self._batch_size and not waiters and not stop:
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+
+                    if item is None:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        lines.append(item)
+
+                if lines:
+                    file.write("".join(lines))
+                    file.flush()
+
+                for waiter in waiters:
+                    waiter.set()
+
+                if stop:
+                    return
+
+    def flush(self):
+        """
+        flush
+
+        Blocks until every message logged so far has been written.
+        """
+
+        # the event is queued under the lock, so it cannot land after the None of a close and never be set
+        done = threading.Event()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                return
+            self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        """
+        close
+
+        Writes every waiting message and stops the writer thread. Messages logged afterwards start it again.
+        """
+
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+
+            self._queue.put(None)
+            thread.join()
+            self._thread = None
+
+
+# sets the level and format of every logger
+def configure(level=None, output_format=None):
+    """
+    configure
+
+    Sets the level and format of every logger created so far, e.g. the loggers the programs create when they are
+    imported, so they can be configured without editing their LOG_LEVEL and LOG_FORMAT.
+
+    :param level: the lowest level written, one of the level constants or its name, None to leave it as it is.
+    :param output_format: TEXT or JSON, None to leave it as it is.
+    """
+
+    for logger in _created:
+        if level is not None:
+            logger.level = LEVELS.get(level, level)
+        if output_format is not None:
+            logger._format = output_format
+
+
+# name of a level
+def _level_name(level):
+    """
+    _level_name
+
+    :param level: a level constant.
+    :return: the name of the level.
+    """
+
+    for name, value in LEVELS.items():
+        if value == level:
+            return name
+
+    return str(level)
+
+
+# closes every logger when the interpreter exits
+@atexit.register
+def _close_all():
+    for logger in list(_loggers):
+        logger.close()
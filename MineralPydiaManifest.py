@@ -0,0 +1,143 @@
+"""
+MineralPydiaManifest.py
+
+Persistent record of every image MineralPydiaImageWrangle.py has attempted to download. Each image is stored with
+its URI, filename, byte size, SHA-256 content hash, and status, so that a rerun can skip images that are already
+complete and resume ones that were cut off part way through.
+
+The manifest is a small SQLite database which lives in the image dump directory by default.
+"""
+
+# storage
+import sqlite3
+import threading
+import os
+
+# timestamps
+from datetime import datetime
+
+
+# default name of the manifest inside the image dump directory
+MANIFEST_NAME = "manifest.sqlite"
+
+# image statuses
+PARTIAL = "partial"
+COMPLETE = "complete"
+FAILED = "failed"
+
+
+# class ImageManifest
+class ImageManifest:
+    """
+    ImageManifest
+
+    Thread safe wrapper around the manifest database.
+    """
+
+    def __init__(self, path):
+        """
+        __init__
+
+        Opens the manifest, creating it if it does not already exist.
+
+        :param path: path of the manifest database.
+        """
+
+        self._path = path
+
+        # a single connection shared by all download threads, every access goes through the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            "filename TEXT PRIMARY KEY, "
+            "uri TEXT NOT NULL, "
+            "size INTEGER, "
+            "sha256 TEXT, "
+            "status TEXT NOT NULL, "
+            "updated TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, filename):
+        """
+        get
+
+        Looks up the record of an image.
+
+        :param filename: the filename of the image.
+        :return: a dictionary with the uri, size, sha256 and status of the image or None if it has never been seen.
+        """
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT uri, size, sha256, status FROM images WHERE filename = ?", (filename,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return {"uri": row[0], "size": row[1], "sha256": row[2], "status": row[3]}
+
+    def is_complete(self, filename, path):
+        """
+        is_complete
+
+        Checks if an image has already been downloaded in full. The manifest must say so and the file on disk must
+        still be the size that was recorded.
+
+        :param filename: the filename of the image.
+        :param path: the path of the downloaded image.
+        :return: True if the image does not need to be downloaded again.
+        """
+
+        record = self.get(filename)
+        if record is None or record["status"] != COMPLETE:
+            return False
+
+        return os.path.isfile(path) and os.path.getsize(path) == record["size"]
+
+    def mark(self, filename, uri, status, size=None, sha256=None):
+        """
+        mark
+
+        Records the current state of an image, replacing any earlier record.
+
+        :param filename: the filename of the image.
+        :param uri: the uri the image is downloaded from.
+        :param status: one of PARTIAL, COMPLETE or FAILED.
+        :param size: the size of the image in bytes, if known.
+        :param sha256: the hex SHA-256 of the image, if known.
+        """
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (filename, uri, size, sha256, status, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (filename, uri, size, sha256, status, datetime.now().isoformat())
+            )
+            self._conn.commit()
+
+    def counts(self):
+        """
+        counts
+
+        Counts the images in each status.
+
+        :return: a dictionary of status to number of images.
+        """
+
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM images GROUP BY status").fetchall()
+
+        return dict(rows)
+
+    def close(self):
+        """
+        close
+
+        Closes the manifest.
+        """
+
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,237 @@
+"""
+MineralPydiaMetrics.py
+
+Timing and counting of the hot paths in MineralPydiaCrawl.py and MineralPydiaImageWrangle.py.
+
+Every stage of a run (fetching a page, waiting on the browser, extracting fields, redrawing the progress bar, resolving
+a host, connecting, transferring an image, ...) is timed, and events (pages, minerals, bytes, retries, ...) are
+counted. At the end of a run the report is written as JSON with the count, total, mean, p50, p95, p99 and maximum
+seconds of every stage and the total and per second rate of every counter. While a run is going the same numbers can
+be served in the Prometheus text format from a local port.
+"""
+
+# timing
+from contextlib import contextmanager
+import threading
+import time
+import json
+import math
+
+# timestamps
+from datetime import datetime
+
+
+# quantiles given for every stage
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+# class Metrics
+class Metrics:
+    """
+    Metrics
+
+    Thread safe stage timers and counters for one run.
+    """
+
+    def __init__(self, namespace):
+        """
+        __init__
+
+        :param namespace: prefix of every metric name on the live endpoint, e.g. mineralpydia_crawl.
+        """
+
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._server = None
+        self.reset()
+
+    def reset(self):
+        """
+        reset
+
+        Forgets everything recorded so far and restarts the clock of the run.
+        """
+
+        with self._lock:
+            self._started = datetime.now().isoformat()
+            self._start = time.perf_counter()
+            self._stages = dict()
+            self._counters = dict()
+
+    @contextmanager
+    def time(self, stage):
+        """
+        time
+
+        Times the body of a with statement as one sample of a stage, whether or not it raises.
+
+        :param stage: the name of the stage.
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        """
+        observe
+
+        Records one sample of a stage.
+
+        :param stage: the name of the stage.
+        :param seconds: how long the stage took.
+        """
+
+        with self._lock:
+            self._stages.setdefault(stage, []).append(seconds)
+
+    def count(self, name, amount=1):
+        """
+        count
+
+        Adds to a counter.
+
+        :param name: the name of the counter.
+        :param amount: how much to add.
+        """
+
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def report(self):
+        """
+        report
+
+        :return: a JSON serializable dictionary of every stage's timings and every counter's total and rate.
+        """
+
+        with self._lock:
+            elapsed = time.perf_counter() - self._start
+            stages = dict((stage, sorted(samples)) for stage, samples in self._stages.items())
+            counters = dict(self._counters)
+
+        return {
+            "started": self._started,
+            "elapsed": elapsed,
+            "stages": dict(
+                (stage, {
+                    "count": len(samples),
+                    "total": sum(samples),
+                    "mean": sum(samples) / len(samples),
+                    "p50": _quantile(samples, 0.5),
+                    "p95": _quantile(samples, 0.95),
+                    "p99": _quantile(samples, 0.99),
+                    "max": samples[-1]
+                })
+                for stage, samples in sorted(stages.items())
+            ),
+            "counters": dict(
+                (name, {"total": total, "per_second": total / elapsed if elapsed > 0 else 0.0})
+                for name, total in sorted(counters.items())
+            )
+        }
+
+    def write(self, path):
+        """
+        write
+
+        Writes the report as JSON.
+
+        :param path: the path of the report.
+        """
+
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.report(), file, indent=4)
+
+    def prometheus(self):
+        """
+        prometheus
+
+        :return: the report in the Prometheus text exposition format.
+        """
+
+        report = self.report()
+        stage_name = self.namespace + "_stage_seconds"
+        lines = ["# TYPE " + stage_name + " summary"]
+
+        for stage, timings in report["stages"].items():
+            for quantile in QUANTILES:
+                lines.append(
+                    stage_name + '{stage="' + stage + '",quantile="' + str(quantile) + '"} '
+                    + repr(timings["p" + str(round(quantile * 100))])
+                )
+            lines.append(stage_name + '_sum{stage="' + stage + '"} ' + repr(timings["total"]))
+            lines.append(stage_name + '_count{stage="' + stage + '"} ' + str(timings["count"]))
+
+        for name, counter in report["counters"].items():
+            lines.append("# TYPE " + self.namespace + "_" + name + "_total counter")
+            lines.append(self.namespace + "_" + name + "_total " + repr(counter["total"]))
+
+        lines.append("# TYPE " + self.namespace + "_elapsed_seconds gauge")
+        lines.append(self.namespace + "_elapsed_seconds " + repr(report["elapsed"]))
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port):
+        """
+        serve
+
+        Serves the live metrics at http://127.0.0.1:<port>/metrics from a background thread until close is called.
+
+        :param port: the local port to listen on.
+        """
+
+        # the http server is only imported when the live endpoint is asked for
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # the endpoint is scraped often, keep it out of the console
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", int(port)), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-endpoint", daemon=True).start()
+
+    def close(self):
+        """
+        close
+
+        Stops serving the live metrics, if they are being served.
+        """
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# quantile of sorted samples
+def _quantile(samples, quantile):
+    """
+    _quantile
+
+    :param samples: the samples, sorted.
+    :param quantile: the quantile wanted, between 0 and 1.
+    :return: the nearest rank quantile of the samples.
+    """
+
+    return samples[max(0, min(len(samples) - 1, math.ceil(quantile * len(samples)) - 1))]
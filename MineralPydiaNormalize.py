@@ -0,0 +1,319 @@
+"""
+MineralPydiaNormalize.py
+
+Normalization of the table collected by MineralPydiaCrawl.py, run after the crawl over the whole table at once.
+
+The crawl keeps every descriptor as the text the page showed. This stage turns them into columns that can be used
+directly:
+    hardness_min, hardness_max, hardness_mean - parsed from the columnar tables' hardness_text such as "2-2.5", or
+                                                from the crawl's hardness number for a csv, which does not keep the
+                                                text, NaN where the hardness is not a valid number or range
+    crystal_system                            - the class column mapped onto one of CRYSTAL_SYSTEMS as a categorical,
+                                                e.g. "cubic" and "Isometric" are both Isometric
+    fracture                                  - the cleaned fracture as a categorical
+and tokenizes the multi-valued habit, color and streak columns (e.g. "lead gray, gray, iron black") into long tables
+of (row, token) with the token as a categorical, one row per token of every mineral.
+
+Every step is vectorized with pandas and NumPy. The descriptors repeat heavily (the crawl output repeats each mineral
+on every image row, and many minerals share values), so each column is factorized first, only its distinct values are
+parsed, and the results are spread back over the rows with NumPy indexing.
+"""
+
+# normalization
+import numpy as np
+import pandas as pd
+import warnings
+
+# logging
+import time
+import os
+
+
+"""
+ENVIRONMENT VARIABLES
+
+CSV_PATH - the crawl output to normalize, either the csv or a .parquet/.feather output.
+OUTPUT_PATH - the normalized table. The token tables are written next to it, e.g. OUTPUT_PATH with .parquet replaced
+              by .habit.parquet. Written as parquet or feather by its extension, otherwise as csv.
+"""
+CSV_PATH = "./MineralPydiaCrawlData.csv"
+OUTPUT_PATH = "./MineralPydiaCrawlData.normalized.csv"
+
+# crystal systems, in order of increasing symmetry
+CRYSTAL_SYSTEMS = [
+    "Triclinic", "Monoclinic", "Orthorhombic", "Tetragonal", "Trigonal", "Hexagonal", "Isometric", "Amorphous"
+]
+
+# other names the crawled crystal systems are written under, case folded
+CRYSTAL_SYSTEM_ALIASES = {
+    "cubic": "Isometric",
+    "rhombohedral": "Trigonal",
+    "no crystals": "Amorphous",
+    "none": "Amorphous"
+}
+
+# columns tokenized into long tables
+TOKEN_FIELDS = ["habit", "color", "streak"]
+
+# a hardness is a number or a range of numbers, e.g. 2-2.5, the same pattern the crawler checks
+HARDNESS_PATTERN = r"[0-9]+(?:\.[0-9]+)*(?:-[0-9]+(?:\.[0-9]+)*)*"
+
+
+# normalizes a table
+def normalize(minerals):
+    """
+    normalize
+
+    Normalizes the scalar columns of a table of minerals.
+
+    :param minerals: a pandas DataFrame with the crawl's columns, either one row per mineral or one row per image.
+    :return: a DataFrame with the same index holding the name, hardness_min, hardness_max, hardness_mean,
+             crystal_system and fracture columns.
+    """
+
+    table = pd.DataFrame({"name": _clean(minerals["name"])}, index=minerals.index)
+
+    # the hardness as the page gave it keeps the range, the averaged number is only used where there is no text
+    hardness = parse_hardness(minerals["hardness"])
+    if "hardness_text" in minerals.columns:
+        hardness = parse_hardness(minerals["hardness_text"]).fillna(hardness)
+    for column in hardness.columns:
+        table[column] = hardness[column]
+
+    table["crystal_system"] = canonical_crystal_system(minerals["class"])
+    table["fracture"] = _clean(minerals["fracture"]).astype("category")
+
+    return table
+
+
+# parses hardness
+def parse_hardness(hardness):
+    """
+    parse_hardness
+
+    Parses hardness text such as "2-2.5" into the smallest, largest and mean value of the range. Numbers, such as the
+    averaged hardness in the crawl output, are their own minimum, maximum and mean.
+
+    :param hardness: a pandas Series of hardness text or numbers.
+    :return: a DataFrame with the same index holding the hardness_min, hardness_max and hardness_mean columns.
+    """
+
+    if pd.api.types.is_numeric_dtype(hardness):
+        values = hardness.to_numpy(dtype=float)
+        return pd.DataFrame(
+            {"hardness_min": values, "hardness_max": values, "hardness_mean": values}, index=hardness.index
+        )
+
+    codes, uniques = pd.factorize(hardness)
+    if len(uniques) == 0:
+        return pd.DataFrame(
+            np.nan, index=hardness.index, columns=["hardness_min", "hardness_max", "hardness_mean"]
+        )
+
+    text = pd.Series(uniques, dtype=object).astype(str).str.replace("\xa0", "", regex=False).str.strip()
+
+    # every part of the range becomes a column, invalid text is dropped before converting
+    parts = text.where(text.str.fullmatch(HARDNESS_PATTERN)).str.split("-", expand=True)
+    parts = parts.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+
+    # the empty parts of shorter ranges are NaN and left out, rows with no parts at all stay NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        parsed = np.column_stack([np.nanmin(parts, axis=1), np.nanmax(parts, axis=1), np.nanmean(parts, axis=1)])
+
+    return pd.DataFrame(
+        _take(parsed, codes), index=hardness.index, columns=["hardness_min", "hardness_max", "hardness_mean"]
+    )
+
+
+# canonicalizes crystal systems
+def canonical_crystal_system(systems):
+    """
+    canonical_crystal_system
+
+    Maps crystal systems onto CRYSTAL_SYSTEMS, ignoring case, spacing and known aliases.
+
+    :param systems: a pandas Series of crystal systems.
+    :return: a categorical Series with the same index, NaN where the crystal system is not known.
+    """
+
+    codes, uniques = pd.factorize(_clean(systems))
+    text = pd.Series(uniques, dtype=object).str.casefold()
+
+    lookup = dict((system.casefold(), system) for system in CRYSTAL_SYSTEMS)
+    lookup.update(CRYSTAL_SYSTEM_ALIASES)
+    canonical = pd.Categorical(text.map(lookup), categories=CRYSTAL_SYSTEMS)
+
+    # code -1 is a missing value, which stays missing
+    return pd.Series(
+        pd.Categorical.from_codes(np.where(codes < 0, -1, canonical.codes[codes]), categories=CRYSTAL_SYSTEMS),
+        index=systems.index, name="crystal_system"
+    )
+
+
+# tokenizes a multi-valued column
+def tokenize(values):
+    """
+    tokenize
+
+    Splits a multi-valued column, e.g. "lead gray, gray, iron black", into its comma separated tokens, case folded with
+    spacing collapsed. A token repeated within one value is kept once.
+
+    :param values: a pandas Series of comma separated values.
+    :return: a DataFrame of one row per token of every value, with the position of the value in the Series as row and
+             the token as a categorical, in row order.
+    """
+
+    codes, uniques = pd.factorize(values)
+    if len(uniques) == 0:
+        return pd.DataFrame({"row": np.zeros(0, dtype=np.intp), "token": pd.Categorical([])})
+
+    # tokenize every distinct value once
+    tokens = (
+        pd.Series(uniques, dtype=object).str.replace("\xa0", " ", regex=False).str.casefold()
+        .str.split(",").explode().str.replace(r"\s+", " ", regex=True).str.strip()
+        .rename("token").rename_axis("owner").reset_index()
+    )
+    tokens = tokens[tokens["token"].notna() & (tokens["token"] != "")].drop_duplicates()
+    token_codes, vocabulary = pd.factorize(tokens["token"], sort=True)
+
+    # the tokens of distinct value u are tokens[starts[u]:starts[u] + counts[u]]
+    owners = tokens["owner"].to_numpy(dtype=np.intp)
+    counts = np.bincount(owners, minlength=len(uniques))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    # spread over the rows, missing values (code -1) have no tokens
+    row_counts = np.where(codes < 0, 0, counts[codes])
+    rows = np.repeat(np.arange(len(codes)), row_counts)
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+    positions = starts[codes[rows]] + within
+
+    return pd.DataFrame({
+        "row": rows,
+        "token": pd.Categorical.from_codes(token_codes[positions], categories=vocabulary)
+    })
+
+
+# multi-hot matrix of tokens
+def indicators(tokens, num_rows):
+    """
+    indicators
+
+    Turns a long table of tokens into one boolean column per token.
+
+    :param tokens: a DataFrame returned by tokenize.
+    :param num_rows: the number of rows of the tokenized column.
+    :return: a boolean DataFrame of num_rows rows and one column per token of the vocabulary.
+    """
+
+    matrix = np.zeros((num_rows, len(tokens["token"].cat.categories)), dtype=bool)
+    matrix[tokens["row"].to_numpy(), tokens["token"].cat.codes.to_numpy()] = True
+
+    return pd.DataFrame(matrix, columns=tokens["token"].cat.categories)
+
+
+# normalizes a crawl output
+def normalize_output(csv_path, output_path):
+    """
+    normalize_output
+
+    Normalizes the minerals of a crawl output and writes the normalized table and one token table per TOKEN_FIELDS.
+
+    :param csv_path: the path of the csv, or of the parquet or feather output, to read from.
+    :param output_path: the path of the normalized table, the token tables are written next to it.
+    :return: a dictionary of the path of every table written.
+    """
+
+    from MineralPydiaOutput import read_minerals
+
+    minerals = read_minerals(csv_path)
+    table = normalize(minerals)
+
+    stem, extension = os.path.splitext(output_path)
+    written = {"minerals": output_path}
+    _write_table(table, output_path)
+
+    for field in TOKEN_FIELDS:
+        tokens = tokenize(minerals[field])
+        tokens.insert(1, "name", table["name"].to_numpy()[tokens["row"].to_numpy()])
+        written[field] = stem + "." + field + extension
+        _write_table(tokens, written[field])
+
+    return written
+
+
+# writes a table by its extension
+def _write_table(table, path):
+    """
+    _write_table
+
+    :param table: the DataFrame.
+    :param path: the path, written as parquet or feather by its extension, otherwise as csv.
+    """
+
+    extension = os.path.splitext(path)[1]
+
+    if extension == ".parquet":
+        table.to_parquet(path, index=False)
+    elif extension == ".feather":
+        table.reset_index(drop=True).to_feather(path)
+    else:
+        table.to_csv(path, index=False)
+
+
+# strips a text column
+def _clean(values):
+    """
+    _clean
+
+    :param values: a pandas Series of text.
+    :return: the text without \xa0 and with spacing collapsed, empty text is missing.
+    """
+
+    codes, uniques = pd.factorize(values)
+    text = pd.Series(uniques, dtype=object).str.replace("\xa0", " ", regex=False)
+    text = text.str.replace(r"\s+", " ", regex=True).str.strip()
+    text = text.where(text != "", None).to_numpy(dtype=object)
+
+    cleaned = np.full(len(codes), None, dtype=object)
+    cleaned[codes >= 0] = text[codes[codes >= 0]]
+
+    return pd.Series(cleaned, index=values.index, dtype=object)
+
+
+# spreads the rows of distinct values over every row
+def _take(parsed, codes):
+    """
+    _take
+
+    :param parsed: a 2-D array of one row per distinct value.
+    :param codes: the code of every row's distinct value, -1 for missing, with at least one distinct value.
+    :return: a 2-D array of one row per row, NaN for missing.
+    """
+
+    taken = parsed[np.maximum(codes, 0)]
+    taken[codes < 0] = np.nan
+
+    return taken
+
+
+def main():
+    """
+    main
+
+    Normalizes the crawl output with the given environment variables.
+    """
+
+    start = time.perf_counter()
+    written = normalize_output(CSV_PATH, OUTPUT_PATH)
+    print(
+        "Normalized " + os.path.abspath(CSV_PATH) + " in " + format(time.perf_counter() - start, ".2f")
+        + " seconds, wrote " + ", ".join(os.path.abspath(path) for path in written.values())
+    )
+
+
+if __name__ == "__main__":
+    """
+    Executes main if not being imported.
+    """
+    main()
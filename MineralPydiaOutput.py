@@ -0,0 +1,344 @@
+"""
+MineralPydiaOutput.py
+
+Writers used by MineralPydiaCrawl.py to stream mineral data to the output file as each mineral is scraped, rather
+than holding the whole crawl in memory and writing it out at the end.
+
+CsvOutput writes exactly what pandas.DataFrame.to_csv(index=False) used to write: one row per image uri, with the
+mineral's data repeated on every row.
+
+ColumnarOutput instead writes two normalized tables, a minerals table with one row per mineral and an images table
+with one row per image uri keyed on the mineral's name, in Parquet or Feather. Repeated text (class, fracture and the
+mineral name of each image) is dictionary encoded. Next to the averaged hardness the minerals table also keeps the
+hardness as the page gave it, e.g. "2-2.5", in hardness_text. The columnar formats need pyarrow.
+"""
+
+# output
+import csv
+import os
+
+# pyarrow is only needed for the columnar formats, it is imported when one is opened so the csv does not pay for it
+pa = pq = feather = None
+
+
+# output formats
+CSV = "csv"
+PARQUET = "parquet"
+FEATHER = "feather"
+FORMATS = (CSV, PARQUET, FEATHER)
+
+# columns of the csv, in order
+COLUMNS = ["name", "habit", "color", "streak", "class", "fracture", "hardness", "image_uri", "image_name"]
+
+# columns of the normalized tables, in order
+# the csv and tables written before hardness_text was kept do not have it, it is read back as missing
+MINERAL_COLUMNS = ["name", "habit", "color", "streak", "class", "fracture", "hardness", "hardness_text"]
+IMAGE_COLUMNS = ["name", "image_uri", "image_name"]
+
+# rows are pushed to the operating system every FLUSH_EVERY minerals and to disk every FSYNC_EVERY minerals
+FLUSH_EVERY = 10
+FSYNC_EVERY = 100
+
+
+# flattens a mineral into rows
+def mineral_rows(name, mineral_info):
+    """
+    mineral_rows
+
+    Flattens a mineral into one row per image uri.
+
+    :param name: the name of the mineral.
+    :param mineral_info: the dictionary of mineral data built by MineralPydiaCrawl._fill_dict.
+    :return: a list of rows in COLUMNS order.
+    """
+
+    return [
+        [
+            name,
+            mineral_info["habit"],
+            mineral_info["color"],
+            mineral_info["streak"],
+            mineral_info["class"],
+            mineral_info["fracture"],
+            mineral_info["hardness"],
+            url,
+            url.split("/")[-1]
+        ]
+        for url in mineral_info["images"]
+    ]
+
+
+# class CsvOutput
+class CsvOutput:
+    """
+    CsvOutput
+
+    Streams minerals to a csv. The header is written as soon as the output is opened and every mineral's rows are
+    written as soon as they are handed over, so a crash part way through a crawl keeps every mineral written before it.
+    """
+
+    def __init__(self, path, flush_every=FLUSH_EVERY, fsync_every=FSYNC_EVERY):
+        """
+        __init__
+
+        Opens the csv, replacing anything already there, and writes the header.
+
+        :param path: the path of the csv.
+        :param flush_every: the number of minerals between flushes.
+        :param fsync_every: the number of minerals between fsync checkpoints.
+        """
+
+        self.path = path
+        self._flush_every = max(1, flush_every)
+        self._fsync_every = max(1, fsync_every)
+        self._minerals = 0
+
+        # the same dialect pandas uses for to_csv
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file, lineterminator=os.linesep)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, name, mineral_info):
+        """
+        write
+
+        Writes the rows of one mineral.
+
+        :param name: the name of the mineral.
+        :param mineral_info: the dictionary of mineral data built by MineralPydiaCrawl._fill_dict.
+        """
+
+        # hardness is written the way pandas writes a float column
+        rows = mineral_rows(name, mineral_info)
+        for row in rows:
+            row[6] = repr(float(row[6]))
+
+        self._writer.writerows(rows)
+        self._minerals += 1
+
+        if self._minerals % self._fsync_every == 0:
+            self.checkpoint()
+        elif self._minerals % self._flush_every == 0:
+            self._file.flush()
+
+    def checkpoint(self):
+        """
+        checkpoint
+
+        Flushes everything written so far and forces it to disk.
+        """
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        """
+        close
+
+        Checkpoints and closes the csv.
+        """
+
+        if self._file.closed:
+            return
+
+        self.checkpoint()
+        self._file.close()
+
+
+# paths of the normalized tables
+def table_paths(path):
+    """
+    table_paths
+
+    Gets the paths of the minerals and images tables written for an output path, e.g. MineralPydiaCrawlData.parquet
+    is written as MineralPydiaCrawlData.minerals.parquet and MineralPydiaCrawlData.images.parquet.
+
+    :param path: the output path, ending in .parquet or .feather.
+    :return: a tuple of the minerals table path and the images table path.
+    """
+
+    stem, extension = os.path.splitext(path)
+    return stem + ".minerals" + extension, stem + ".images" + extension
+
+
+# class ColumnarOutput
+class ColumnarOutput:
+    """
+    ColumnarOutput
+
+    Collects minerals into a normalized minerals table and images table and writes both in a columnar format when
+    closed. The columnar formats only become readable once their footer is written, so unlike CsvOutput nothing is on
+    disk until the crawl finishes, the columns are small enough to hold until then.
+    """
+
+    def __init__(self, path, output_format):
+        """
+        __init__
+
+        :param path: the output path, the tables are written next to it as given by table_paths.
+        :param output_format: PARQUET or FEATHER.
+        """
+
+        global pa, pq, feather
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            import pyarrow.feather as feather
+        except ImportError:
+            raise ImportError("pyarrow is required to write " + output_format + " output")
+
+        self.path = path
+        self._format = output_format
+        self._minerals = dict((column, []) for column in MINERAL_COLUMNS)
+        self._images = dict((column, []) for column in IMAGE_COLUMNS)
+        self._closed = False
+
+    def write(self, name, mineral_info):
+        """
+        write
+
+        Adds one mineral and its images to the tables.
+
+        :param name: the name of the mineral.
+        :param mineral_info: the dictionary of mineral data built by MineralPydiaCrawl._fill_dict.
+        """
+
+        self._minerals["name"].append(name)
+        for column in MINERAL_COLUMNS[1:]:
+            self._minerals[column].append(mineral_info.get(column))
+        self._minerals["hardness"][-1] = float(mineral_info["hardness"])
+
+        for url in mineral_info["images"]:
+            self._images["name"].append(name)
+            self._images["image_uri"].append(url)
+            self._images["image_name"].append(url.split("/")[-1])
+
+    def checkpoint(self):
+        """
+        checkpoint
+
+        Nothing is written before the tables are closed.
+        """
+
+    def close(self):
+        """
+        close
+
+        Writes both tables.
+        """
+
+        if self._closed:
+            return
+        self._closed = True
+
+        dictionary = pa.dictionary(pa.int32(), pa.string())
+        minerals = pa.table({
+            "name": pa.array(self._minerals["name"], pa.string()),
+            "habit": pa.array(self._minerals["habit"], pa.string()),
+            "color": pa.array(self._minerals["color"], pa.string()),
+            "streak": pa.array(self._minerals["streak"], pa.string()),
+            "class": pa.array(self._minerals["class"], pa.string()).dictionary_encode().cast(dictionary),
+            "fracture": pa.array(self._minerals["fracture"], pa.string()).dictionary_encode().cast(dictionary),
+            "hardness": pa.array(self._minerals["hardness"], pa.float64()),
+            "hardness_text": pa.array(self._minerals["hardness_text"], pa.string())
+        })
+        images = pa.table({
+            "name": pa.array(self._images["name"], pa.string()).dictionary_encode().cast(dictionary),
+            "image_uri": pa.array(self._images["image_uri"], pa.string()),
+            "image_name": pa.array(self._images["image_name"], pa.string())
+        })
+
+        minerals_path, images_path = table_paths(self.path)
+        if self._format == PARQUET:
+            pq.write_table(minerals, minerals_path)
+            pq.write_table(images, images_path)
+        else:
+            feather.write_feather(minerals, minerals_path)
+            feather.write_feather(images, images_path)
+
+
+# opens an output
+def open_output(path, output_format=CSV):
+    """
+    open_output
+
+    Opens the writer for an output format.
+
+    :param path: the output path.
+    :param output_format: one of FORMATS.
+    :return: a CsvOutput or ColumnarOutput.
+    """
+
+    if output_format == CSV:
+        return CsvOutput(path)
+
+    return ColumnarOutput(path, output_format)
+
+
+# reads the image columns of an output
+def read_images(path):
+    """
+    read_images
+
+    Reads only the mineral name, image uri and image name columns of a crawl's output. Columnar outputs only read
+    the images table, and a csv only parses those three columns.
+
+    :param path: a csv, a .parquet or .feather output path, or the images table itself.
+    :return: a pandas DataFrame with the name, image_uri and image_name columns.
+    """
+
+    # pandas is only needed by the readers, the crawler does not pay for importing it
+    import pandas as pd
+
+    columns = ["name", "image_uri", "image_name"]
+    extension = os.path.splitext(path)[1]
+
+    if extension not in (".parquet", ".feather"):
+        return pd.read_csv(path, usecols=columns)[columns]
+
+    if not os.path.splitext(os.path.splitext(path)[0])[1] == ".images":
+        path = table_paths(path)[1]
+
+    if extension == ".parquet":
+        return pd.read_parquet(path, columns=columns)
+
+    return pd.read_feather(path, columns=columns)
+
+
+# reads the mineral columns of an output
+def read_minerals(path):
+    """
+    read_minerals
+
+    Reads one row per mineral of a crawl's output. Columnar outputs only read the minerals table, and a csv only parses
+    the mineral columns and keeps the first row of every mineral.
+
+    :param path: a csv, a .parquet or .feather output path, or the minerals table itself.
+    :return: a pandas DataFrame with the MINERAL_COLUMNS columns, a column the output does not have is missing.
+    """
+
+    # pandas is only needed by the readers, the crawler does not pay for importing it
+    import pandas as pd
+
+    extension = os.path.splitext(path)[1]
+
+    if extension not in (".parquet", ".feather"):
+        # hardness_text is text even where every hardness is a whole number
+        minerals = pd.read_csv(path, usecols=lambda column: column in MINERAL_COLUMNS, dtype={"hardness_text": str})
+        return minerals.reindex(columns=MINERAL_COLUMNS).drop_duplicates("name", ignore_index=True)
+
+    if not os.path.splitext(os.path.splitext(path)[0])[1] == ".minerals":
+        path = table_paths(path)[0]
+
+    # only the columns the table has are read, older tables do not have every one
+    import pyarrow
+    if extension == ".parquet":
+        import pyarrow.parquet
+        columns = [column for column in MINERAL_COLUMNS if column in pyarrow.parquet.read_schema(path).names]
+        return pd.read_parquet(path, columns=columns).reindex(columns=MINERAL_COLUMNS)
+
+    import pyarrow.ipc
+    with pyarrow.memory_map(path) as source:
+        names = pyarrow.ipc.open_file(source).schema.names
+    columns = [column for column in MINERAL_COLUMNS if column in names]
+    return pd.read_feather(path, columns=columns).reindex(columns=MINERAL_COLUMNS)
@@ -0,0 +1,338 @@
+"""
+MineralPydiaParse.py
+
+HTML extraction used by the HTTP crawl engine in MineralPydiaCrawl.py.
+
+Pages are parsed with the standard library's html.parser into a small element tree, which is then searched for the
+same things the Selenium engine asks the browser for:
+    * Listing pages - the anchors matched by "div.block-title h2 a", and the "?page=" links of the pager
+    * Mineral pages - the dt/dd descriptor pairs and the anchors matched by "a.catalog-thumb"
+
+Everything here works on plain strings, so saved pages can be parsed without a network connection or a browser.
+"""
+
+# parsing
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse, parse_qs
+import re
+
+
+# elements that never have children
+_VOID = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"
+}
+
+# elements whose start tag implicitly closes an open element of the listed kinds
+_CLOSES = {
+    "dt": {"dt", "dd"},
+    "dd": {"dt", "dd"},
+    "li": {"li"},
+    "p": {"p"},
+    "option": {"option"},
+    "tr": {"tr", "td", "th"},
+    "td": {"td", "th"},
+    "th": {"td", "th"},
+}
+
+# elements whose text is not rendered
+_HIDDEN = {"script", "style", "template", "noscript"}
+
+# whitespace collapsed when rendering text, \xa0 is deliberately left alone just like a browser does
+_WHITESPACE = re.compile("[ \t\r\n\f]+")
+
+
+# class MissingFieldError
+class MissingFieldError(Exception):
+    """
+    MissingFieldError
+
+    Raised when a mineral page does not have a requested descriptor.
+    """
+
+
+# class Element
+class Element:
+    """
+    Element
+
+    A single element of a parsed page. Children are either Element objects or strings for text nodes.
+    """
+
+    __slots__ = ("tag", "attrs", "children", "parent")
+
+    def __init__(self, tag, attrs, parent):
+        self.tag = tag
+        self.attrs = attrs
+        self.children = []
+        self.parent = parent
+
+    def has_class(self, name):
+        """
+        has_class
+
+        :param name: a class name.
+        :return: True if the element has the class.
+        """
+
+        return name in (self.attrs.get("class") or "").split()
+
+    def iter(self, tag=None):
+        """
+        iter
+
+        Walks every descendant element in document order.
+
+        :param tag: if given only elements with this tag are returned.
+        :return: a generator of Element objects.
+        """
+
+        stack = list(reversed([c for c in self.children if isinstance(c, Element)]))
+        while stack:
+            element = stack.pop()
+            if tag is None or element.tag == tag:
+                yield element
+            stack.extend(reversed([c for c in element.children if isinstance(c, Element)]))
+
+    def own_text(self):
+        """
+        own_text
+
+        :return: a list of the text nodes that are direct children of the element.
+        """
+
+        return [c for c in self.children if isinstance(c, str)]
+
+    def inner_text(self):
+        """
+        inner_text
+
+        Approximates the browser's innerText, text is joined with runs of whitespace collapsed and <br> as a newline.
+
+        :return: the rendered text of the element.
+        """
+
+        parts = []
+        self._render(parts)
+
+        lines = [_WHITESPACE.sub(" ", line).strip(" ") for line in "".join(parts).split("\n")]
+        return "\n".join(lines).strip("\n")
+
+    def _render(self, parts):
+        for child in self.children:
+            if isinstance(child, str):
+                parts.append(child.replace("\n", " "))
+            elif child.tag == "br":
+                parts.append("\n")
+            elif child.tag not in _HIDDEN:
+                child._render(parts)
+
+    def following_siblings(self, tag):
+        """
+        following_siblings
+
+        :param tag: the tag of the siblings wanted.
+        :return: a list of the sibling elements after this one with the given tag.
+        """
+
+        if self.parent is None:
+            return []
+
+        siblings = [c for c in self.parent.children if isinstance(c, Element)]
+        return [s for s in siblings[siblings.index(self) + 1:] if s.tag == tag]
+
+
+# class _TreeBuilder
+class _TreeBuilder(HTMLParser):
+    """
+    _TreeBuilder
+
+    Builds an Element tree from a page, closing elements the way a forgiving browser would.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Element("#document", dict(), None)
+        self._open = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        closes = _CLOSES.get(tag)
+        if closes is not None and self._open[-1].tag in closes:
+            self._open.pop()
+
+        element = Element(tag, dict((k, v if v is not None else "") for k, v in attrs), self._open[-1])
+        self._open[-1].children.append(element)
+
+        if tag not in _VOID:
+            self._open.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        element = Element(tag, dict((k, v if v is not None else "") for k, v in attrs), self._open[-1])
+        self._open[-1].children.append(element)
+
+    def handle_endtag(self, tag):
+        # close up to the matching element, a stray end tag is ignored
+        for i in range(len(self._open) - 1, 0, -1):
+            if self._open[i].tag == tag:
+                del self._open[i:]
+                return
+
+    def handle_data(self, data):
+        self._open[-1].children.append(data)
+
+
+# parses a page
+def parse(html):
+    """
+    parse
+
+    Parses a page into an Element tree.
+
+    :param html: the page source.
+    :return: the root Element.
+    """
+
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+# extracts mineral urls from a listing page
+def parse_listing(html, page_url):
+    """
+    parse_listing
+
+    Finds the mineral urls on a listing page, the equivalent of "div.block-title h2 a".
+
+    :param html: the source of the listing page.
+    :param page_url: the url of the listing page, used to resolve relative links.
+    :return: a list of absolute mineral urls in page order.
+    """
+
+    urls = []
+    for div in parse(html).iter("div"):
+        if not div.has_class("block-title"):
+            continue
+
+        for h2 in div.iter("h2"):
+            for a in h2.iter("a"):
+                if "href" in a.attrs:
+                    urls.append(urljoin(page_url, a.attrs["href"]))
+
+    # nested block titles would otherwise list the same anchor twice
+    return list(dict.fromkeys(urls))
+
+
+# finds the number of listing pages
+def parse_page_count(html, page_url):
+    """
+    parse_page_count
+
+    Finds the number of listing pages from the pager of a listing page, the highest "?page=" of any link to the same
+    listing as page_url.
+
+    :param html: the source of the listing page.
+    :param page_url: the url of the listing page, used to resolve relative links.
+    :return: the number of listing pages, or None if the page has no pager.
+    """
+
+    listing = urlparse(page_url).path
+    pages = []
+    for a in parse(html).iter("a"):
+        link = urlparse(urljoin(page_url, a.attrs.get("href") or ""))
+        page = parse_qs(link.query).get("page")
+        if link.path == listing and page and page[0].isdigit():
+            pages.append(int(page[0]))
+
+    return max(pages) if pages else None
+
+
+# class MineralPage
+class MineralPage:
+    """
+    MineralPage
+
+    A parsed mineral page answering the same queries MineralPydiaCrawl makes through Selenium.
+    """
+
+    def __init__(self, html, page_url):
+        """
+        __init__
+
+        :param html: the source of the mineral page.
+        :param page_url: the url of the mineral page, used to resolve relative links.
+        """
+
+        self._root = parse(html)
+        self._page_url = page_url
+        self._dts = list(self._root.iter("dt"))
+
+    def field(self, label):
+        """
+        field
+
+        The equivalent of //dt[contains(text(), label)]/following-sibling::dd.
+
+        :param label: the text the dt must contain.
+        :return: the inner text of the first matching dd.
+        """
+
+        for dt in self._dts:
+            text = dt.own_text()
+            if text and label in text[0]:
+                dds = dt.following_siblings("dd")
+                if dds:
+                    return dds[0].inner_text()
+
+        raise MissingFieldError(label)
+
+    def field_span(self, label):
+        """
+        field_span
+
+        The equivalent of //dt[contains(text(), label)]/following-sibling::dd/span.
+
+        :param label: the text the dt must contain.
+        :return: the inner text of the first span found.
+        """
+
+        for dt in self._dts:
+            text = dt.own_text()
+            if text and label in text[0]:
+                for dd in dt.following_siblings("dd"):
+                    for span in (c for c in dd.children if isinstance(c, Element) and c.tag == "span"):
+                        return span.inner_text()
+
+        raise MissingFieldError(label)
+
+    def exact_field(self, label):
+        """
+        exact_field
+
+        The equivalent of //dt[text()=label]/following-sibling::dd.
+
+        :param label: the text the dt must equal.
+        :return: the inner text of the first matching dd.
+        """
+
+        for dt in self._dts:
+            if label in dt.own_text():
+                dds = dt.following_siblings("dd")
+                if dds:
+                    return dds[0].inner_text()
+
+        raise MissingFieldError(label)
+
+    def thumbnails(self):
+        """
+        thumbnails
+
+        The equivalent of the href of every "a.catalog-thumb".
+
+        :return: a list of absolute image uris in page order.
+        """
+
+        return [
+            urljoin(self._page_url, a.attrs["href"]) if "href" in a.attrs else None
+            for a in self._root.iter("a") if a.has_class("catalog-thumb")
+        ]
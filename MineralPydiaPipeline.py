@@ -0,0 +1,182 @@
+"""
+MineralPydiaPipeline.py
+
+Crawls Mineralpedia and downloads the mineral images in a single process, replacing running MineralPydiaCrawl.py to
+completion and only then MineralPydiaImageWrangle.py.
+
+Every mineral is handed to an ImageDownloader as soon as the crawl writes it to the output, and its images wait on a
+bounded queue for the download workers while the crawl carries on. When the downloads fall behind and the queue is
+full the crawl is held back until there is room again, so neither side runs away from the other and the wall time of a
+run is close to the longer of the crawl and the downloads rather than their sum.
+
+The crawl output, checkpoint, page cache, metrics and logs are the same as running the two programs one after the
+other, and the image dump can still be re-run or resumed with MineralPydiaImageWrangle.py alone.
+"""
+
+# crawl and downloads
+from MineralPydiaCrawl import MineralPydiaCrawl, SELENIUM
+from MineralPydiaImageWrangle import ImageDownloader, CONTENT
+
+# logging
+from MineralPydiaLog import Logger, INFO, ERROR
+import time
+import os
+
+
+"""
+ENVIRONMENT VARIABLES
+
+NUM_PAGES - the number of listing pages to crawl, "*" for all of them.
+OUTPUT - the path of the crawl output. If left None the crawler's default path is used.
+ENGINE - "selenium" to render pages in Firefox, "http" to fetch and parse them without a browser.
+CRAWL_WORKERS - the number of workers mineral pages are shared between.
+LISTING_WORKERS - the number of workers listing pages are shared between.
+CACHE_PATH - the page cache used by the http engine for incremental re-crawls. If left None pages are not cached.
+CRAWL_RATE_LIMIT - the most page requests per second made across all crawl workers. If left None requests are not
+                   limited until the site answers 429 or 503.
+IMG_DUMP_PATH - the directory to download images to, created if it does not exist.
+STORE - how images are stored, "content" by the SHA-256 of their bytes or "flat" by the last segment of their uri.
+DOWNLOAD_WORKERS - the number of images downloaded at once.
+PER_HOST - the maximum number of downloads allowed against a single host at once.
+QUEUE_SIZE - the most images waiting to be downloaded before the crawl is held back.
+IMAGE_RATE_LIMIT - the most image requests per second made against each host. If left None requests are not limited
+                   until a host answers 429 or 503.
+RETRIES - the number of times a page or image that failed to load is retried.
+LOG_LEVEL - the lowest level of message written to the log, "DEBUG", "INFO", "WARNING" or "ERROR".
+LOG_FORMAT - "text" for the plain text log, "json" for one JSON object per line.
+"""
+NUM_PAGES = "*"
+OUTPUT = None
+ENGINE = SELENIUM
+CRAWL_WORKERS = 1
+LISTING_WORKERS = 1
+CACHE_PATH = None
+CRAWL_RATE_LIMIT = None
+IMG_DUMP_PATH = "./img_dump"
+STORE = CONTENT
+DOWNLOAD_WORKERS = 4
+PER_HOST = 4
+QUEUE_SIZE = 256
+IMAGE_RATE_LIMIT = None
+RETRIES = 3
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "text"
+
+# writes the log from a background thread
+_LOGGER = Logger("MineralPydiaPipeline.log", LOG_LEVEL, LOG_FORMAT)
+
+
+# crawls and downloads at the same time
+def pipeline(
+        num_pages, outfile, img_dump_path, engine=SELENIUM, crawl_workers=1, listing_workers=1, cache_path=None,
+        crawl_rate_limit=None, store=CONTENT, download_workers=4, per_host=4, queue_size=256, image_rate_limit=None,
+        retries=3
+):
+    """
+    pipeline
+
+    Crawls Mineralpedia and downloads the images of every mineral as soon as it is written to the output.
+
+    :param num_pages: the number of listing pages to crawl, "*" for all of them.
+    :param outfile: the path of the crawl output, None for the crawler's default path.
+    :param img_dump_path: the directory to download images to.
+    :param engine: SELENIUM to render pages in Firefox, HTTP to fetch and parse them without a browser.
+    :param crawl_workers: the number of workers mineral pages are shared between.
+    :param listing_workers: the number of workers listing pages are shared between.
+    :param cache_path: the page cache for incremental re-crawls with the http engine, None to not cache pages.
+    :param crawl_rate_limit: the most page requests per second across all crawl workers, None for no limit.
+    :param store: CONTENT to store images by the hash of their bytes, FLAT to name them after their uri.
+    :param download_workers: the number of images downloaded at once.
+    :param per_host: the maximum number of simultaneous downloads against a single host.
+    :param queue_size: the most images waiting to be downloaded before the crawl is held back.
+    :param image_rate_limit: the most image requests per second against each host, None for no limit.
+    :param retries: the number of times a page or image that failed to load is retried.
+    :return: a tuple of the crawl's exit code, the number of images handed to the downloader and the number of images
+             that could not be downloaded.
+    """
+
+    try:
+        downloader = ImageDownloader(
+            img_dump_path, download_workers, per_host, queue_size, store=store, rate_limit=image_rate_limit,
+            retries=retries
+        )
+    except (OSError, ValueError) as e:
+        log("Could not open the image dump at " + os.path.abspath(img_dump_path) + ": " + repr(e), -1, ERROR)
+
+    log(
+        "Crawling " + str(num_pages) + " listing pages with " + str(crawl_workers) + " crawl workers and downloading "
+        "with " + str(download_workers) + " download workers to " + os.path.abspath(img_dump_path)
+    )
+
+    # the crawler exits once it is finished, with a non zero code if it failed
+    start = time.perf_counter()
+    code = 0
+    try:
+        MineralPydiaCrawl(
+            num_pages, outfile, engine, crawl_workers, crawl_rate_limit, cache_path, listing_workers=listing_workers,
+            retries=retries, on_mineral=downloader.put_mineral
+        )
+    except SystemExit as se:
+        code = se.code or 0
+    crawled = time.perf_counter() - start
+
+    log(
+        "The crawl finished with exit code " + str(code) + " after " + format(crawled, ".2f") + " seconds, "
+        + str(downloader.done) + " of " + str(downloader.queued) + " images are downloaded, waiting for the rest.",
+        seconds=crawled, queued=downloader.queued, done=downloader.done
+    )
+
+    # the images still queued are downloaded even if the crawl failed part way
+    failed = downloader.close()
+    elapsed = time.perf_counter() - start
+
+    log(
+        "Downloaded " + str(downloader.queued - failed) + " of " + str(downloader.queued) + " images in "
+        + format(elapsed, ".2f") + " seconds, the downloads ran " + format(elapsed - crawled, ".2f")
+        + " seconds past the end of the crawl.",
+        seconds=elapsed, images=downloader.queued, failed=failed
+    )
+
+    return code, downloader.queued, failed
+
+
+# logging
+def log(log_string, exit_code=None, level=INFO, **fields):
+    """
+    log
+
+    function used to dump strings into the log file
+
+    :param log_string: the string to be dumped to log file
+    :param exit_code: allows us to log an exit code and exit with that code, logs both errors and successes
+    :param level: the level of the message
+    :param fields: extra fields written with the message when logging JSON
+    """
+
+    _LOGGER.log(log_string, level, **fields)
+
+    # if an exit code is provided we can log that exit code and exit using that code
+    if exit_code is not None:
+        _LOGGER.log("The program exited with exit code: " + str(exit_code), ERROR if exit_code else INFO)
+        _LOGGER.close()
+        exit(exit_code)
+
+
+def main():
+    """
+    main
+
+    Runs the pipeline with the given environment variables.
+    """
+    code, _, _ = pipeline(
+        NUM_PAGES, OUTPUT, IMG_DUMP_PATH, ENGINE, CRAWL_WORKERS, LISTING_WORKERS, CACHE_PATH, CRAWL_RATE_LIMIT, STORE,
+        DOWNLOAD_WORKERS, PER_HOST, QUEUE_SIZE, IMAGE_RATE_LIMIT, RETRIES
+    )
+    log("The pipeline has completed.", code)
+
+
+if __name__ == "__main__":
+    """
+    Executes main if not being imported.
+    """
+    main()
@@ -0,0 +1,244 @@
+"""
+MineralPydiaProgress.py
+
+Progress reporting shared by MineralPydiaCrawl.py and MineralPydiaImageWrangle.py.
+
+Workers only count what they finish, under a lock, which costs next to nothing. The progress line is drawn by a
+background thread at most every INTERVAL seconds, however fast the workers go. It shows the counts of every worker
+together, the throughput and the time left:
+    Crawling  |████████······|  612/1094 minerals 55%  14.2/s  ETA 0:34  3 failed  found on 38 of 68 listing pages
+When the output is a terminal the line is redrawn in place with ANSI escapes. Anything else, e.g. a file or a pipe,
+instead gets a plain line every LOG_INTERVAL seconds, so a log of a run is not filled with redraws.
+
+The throughput is measured over the last WINDOW seconds rather than the whole run, so the time left follows the
+current rate when the workers speed up or slow down.
+"""
+
+# drawing
+from collections import deque
+import threading
+import time
+import sys
+
+
+# seconds between redraws on a terminal, and between lines anywhere else
+INTERVAL = 0.25
+LOG_INTERVAL = 10.0
+
+# seconds of history the throughput is measured over
+WINDOW = 10.0
+
+# width of the bar in characters
+WIDTH = 30
+
+# clears the current terminal line and returns to its start
+CLEAR_LINE = "\r\x1b[2K"
+
+
+# class Progress
+class Progress:
+    """
+    Progress
+
+    Thread safe progress counter, drawn from a background thread.
+    """
+
+    def __init__(self, label, total=None, unit="items", stream=None, metrics=None, interval=None, log_interval=None):
+        """
+        __init__
+
+        :param label: what is being done, e.g. "Crawling".
+        :param total: the number of items there are, None while it is not known.
+        :param unit: what the items are, e.g. "minerals".
+        :param stream: where progress is drawn, if None stdout.
+        :param metrics: the Metrics every draw is timed in as the progress stage, None to not time them.
+        :param interval: the seconds between redraws on a terminal, if None INTERVAL.
+        :param log_interval: the seconds between lines when not drawing to a terminal, if None LOG_INTERVAL.
+        """
+
+        self.label = label
+        self.unit = unit
+        self._stream = stream if stream is not None else sys.stdout
+        self._metrics = metrics
+
+        # only a terminal understands the escapes, anything else gets a line at a time
+        try:
+            self._tty = self._stream.isatty()
+        except (AttributeError, ValueError):
+            self._tty = False
+        if self._tty:
+            self._interval = interval if interval is not None else INTERVAL
+        else:
+            self._interval = log_interval if log_interval is not None else LOG_INTERVAL
+
+        self._lock = threading.Lock()
+        self._total = total
+        self._done = 0
+        self._failed = 0
+        self._note = ""
+
+        # (time, done) at every draw, the throughput is measured between the oldest and the newest
+        self._start = time.monotonic()
+        self._samples = deque([(self._start, 0)])
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        start
+
+        Starts drawing in the background.
+
+        :return: the Progress, so it can be started where it is created.
+        """
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="progress", daemon=True)
+            self._thread.start()
+
+        return self
+
+    def advance(self, amount=1, failed=False):
+        """
+        advance
+
+        Counts finished items, called by every worker.
+
+        :param amount: the number of items finished.
+        :param failed: True if the items failed, they are counted as finished and as failed.
+        """
+
+        with self._lock:
+            self._done += amount
+            if failed:
+                self._failed += amount
+
+    def set_total(self, total):
+        """
+        set_total
+
+        :param total: the number of items there are, e.g. as more are found, None while it is not known.
+        """
+
+        with self._lock:
+            self._total = total
+
+    def set_note(self, note):
+        """
+        set_note
+
+        :param note: a short description drawn after the counts, e.g. how far the listing pages have got.
+        """
+
+        with self._lock:
+            self._note = note
+
+    def close(self):
+        """
+        close
+
+        Stops drawing and draws the final counts.
+        """
+
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+        self._draw(final=True)
+
+    def _run(self):
+        """
+        _run
+
+        Body of the drawing thread.
+        """
+
+        while not self._stop.wait(self._interval):
+            self._draw()
+
+    def _draw(self, final=False):
+        """
+        _draw
+
+        Draws the progress line, in place on a terminal, as a new line anywhere else.
+
+        :param final: True for the last draw, which ends the line on a terminal.
+        """
+
+        if self._metrics is not None:
+            with self._metrics.time("progress"):
+                line = self.line()
+        else:
+            line = self.line()
+
+        try:
+            if self._tty:
+                self._stream.write(CLEAR_LINE + line + ("\n" if final else ""))
+            else:
+                self._stream.write(line + "\n")
+            self._stream.flush()
+
+        # a closed or broken stream only loses the progress, never the work
+        except (OSError, ValueError):
+            pass
+
+    def line(self):
+        """
+        line
+
+        Renders the progress line and records a throughput sample.
+
+        :return: the line, without a newline.
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            total, done, failed, note = self._total, self._done, self._failed, self._note
+
+        # keep the samples of the last WINDOW seconds, and always the oldest of them
+        self._samples.append((now, done))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= WINDOW:
+            self._samples.popleft()
+        then, done_then = self._samples[0]
+        rate = (done - done_then) / (now - then) if now > then else 0.0
+
+        parts = [self.label]
+        if total:
+            size = min(WIDTH, round(WIDTH * done / total))
+            parts.append("|" + "█" * size + "·" * (WIDTH - size) + "|")
+            parts.append(str(done) + "/" + str(total) + " " + self.unit)
+            parts[-1] += " " + str(min(100, 100 * done // total)) + "%"
+        else:
+            parts.append(str(done) + " " + self.unit)
+
+        parts.append(format(rate, ".1f") + "/s")
+        if total and rate > 0 and done < total:
+            parts.append("ETA " + _clock((total - done) / rate))
+        elif total is not None and done >= total:
+            parts.append("in " + _clock(now - self._start))
+
+        if failed:
+            parts.append(str(failed) + " failed")
+        if note:
+            parts.append(note)
+
+        return "  ".join(parts)
+
+
+# formats seconds as h:mm:ss
+def _clock(seconds):
+    """
+    _clock
+
+    :param seconds: a number of seconds.
+    :return: the seconds as h:mm:ss, or m:ss under an hour.
+    """
+
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return str(hours) + ":" + format(minutes, "02d") + ":" + format(seconds, "02d")
+
+    return str(minutes) + ":" + format(seconds, "02d")
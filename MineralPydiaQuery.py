@@ -0,0 +1,525 @@
+"""
+MineralPydiaQuery.py
+
+Indexed lookups over the output of MineralPydiaCrawl.py, for services that only need one mineral's properties or the
+minerals matching a few filters and should not have to load the whole crawl into pandas to get them.
+
+The index is built once from the crawl output into a directory of flat files:
+    records.jsonl - one JSON record per mineral (its columns and image uris), sorted by name
+    offsets.bin   - where every record starts in records.jsonl
+    names.bin     - the case folded names, in the same order, and names_offsets.bin where each one starts
+    hardness.bin  - every known hardness, sorted, and hardness_ids.bin the record each one belongs to
+    postings.bin  - the records of every class, color, habit and streak token, one run per token
+    index.json    - the token to run table, the number of minerals and the crawl output the index was built from
+Every .bin file is a native array memory-mapped when the index is opened, so opening it reads almost nothing and a
+lookup only touches the pages it needs: a name is found by binary search, a hardness range by two binary searches, and
+token filters by intersecting their runs of record numbers. The index is rebuilt whenever the crawl output changes.
+
+The class column is the crystal system. Colors, habits and streaks are indexed both as the comma separated values the
+crawl stores (e.g. "deep red") and as the single words in them (e.g. "red").
+
+Run as a program it answers one query from the command line, see main.
+"""
+
+# index files
+from array import array
+import argparse
+import bisect
+import mmap
+import json
+import re
+import os
+
+
+"""
+ENVIRONMENT VARIABLES
+
+CSV_PATH - the crawl output to index, either the csv or a .parquet/.feather output.
+INDEX_PATH - the directory the index is kept in. If left None it is kept next to the crawl output, as
+             <crawl output>.index.
+"""
+CSV_PATH = "./MineralPydiaCrawlData.csv"
+INDEX_PATH = None
+
+# version of the index files, an index of another version is rebuilt
+VERSION = 1
+
+# columns with a token inverted index
+TOKEN_FIELDS = ["class", "color", "habit", "streak"]
+
+# typecodes of the index arrays, record offsets and record numbers
+OFFSET = "q"
+ID = "i"
+
+
+# path of the index of a crawl output
+def index_path(csv_path):
+    """
+    index_path
+
+    :param csv_path: the crawl output.
+    :return: the default directory the index of the crawl output is kept in.
+    """
+
+    return os.path.splitext(csv_path)[0] + ".index"
+
+
+# splits a value into tokens
+def tokenize(value):
+    """
+    tokenize
+
+    Splits a value into its comma separated parts and the words in them, case folded.
+
+    :param value: the value of a column, or None.
+    :return: a sorted list of distinct tokens.
+    """
+
+    if value is None:
+        return []
+
+    tokens = set()
+    for part in str(value).split(","):
+        part = " ".join(part.split()).casefold()
+        if part:
+            tokens.add(part)
+            tokens.update(re.findall(r"\w+", part))
+
+    return sorted(tokens)
+
+
+# builds the index
+def build_index(csv_path, path=None):
+    """
+    build_index
+
+    Builds the index of a crawl output, replacing any index already there.
+
+    :param csv_path: the path of the csv, or of the parquet or feather output, to index.
+    :param path: the directory to build the index in, if None it is kept next to the crawl output.
+    :return: the number of minerals indexed.
+    """
+
+    if path is None:
+        path = index_path(csv_path)
+    os.makedirs(path, exist_ok=True)
+
+    # a half written index must never look complete, index.json is written last
+    if os.path.exists(os.path.join(path, "index.json")):
+        os.remove(os.path.join(path, "index.json"))
+
+    source = _source(csv_path)
+
+    # the readers need pandas, only building the index pays for importing it
+    from MineralPydiaOutput import read_images, read_minerals
+
+    minerals = read_minerals(csv_path)
+    minerals = minerals.astype(object).where(minerals.notna(), None)
+    images = dict()
+    for name, uri, _ in read_images(csv_path).itertuples(index=False):
+        images.setdefault(name, []).append(uri)
+
+    records = sorted(
+        (dict(zip(minerals.columns, row)) for row in minerals.itertuples(index=False)),
+        key=lambda record: str(record["name"]).casefold()
+    )
+
+    offsets = array(OFFSET, [0])
+    names = array(OFFSET, [0])
+    hardness = []
+    terms = dict((field, dict()) for field in TOKEN_FIELDS)
+
+    with open(os.path.join(path, "records.jsonl.part"), "wb") as records_file, \
+            open(os.path.join(path, "names.bin.part"), "wb") as names_file:
+
+        for i, record in enumerate(records):
+            record["hardness"] = None if record["hardness"] is None else float(record["hardness"])
+            record["images"] = images.get(record["name"], [])
+
+            line = (json.dumps(record) + "\n").encode("utf-8")
+            records_file.write(line)
+            offsets.append(offsets[-1] + len(line))
+
+            name = str(record["name"]).casefold().encode("utf-8")
+            names_file.write(name)
+            names.append(names[-1] + len(name))
+
+            if record["hardness"] is not None:
+                hardness.append((record["hardness"], i))
+
+            for field in TOKEN_FIELDS:
+                for token in tokenize(record[field]):
+                    terms[field].setdefault(token, []).append(i)
+
+    hardness.sort()
+
+    # every token's records become one run of the postings
+    postings = array(ID)
+    runs = dict((field, dict()) for field in TOKEN_FIELDS)
+    for field in TOKEN_FIELDS:
+        for token, ids in sorted(terms[field].items()):
+            runs[field][token] = [len(postings), len(postings) + len(ids)]
+            postings.extend(ids)
+
+    _write(path, "offsets.bin", offsets)
+    _write(path, "names_offsets.bin", names)
+    _write(path, "hardness.bin", array("d", [value for value, _ in hardness]))
+    _write(path, "hardness_ids.bin", array(ID, [i for _, i in hardness]))
+    _write(path, "postings.bin", postings)
+    os.replace(os.path.join(path, "records.jsonl.part"), os.path.join(path, "records.jsonl"))
+    os.replace(os.path.join(path, "names.bin.part"), os.path.join(path, "names.bin"))
+
+    with open(os.path.join(path, "index.json.part"), "w", encoding="utf-8") as file:
+        json.dump({"version": VERSION, "count": len(records), "source": source, "terms": runs}, file)
+    os.replace(os.path.join(path, "index.json.part"), os.path.join(path, "index.json"))
+
+    return len(records)
+
+
+# opens the index of a crawl output
+def open_index(csv_path, path=None):
+    """
+    open_index
+
+    Opens the index of a crawl output, building it first if it is missing or the crawl output has changed since.
+
+    :param csv_path: the path of the csv, or of the parquet or feather output.
+    :param path: the directory the index is kept in, if None it is kept next to the crawl output.
+    :return: the open MineralIndex.
+    """
+
+    if path is None:
+        path = index_path(csv_path)
+
+    try:
+        with open(os.path.join(path, "index.json"), encoding="utf-8") as file:
+            meta = json.load(file)
+        current = meta["version"] == VERSION and meta["source"] == _source(csv_path)
+    except (OSError, ValueError, KeyError):
+        current = False
+
+    if not current:
+        build_index(csv_path, path)
+
+    return MineralIndex(path)
+
+
+# class MineralIndex
+class MineralIndex:
+    """
+    MineralIndex
+
+    Read only view of a built index. The index files are memory-mapped, the operating system keeps the pages that are
+    used in memory and shares them between every process with the index open.
+    """
+
+    def __init__(self, path):
+        """
+        __init__
+
+        :param path: the directory the index was built in.
+        """
+
+        self.path = path
+
+        with open(os.path.join(path, "index.json"), encoding="utf-8") as file:
+            meta = json.load(file)
+        self._terms = meta["terms"]
+        self._count = meta["count"]
+
+        self._maps = []
+        self._records = self._map("records.jsonl")
+        self._offsets = self._map("offsets.bin", OFFSET)
+        self._names = self._map("names.bin")
+        self._name_offsets = self._map("names_offsets.bin", OFFSET)
+        self._hardness = self._map("hardness.bin", "d")
+        self._hardness_ids = self._map("hardness_ids.bin", ID)
+        self._postings = self._map("postings.bin", ID)
+
+    def _map(self, name, typecode=None):
+        """
+        _map
+
+        Memory-maps one of the index files.
+
+        :param name: the name of the file.
+        :param typecode: the array typecode of the file, None for bytes.
+        :return: a memoryview of the file.
+        """
+
+        with open(os.path.join(self.path, name), "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                view = memoryview(b"")
+            else:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps.append(mapped)
+                view = memoryview(mapped)
+
+        return view if typecode is None else view.cast(typecode)
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, i):
+        """
+        record
+
+        :param i: the number of a record.
+        :return: the record as a dictionary.
+        """
+
+        return json.loads(bytes(self._records[self._offsets[i]:self._offsets[i + 1]]))
+
+    def _name(self, i):
+        """
+        _name
+
+        :param i: the number of a record.
+        :return: the case folded name of the record.
+        """
+
+        return bytes(self._names[self._name_offsets[i]:self._name_offsets[i + 1]]).decode("utf-8")
+
+    def get(self, name):
+        """
+        get
+
+        Looks up a mineral by name, ignoring case.
+
+        :param name: the name of the mineral.
+        :return: the mineral's record, or None if it is not in the index.
+        """
+
+        name = name.strip().casefold()
+        i = bisect.bisect_left(_Names(self), name)
+
+        if i < self._count and self._name(i) == name:
+            return self.record(i)
+
+        return None
+
+    def names(self, prefix="", limit=None):
+        """
+        names
+
+        Lists the minerals whose name starts with a prefix, ignoring case.
+
+        :param prefix: the start of the names.
+        :param limit: the most names returned, None for all of them.
+        :return: a list of case folded names, in order.
+        """
+
+        prefix = prefix.strip().casefold()
+        names = _Names(self)
+        start = bisect.bisect_left(names, prefix)
+
+        found = []
+        for i in range(start, self._count):
+            if (limit is not None and len(found) >= limit) or not names[i].startswith(prefix):
+                break
+            found.append(names[i])
+
+        return found
+
+    def ids(self, hardness=None, **tokens):
+        """
+        ids
+
+        Finds the minerals matching every filter given.
+
+        :param hardness: a (low, high) tuple of the inclusive hardness range, either end None for no bound.
+        :param tokens: a token or list of tokens for any of TOKEN_FIELDS, every token must match. The class is passed
+                       as crystal_class, as class is a keyword.
+        :return: a sorted list of the record numbers matching, which is name order.
+        """
+
+        if "crystal_class" in tokens:
+            tokens["class"] = tokens.pop("crystal_class")
+
+        candidates = []
+
+        if hardness is not None:
+            low, high = hardness
+            start = 0 if low is None else bisect.bisect_left(self._hardness, low)
+            end = len(self._hardness) if high is None else bisect.bisect_right(self._hardness, high)
+            candidates.append(self._hardness_ids[start:end])
+
+        for field, values in tokens.items():
+            if field not in self._terms:
+                raise ValueError("Unknown field " + field + ", expected one of " + ", ".join(TOKEN_FIELDS))
+            if values is None:
+                continue
+
+            for value in [values] if isinstance(values, str) else values:
+                value = " ".join(value.split()).casefold()
+                start, end = self._terms[field].get(value, (0, 0))
+                candidates.append(self._postings[start:end])
+
+        if not candidates:
+            return list(range(self._count))
+
+        # intersect from the shortest run, so the work is bounded by the most selective filter
+        candidates.sort(key=len)
+        matched = set(candidates[0])
+        for run in candidates[1:]:
+            if not matched:
+                break
+            matched.intersection_update(run)
+
+        return sorted(matched)
+
+    def query(self, hardness=None, limit=None, **tokens):
+        """
+        query
+
+        Finds the minerals matching every filter given, see ids.
+
+        :param hardness: a (low, high) tuple of the inclusive hardness range, either end None for no bound.
+        :param limit: the most records returned, None for all of them.
+        :param tokens: a token or list of tokens for any of TOKEN_FIELDS, class passed as crystal_class.
+        :return: a list of the matching records, in name order.
+        """
+
+        return [self.record(i) for i in self.ids(hardness, **tokens)[:limit]]
+
+    def tokens(self, field):
+        """
+        tokens
+
+        :param field: one of TOKEN_FIELDS.
+        :return: a dictionary of every token of the field and the number of minerals with it.
+        """
+
+        return dict((token, end - start) for token, (start, end) in self._terms[field].items())
+
+    def close(self):
+        """
+        close
+
+        Unmaps the index files.
+        """
+
+        for view in (
+                self._records, self._offsets, self._names, self._name_offsets, self._hardness, self._hardness_ids,
+                self._postings
+        ):
+            view.release()
+
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+
+# class _Names
+class _Names:
+    """
+    _Names
+
+    Sequence of the case folded names of an index, for bisect.
+    """
+
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, i):
+        return self._index._name(i)
+
+
+# identity of a crawl output
+def _source(csv_path):
+    """
+    _source
+
+    :param csv_path: the crawl output.
+    :return: a list of the path, size and modification time of every file the crawl output is read from.
+    """
+
+    paths = [csv_path]
+    if os.path.splitext(csv_path)[1] in (".parquet", ".feather"):
+        stem, extension = os.path.splitext(csv_path)
+        paths = [stem + ".minerals" + extension, stem + ".images" + extension]
+
+    source = []
+    for path in paths:
+        stat = os.stat(path)
+        source.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+
+    return source
+
+
+# writes an index array
+def _write(path, name, values):
+    """
+    _write
+
+    :param path: the directory of the index.
+    :param name: the name of the file.
+    :param values: the array to write.
+    """
+
+    with open(os.path.join(path, name + ".part"), "wb") as file:
+        values.tofile(file)
+    os.replace(os.path.join(path, name + ".part"), os.path.join(path, name))
+
+
+def main():
+    """
+    main
+
+    Answers one query from the command line and prints the matching records as JSON lines, e.g.
+        python MineralPydiaQuery.py quartz
+        python MineralPydiaQuery.py --hardness 3 5 --class monoclinic --color red
+    """
+
+    parser = argparse.ArgumentParser(description="Query the minerals collected by MineralPydiaCrawl.py.")
+    parser.add_argument("name", nargs="?", help="look up one mineral by name")
+    parser.add_argument("--csv", default=CSV_PATH, help="the crawl output to query")
+    parser.add_argument("--index", default=INDEX_PATH, help="the directory the index is kept in")
+    parser.add_argument("--prefix", help="list the names starting with a prefix")
+    parser.add_argument("--hardness", nargs=2, type=float, metavar=("LOW", "HIGH"), help="inclusive hardness range")
+    for field in TOKEN_FIELDS:
+        parser.add_argument("--" + field, action="append", help="a " + field + " token, may be repeated")
+    parser.add_argument("--limit", type=int, help="the most records printed")
+    parser.add_argument("--count", action="store_true", help="print the number of matches instead")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the index first")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        build_index(args.csv, args.index)
+
+    with open_index(args.csv, args.index) as index:
+        if args.name is not None:
+            record = index.get(args.name)
+            if record is None:
+                parser.exit(1, "No mineral named " + args.name + "\n")
+            print(json.dumps(record))
+            return
+
+        if args.prefix is not None:
+            for name in index.names(args.prefix, args.limit):
+                print(name)
+            return
+
+        ids = index.ids(args.hardness, **dict((field, getattr(args, field)) for field in TOKEN_FIELDS))
+        if args.count:
+            print(len(ids))
+            return
+
+        for i in ids[:args.limit]:
+            print(json.dumps(index.record(i)))
+
+
+if __name__ == "__main__":
+    """
+    Executes main if not being imported.
+    """
+    main()
@@ -0,0 +1,333 @@
+"""
+MineralPydiaQueue.py
+
+Shared work queue used by MineralPydiaDistributed.py to spread a crawl over several processes or machines.
+
+The queue is a SQLite database every node can reach. Every item is a mineral url or an image uri, stored once however
+often it is seeded, and is handed out with a lease: a worker claims items, which are then invisible to every other
+worker until the lease runs out, renews the lease while it is still working on them, and completes them with their
+result. The lease doubles as a fencing token, so a worker whose lease ran out (it died, or lost its connection to the
+queue for too long) can no longer complete an item that has since been claimed by another worker, and every item has
+exactly one accepted result. Items whose lease ran out are claimed again by the next worker to ask, unless they have
+already been claimed as many times as the worker allows, then they are failed instead so an item that kills every node
+working on it is not handed out forever.
+
+Every claim runs in an immediate transaction, so two workers can never claim the same item. The database uses SQLite's
+rollback journal, which only relies on file locks, so it can be shared by processes on one host or by several hosts over
+a network file system with working locks. SQLite's locking is only as good as the file system the database is on.
+"""
+
+# storage
+import sqlite3
+import threading
+import json
+
+# leases
+import time
+
+
+# kinds of items
+MINERAL = "mineral"
+IMAGE = "image"
+
+# statuses of items
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+# seconds a writer waits for another to finish before giving up
+BUSY_TIMEOUT = 30
+
+
+# class WorkQueue
+class WorkQueue:
+    """
+    WorkQueue
+
+    Thread and process safe queue of leased work items.
+    """
+
+    def __init__(self, path):
+        """
+        __init__
+
+        Opens the queue, creating it if it does not already exist.
+
+        :param path: the path of the queue database.
+        """
+
+        self.path = path
+
+        # a single connection shared by the threads of this process, every access goes through the lock
+        # transactions are begun explicitly so claims can take the write lock before reading
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None)
+        # the rollback journal only needs file locks, WAL needs memory shared between processes on one host and does
+        # not work over a network file system
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "kind TEXT NOT NULL, "
+            "key TEXT NOT NULL, "
+            "payload TEXT, "
+            "status TEXT NOT NULL, "
+            "owner TEXT, "
+            "lease_until REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "result TEXT, "
+            "error TEXT, "
+            "updated REAL NOT NULL, "
+            "PRIMARY KEY (kind, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS items_status ON items (kind, status, lease_until)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS refs ("
+            "uri TEXT NOT NULL, "
+            "mineral TEXT NOT NULL, "
+            "PRIMARY KEY (uri, mineral))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+    def seed(self, kind, items):
+        """
+        seed
+
+        Adds items to the queue. Items already in the queue, whatever their status, are left as they are.
+
+        :param kind: MINERAL or IMAGE.
+        :param items: an iterable of (key, payload), the payload being any JSON serializable value.
+        :return: the number of items that were new.
+        """
+
+        now = time.time()
+        rows = [(kind, key, json.dumps(payload), QUEUED, now) for key, payload in items]
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO items (kind, key, payload, status, updated) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute("COMMIT")
+            return self._conn.total_changes - before
+
+    def claim(self, owner, kind, count=1, lease=60.0, max_attempts=None):
+        """
+        claim
+
+        Leases queued items, and items whose lease ran out, to a worker.
+
+        :param owner: the name of the worker.
+        :param kind: MINERAL or IMAGE.
+        :param count: the most items to claim.
+        :param lease: the seconds the items are leased for.
+        :param max_attempts: the most times an item is claimed, an item whose lease ran out on its last attempt is
+                             failed rather than claimed again. None for no limit.
+        :return: a list of (key, payload, token), the token must be handed back to renew or complete the item.
+        """
+
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # the worker on its last attempt died or hung, the item is not tried again
+                if max_attempts is not None:
+                    self._conn.execute(
+                        "UPDATE items SET status = ?, lease_until = NULL, error = ?, updated = ? "
+                        "WHERE kind = ? AND status = ? AND lease_until < ? AND attempts >= ?",
+                        (FAILED, "lease ran out on the last attempt", now, kind, LEASED, now, max_attempts)
+                    )
+
+                rows = self._conn.execute(
+                    "SELECT key, payload, attempts FROM items "
+                    "WHERE kind = ? AND (status = ? OR (status = ? AND lease_until < ?)) "
+                    "ORDER BY status DESC, rowid LIMIT ?",
+                    (kind, QUEUED, LEASED, now, count)
+                ).fetchall()
+
+                self._conn.executemany(
+                    "UPDATE items SET status = ?, owner = ?, lease_until = ?, attempts = attempts + 1, updated = ? "
+                    "WHERE kind = ? AND key = ?",
+                    [(LEASED, owner, now + lease, now, kind, key) for key, _, _ in rows]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return [(key, json.loads(payload), attempts + 1) for key, payload, attempts in rows]
+
+    def renew(self, owner, lease=60.0, items=None):
+        """
+        renew
+
+        Extends the lease of every item a worker still holds, or of only the given items.
+
+        :param owner: the name of the worker.
+        :param lease: the seconds from now the items are leased for.
+        :param items: an iterable of (kind, key) of the items still being worked on, None for every item the worker
+                      holds. An item the worker holds but is no longer working on is left to run out.
+        :return: the number of leases renewed.
+        """
+
+        now = time.time()
+
+        with self._lock:
+            if items is None:
+                return self._conn.execute(
+                    "UPDATE items SET lease_until = ?, updated = ? WHERE owner = ? AND status = ? AND lease_until >= ?",
+                    (now + lease, now, owner, LEASED, now)
+                ).rowcount
+
+            return self._conn.executemany(
+                "UPDATE items SET lease_until = ?, updated = ? "
+                "WHERE kind = ? AND key = ? AND owner = ? AND status = ? AND lease_until >= ?",
+                [(now + lease, now, kind, key, owner, LEASED, now) for kind, key in items]
+            ).rowcount
+
+    def complete(self, owner, kind, key, token, result=None, status=DONE, error=None):
+        """
+        complete
+
+        Records the result of a leased item, if the worker still holds its lease.
+
+        :param owner: the name of the worker.
+        :param kind: MINERAL or IMAGE.
+        :param key: the key of the item.
+        :param token: the token the item was claimed with.
+        :param result: any JSON serializable result.
+        :param status: DONE, or FAILED for an item that will not be tried again.
+        :param error: a description of why the item failed.
+        :return: True if the result was accepted, False if the lease had been lost and the result was dropped.
+        """
+
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE items SET status = ?, result = ?, error = ?, lease_until = NULL, updated = ? "
+                "WHERE kind = ? AND key = ? AND owner = ? AND attempts = ? AND status = ?",
+                (status, json.dumps(result), error, time.time(), kind, key, owner, token, LEASED)
+            ).rowcount == 1
+
+    def release(self, owner, kind, key, token, error=None):
+        """
+        release
+
+        Gives a leased item back to the queue to be claimed again, if the worker still holds its lease.
+
+        :param owner: the name of the worker.
+        :param kind: MINERAL or IMAGE.
+        :param key: the key of the item.
+        :param token: the token the item was claimed with.
+        :param error: a description of why the item was given back.
+        :return: True if the item was given back.
+        """
+
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE items SET status = ?, owner = NULL, lease_until = NULL, error = ?, updated = ? "
+                "WHERE kind = ? AND key = ? AND owner = ? AND attempts = ? AND status = ?",
+                (QUEUED, error, time.time(), kind, key, owner, token, LEASED)
+            ).rowcount == 1
+
+    def reference(self, uri, mineral):
+        """
+        reference
+
+        Records that an image uri belongs to a mineral.
+
+        :param uri: the uri of the image.
+        :param mineral: the name of the mineral.
+        """
+
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO refs (uri, mineral) VALUES (?, ?)", (uri, mineral))
+
+    def references(self, uri=None):
+        """
+        references
+
+        :param uri: the uri of an image, None for every image.
+        :return: a list of (uri, mineral) of the image, or of every image, in uri order.
+        """
+
+        with self._lock:
+            if uri is None:
+                return self._conn.execute("SELECT uri, mineral FROM refs ORDER BY uri, mineral").fetchall()
+            return self._conn.execute(
+                "SELECT uri, mineral FROM refs WHERE uri = ? ORDER BY mineral", (uri,)
+            ).fetchall()
+
+    def results(self, kind):
+        """
+        results
+
+        :param kind: MINERAL or IMAGE.
+        :return: a list of (key, payload, status, result) of every item of the kind, in the order they were seeded.
+        """
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, payload, status, result FROM items WHERE kind = ? ORDER BY rowid", (kind,)
+            ).fetchall()
+
+        return [
+            (key, json.loads(payload), status, None if result is None else json.loads(result))
+            for key, payload, status, result in rows
+        ]
+
+    def set(self, name, value):
+        """
+        set
+
+        Stores a value shared by every node, e.g. that seeding is finished.
+
+        :param name: the name of the value.
+        :param value: any JSON serializable value.
+        """
+
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, json.dumps(value)))
+
+    def get(self, name, default=None):
+        """
+        get
+
+        :param name: the name of the value.
+        :param default: returned if the value was never stored.
+        :return: the stored value.
+        """
+
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+
+        return default if row is None else json.loads(row[0])
+
+    def counts(self, kind=None):
+        """
+        counts
+
+        :param kind: MINERAL or IMAGE, None for both.
+        :return: a dictionary of the number of items of each status.
+        """
+
+        with self._lock:
+            if kind is None:
+                rows = self._conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT status, COUNT(*) FROM items WHERE kind = ? GROUP BY status", (kind,)
+                ).fetchall()
+
+        return dict(rows)
+
+    def close(self):
+        """
+        close
+
+        Closes the connection to the queue.
+        """
+
+        with self._lock:
+            self._conn.close()
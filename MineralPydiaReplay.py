@@ -0,0 +1,716 @@
+"""
+MineralPydiaReplay.py
+
+Offline end to end benchmarks of MineralPydiaCrawl.py and MineralPydiaImageWrangle.py against a recorded copy of
+Mineralpedia, so crawler and downloader changes can be measured repeatably without hitting Dakota Matrix Minerals.
+
+Recording walks the listing pages, the mineral pages and their images once, politely rate limited, and stores every
+response in a fixture archive, a small SQLite database keyed on the path and query of each url. Without a recording a
+synthetic archive is built from the stand-in pages of MineralPydiaBench.py instead.
+
+Replaying serves the archive from a local HTTP server with a configurable latency, random jitter and rate of 503
+answers, seeded so every run sees the same sequence. Links to the recorded hosts in the served pages are rewritten to
+the replay server, so the crawl and the image uris it collects never leave the machine.
+
+Each benchmark run crawls the replay server with the http engine and then downloads every image the crawl found, each
+in its own child process so its peak resident memory can be measured. The median of REPEATS runs is reported as pages
+per second, images per second and peak RSS, and compared against a stored baseline. A result worse than the baseline by
+more than TOLERANCE is reported as a regression and the program exits with a non zero code.
+"""
+
+# fixture archive
+from urllib.parse import urlsplit
+import sqlite3
+
+# replay server
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import hashlib
+import random
+
+# end to end runs
+import subprocess
+import tempfile
+import statistics
+import json
+import sys
+
+# logging
+from MineralPydiaLog import Logger, INFO, WARNING, ERROR
+import time
+import os
+
+
+"""
+ENVIRONMENT VARIABLES
+
+MODE - "record" to record Mineralpedia into ARCHIVE, "bench" to benchmark against ARCHIVE.
+ARCHIVE - the fixture archive. If it does not exist when benchmarking a synthetic one is built.
+RECORD_PAGES - the number of listing pages to record, "*" for all of them.
+RECORD_MINERALS - the most mineral pages to record, None for every mineral on the recorded listing pages.
+RECORD_IMAGES - if True the images of every recorded mineral are recorded too.
+RECORD_RATE_LIMIT - the most requests per second made while recording.
+LATENCY - the number of seconds the replay server waits before answering each request.
+JITTER - the most extra seconds, drawn uniformly at random, added to the latency of each request.
+ERROR_RATE - the fraction of requests answered with 503 Service Unavailable.
+SEED - the seed of the jitter and errors, the same seed replays the same sequence.
+CRAWL_WORKERS - the crawl worker count benchmarked.
+DOWNLOAD_WORKERS - the download worker count benchmarked.
+REPEATS - the number of runs, the median of each result is reported.
+BASELINE - the stored results compared against.
+UPDATE_BASELINE - if True the results are stored as the new baseline instead of being compared.
+TOLERANCE - the fraction a result may be worse than the baseline before it is a regression.
+LOG_LEVEL - the lowest level of message written to the log, "DEBUG", "INFO", "WARNING" or "ERROR".
+LOG_FORMAT - "text" for the plain text log, "json" for one JSON object per line.
+"""
+MODE = "bench"
+ARCHIVE = "./MineralPydiaFixtures.sqlite"
+RECORD_PAGES = "*"
+RECORD_MINERALS = None
+RECORD_IMAGES = True
+RECORD_RATE_LIMIT = 1.0
+LATENCY = 0.05
+JITTER = 0.02
+ERROR_RATE = 0.0
+SEED = 0
+CRAWL_WORKERS = 4
+DOWNLOAD_WORKERS = 8
+REPEATS = 3
+BASELINE = "./MineralPydiaBaseline.json"
+UPDATE_BASELINE = False
+TOLERANCE = 0.1
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "text"
+
+# kinds of recorded responses
+LISTING = "listing"
+MINERAL = "mineral"
+IMAGE = "image"
+
+# results compared against the baseline, and whether a higher value is better
+RESULTS = {"pages_per_second": True, "images_per_second": True, "crawl_peak_rss_mb": False,
+           "download_peak_rss_mb": False}
+
+# run first in every child process, writes the peak resident memory of the child in megabytes to peak_rss on exit
+# VmHWM is used where there is one, as the high water mark getrusage reports is carried over from the parent on fork
+_PEAK_RSS = (
+    "import atexit, sys\n"
+    "def _peak():\n"
+    "    try:\n"
+    "        with open('/proc/self/status') as f:\n"
+    "            kb = next(int(l.split()[1]) for l in f if l.startswith('VmHWM:'))\n"
+    "    except (OSError, StopIteration):\n"
+    "        import resource\n"
+    "        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform == 'darwin' else 1)\n"
+    "    with open('peak_rss', 'w') as f:\n"
+    "        f.write(str(kb / 1024))\n"
+    "atexit.register(_peak)\n"
+)
+
+# run in a child process, crawls the replay server given as the first argument with the http engine
+_CRAWL = (
+    "import sys, MineralPydiaCrawl as c\n"
+    "c.MineralPydiaCrawl._base_url = sys.argv[1]\n"
+    "c.MineralPydiaCrawl('*', 'crawl.csv', c.HTTP, int(sys.argv[2]), listing_workers=2)\n"
+)
+
+# run in a child process, downloads every image of the crawl output
+_DOWNLOAD = (
+    "import sys, os, MineralPydiaImageWrangle as w\n"
+    "os.makedirs('img_dump', exist_ok=True)\n"
+    "w.mineral_pydia_image_wrangler('crawl.csv', 'img_dump', int(sys.argv[1]))\n"
+)
+
+# writes the log from a background thread
+_LOGGER = Logger("MineralPydiaReplay.log", LOG_LEVEL, LOG_FORMAT)
+
+
+# class FixtureArchive
+class FixtureArchive:
+    """
+    FixtureArchive
+
+    Thread safe archive of recorded responses, keyed on the path and query of their url.
+    """
+
+    def __init__(self, path):
+        """
+        __init__
+
+        Opens the archive, creating it if it does not already exist.
+
+        :param path: the path of the archive database.
+        """
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "path TEXT PRIMARY KEY, "
+            "origin TEXT NOT NULL, "
+            "kind TEXT NOT NULL, "
+            "status INTEGER NOT NULL, "
+            "content_type TEXT, "
+            "body BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def put(self, url, kind, status, content_type, body):
+        """
+        put
+
+        Records a response, replacing any earlier response for the same path.
+
+        :param url: the url the response was fetched from.
+        :param kind: one of LISTING, MINERAL or IMAGE.
+        :param status: the HTTP status of the response.
+        :param content_type: the Content-Type of the response.
+        :param body: the bytes of the response.
+        """
+
+        parts = urlsplit(url)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (path, origin, kind, status, content_type, body) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (_path(url), parts.scheme + "://" + parts.netloc, kind, status, content_type, body)
+            )
+            self._conn.commit()
+
+    def load(self):
+        """
+        load
+
+        :return: a dictionary of every recorded path to its (status, content type, body).
+        """
+
+        with self._lock:
+            rows = self._conn.execute("SELECT path, status, content_type, body FROM responses").fetchall()
+
+        return dict((path, (status, content_type, bytes(body))) for path, status, content_type, body in rows)
+
+    def origins(self):
+        """
+        origins
+
+        :return: the scheme and host of every recorded host, e.g. https://www.dakotamatrix.com
+        """
+
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT origin FROM responses ORDER BY origin")]
+
+    def counts(self):
+        """
+        counts
+
+        :return: a dictionary of the number of recorded responses of each kind.
+        """
+
+        with self._lock:
+            return dict(self._conn.execute("SELECT kind, COUNT(*) FROM responses GROUP BY kind").fetchall())
+
+    def close(self):
+        """
+        close
+
+        Closes the archive.
+        """
+
+        with self._lock:
+            self._conn.close()
+
+
+# records Mineralpedia
+def record(archive_path, num_pages="*", max_minerals=None, images=True, rate_limit=1.0):
+    """
+    record
+
+    Records the listing pages, the mineral pages on them and their images into a fixture archive.
+
+    :param archive_path: the path of the fixture archive.
+    :param num_pages: the number of listing pages to record, "*" for all of them.
+    :param max_minerals: the most mineral pages to record, None for all of them.
+    :param images: True to record the images of every recorded mineral.
+    :param rate_limit: the most requests per second.
+    :return: a dictionary of the number of responses recorded of each kind.
+    """
+
+    from MineralPydiaCrawl import MineralPydiaCrawl
+    from MineralPydiaParse import parse_listing, parse_page_count, MineralPage
+    from MineralPydiaHTTP import HTTPPool
+    from MineralPydiaFetch import Fetcher, FetchFailed
+
+    base_url = MineralPydiaCrawl._base_url
+    archive = FixtureArchive(archive_path)
+    pool = HTTPPool()
+    fetcher = Fetcher(rate_limit, log=log)
+
+    def get(url, kind):
+        def fetch():
+            with pool.request(url) as response:
+                return response.status, response.headers.get("Content-Type"), response.read()
+
+        try:
+            status, content_type, body = fetcher.call(url, fetch)
+        except FetchFailed as ff:
+            log("Could not record " + url + ": " + str(ff), level=WARNING, url=url)
+            return None
+
+        archive.put(url, kind, status, content_type, body)
+        return body
+
+    # the first listing page has the number of listing pages
+    urls = []
+    page = 1
+    last = None if num_pages == "*" else int(num_pages)
+    while last is None or page <= last:
+        page_url = base_url + "?page=" + str(page)
+        body = get(page_url, LISTING)
+        if body is None:
+            break
+
+        html = body.decode("utf-8", "replace")
+        found = parse_listing(html, page_url)
+        if page == 1 and num_pages == "*":
+            last = parse_page_count(html, page_url)
+        if not found:
+            break
+
+        urls.extend(found)
+        log("Recorded listing page #" + str(page) + " with " + str(len(found)) + " minerals.")
+        page += 1
+
+    for url in urls[:max_minerals]:
+        body = get(url, MINERAL)
+        if body is None or not images:
+            continue
+
+        for uri in MineralPage(body.decode("utf-8", "replace"), url).thumbnails():
+            if uri is not None:
+                get(uri, IMAGE)
+
+    counts = archive.counts()
+    archive.close()
+    pool.close()
+
+    log("Recorded " + json.dumps(counts) + " into " + os.path.abspath(archive_path), **counts)
+    return counts
+
+
+# builds a synthetic archive
+def synthesize(archive_path, pages=4, minerals=16, images=9, image_size=64 * 1024):
+    """
+    synthesize
+
+    Builds a fixture archive from the stand-in Mineralpedia pages of MineralPydiaBench.py, for when there is no
+    recording.
+
+    :param archive_path: the path of the fixture archive.
+    :param pages: the number of listing pages.
+    :param minerals: the number of minerals on each listing page.
+    :param images: the number of images of each mineral.
+    :param image_size: the size of each image in bytes.
+    :return: a dictionary of the number of responses recorded of each kind.
+    """
+
+    from MineralPydiaBench import StandInSiteHandler as site
+
+    origin = "https://www.dakotamatrix.com"
+    archive = FixtureArchive(archive_path)
+
+    for page in range(1, pages + 1):
+        names = ["mineral" + str(page) + "x" + str(i) for i in range(minerals)]
+        html = site.listing.format(items="".join(site.item.format(name=name) for name in names), pages=pages)
+        archive.put(origin + "/mineralpedia?page=" + str(page), LISTING, 200, "text/html; charset=utf-8",
+                    html.encode("utf-8"))
+
+        for name in names:
+            thumbs = "".join(site.thumb.format(name=name, i=i) for i in range(images))
+            html = site.mineral.format(name=name, thumbs=thumbs)
+            archive.put(
+                origin + "/mineralpedia/" + name, MINERAL, 200, "text/html; charset=utf-8", html.encode("utf-8")
+            )
+
+            for i in range(images):
+                body = hashlib.sha256((name + str(i)).encode("utf-8")).digest() * (image_size // 32)
+                archive.put(origin + "/images/products/" + name + str(i) + ".jpg", IMAGE, 200, "image/jpeg", body)
+
+    counts = archive.counts()
+    archive.close()
+    return counts
+
+
+# class ReplayHandler
+class ReplayHandler(BaseHTTPRequestHandler):
+    """
+    ReplayHandler
+
+    Serves the responses of a fixture archive after sleeping for the latency plus a random jitter, and answers a
+    fraction of requests with 503. Links to the recorded hosts in text responses are rewritten to the replay server.
+    Every response has an ETag, and conditional requests for an unchanged response are answered with 304 Not Modified.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    # set by start_replay
+    responses = dict()
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    random = random.Random(0)
+    served = 0
+    errors = 0
+    _lock = threading.Lock()
+
+    def do_GET(self):
+        with self._lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            fail = self.random.random() < self.error_rate
+            ReplayHandler.served += 1
+            ReplayHandler.errors += fail
+
+        time.sleep(delay)
+
+        if fail or self.path not in self.responses:
+            self.send_response(503 if fail else 404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        status, content_type, body, etag = self.responses[self.path]
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # keep the benchmark output readable
+        pass
+
+
+# starts the replay server
+def start_replay(archive_path, latency=0.05, jitter=0.02, error_rate=0.0, seed=0):
+    """
+    start_replay
+
+    Starts a replay server for a fixture archive on a free local port in a background thread.
+
+    :param archive_path: the path of the fixture archive.
+    :param latency: the seconds waited before answering each request.
+    :param jitter: the most extra seconds added at random to each wait.
+    :param error_rate: the fraction of requests answered with 503.
+    :param seed: the seed of the jitter and errors.
+    :return: the running server, its base url is http://127.0.0.1:<server.server_port>
+    """
+
+    archive = FixtureArchive(archive_path)
+    recorded = archive.load()
+    origins = archive.origins()
+    archive.close()
+
+    # every handler class has its own responses and random sequence, so several servers can run at once
+    handler = type("Replay", (ReplayHandler,), {
+        "latency": latency, "jitter": jitter, "error_rate": error_rate, "random": random.Random(seed),
+        "served": 0, "errors": 0, "_lock": threading.Lock()
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    base_url = "http://127.0.0.1:" + str(server.server_port)
+
+    # links to the recorded hosts point at the replay server instead, the ETag is of what is served
+    responses = dict()
+    for path, (status, content_type, body) in recorded.items():
+        if content_type is not None and content_type.startswith("text/"):
+            for origin in origins:
+                body = body.replace(origin.encode("utf-8"), base_url.encode("utf-8"))
+        responses[path] = (status, content_type, body, '"' + hashlib.sha1(body).hexdigest() + '"')
+    handler.responses = responses
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# one end to end run
+def bench_run(base_url, scratch, crawl_workers, download_workers):
+    """
+    bench_run
+
+    Crawls the replay server and downloads every image the crawl found, each in a child process started in a scratch
+    directory.
+
+    :param base_url: the base url of the replay server.
+    :param scratch: an empty directory the run is made in.
+    :param crawl_workers: the crawl worker count.
+    :param download_workers: the download worker count.
+    :return: a dictionary of the run's results.
+    """
+
+    crawl_seconds, crawl_rss, crawl_code = _run(_CRAWL, [base_url + "/mineralpedia", str(crawl_workers)], scratch)
+    crawl_counters = _counters(os.path.join(scratch, "crawl.metrics.json")) if crawl_code == 0 else None
+
+    # without a finished crawl there is nothing to download, the run is recorded as failed with no results
+    download_seconds = download_rss = download_code = download_counters = None
+    if crawl_counters is not None:
+        download_seconds, download_rss, download_code = _run(_DOWNLOAD, [str(download_workers)], scratch)
+        if download_code == 0:
+            download_counters = _counters(os.path.join(scratch, "img_dump", "metrics.json"))
+
+    def total(counters, name):
+        return counters.get(name, {}).get("total", 0) if counters is not None else None
+
+    pages = images = None
+    if crawl_counters is not None:
+        pages = total(crawl_counters, "listing_pages") + total(crawl_counters, "minerals")
+    if download_counters is not None:
+        images = total(download_counters, "images")
+
+    return {
+        "pages": pages,
+        "images": images,
+        "crawl_seconds": crawl_seconds if crawl_counters is not None else None,
+        "download_seconds": download_seconds if download_counters is not None else None,
+        "pages_per_second": pages / crawl_seconds if pages is not None else None,
+        "images_per_second": images / download_seconds if images is not None else None,
+        "crawl_peak_rss_mb": crawl_rss if crawl_counters is not None else None,
+        "download_peak_rss_mb": download_rss if download_counters is not None else None,
+        "errors": (
+            total(crawl_counters, "errors") + total(download_counters, "errors")
+            if download_counters is not None else None
+        ),
+        "exit_codes": [crawl_code, download_code],
+        "failed": crawl_counters is None or download_counters is None
+    }
+
+
+# reads the counters of a run's metrics
+def _counters(path):
+    """
+    _counters
+
+    :param path: the metrics written by a run.
+    :return: the counters of the run, None if the run did not write its metrics.
+    """
+
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)["counters"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# the whole suite
+def bench_suite(archive_path, repeats=3, crawl_workers=4, download_workers=8, latency=0.05, jitter=0.02,
+                error_rate=0.0, seed=0):
+    """
+    bench_suite
+
+    Replays a fixture archive and makes a number of end to end runs against it.
+
+    :param archive_path: the path of the fixture archive.
+    :param repeats: the number of runs.
+    :param crawl_workers: the crawl worker count.
+    :param download_workers: the download worker count.
+    :param latency: the seconds waited before answering each request.
+    :param jitter: the most extra seconds added at random to each wait.
+    :param error_rate: the fraction of requests answered with 503.
+    :param seed: the seed of the jitter and errors, every run replays the same sequence.
+    :return: a tuple of the median of every result and the list of every run.
+    """
+
+    runs = []
+    for repeat in range(repeats):
+        server = start_replay(archive_path, latency, jitter, error_rate, seed)
+        try:
+            with tempfile.TemporaryDirectory() as scratch:
+                runs.append(bench_run(
+                    "http://127.0.0.1:" + str(server.server_port), scratch, crawl_workers, download_workers
+                ))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        log("Run " + str(repeat + 1) + " of " + str(repeats) + ": " + json.dumps(runs[-1]), **runs[-1])
+
+    medians = dict(
+        (name, statistics.median(run[name] for run in runs if run[name] is not None))
+        if any(run[name] is not None for run in runs) else (name, None)
+        for name in runs[0] if name not in ("exit_codes", "failed")
+    )
+
+    return medians, runs
+
+
+# compares results against a baseline
+def compare(results, baseline, tolerance=0.1):
+    """
+    compare
+
+    Compares results against a baseline.
+
+    :param results: the median results of a suite.
+    :param baseline: the median results stored as the baseline.
+    :param tolerance: the fraction a result may be worse than the baseline.
+    :return: a list of (name, baseline value, value, relative change, True if it is a regression) of every compared
+             result both have.
+    """
+
+    rows = []
+    for name, higher_is_better in RESULTS.items():
+        old, new = baseline.get(name), results.get(name)
+        if not old or new is None:
+            continue
+
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        rows.append((name, old, new, change, worse > tolerance))
+
+    return rows
+
+
+# runs a script in a child process
+def _run(script, args, cwd):
+    """
+    _run
+
+    :param script: the Python source to run.
+    :param args: the arguments handed to the script.
+    :param cwd: the directory to run it in.
+    :return: a tuple of the wall time in seconds, the peak resident memory in megabytes (None where it cannot be
+             measured) and the exit code.
+    """
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(os.path.abspath(__file__)) + os.pathsep + env.get("PYTHONPATH", "")
+
+    rss_path = os.path.join(cwd, "peak_rss")
+    if os.path.isfile(rss_path):
+        os.remove(rss_path)
+
+    start = time.perf_counter()
+    code = subprocess.call(
+        [sys.executable, "-c", _PEAK_RSS + script] + args, cwd=cwd, env=env, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    elapsed = time.perf_counter() - start
+
+    # the platform has neither /proc nor the resource module
+    try:
+        with open(rss_path, encoding="utf-8") as file:
+            rss = float(file.read())
+    except (OSError, ValueError):
+        rss = None
+
+    return elapsed, rss, code
+
+
+# the path and query of a url, the key of the archive and of the replay server
+def _path(url):
+    """
+    _path
+
+    :param url: an absolute url.
+    :return: its path and query, e.g. /mineralpedia?page=2
+    """
+
+    parts = urlsplit(url)
+    return (parts.path or "/") + ("?" + parts.query if parts.query else "")
+
+
+# logging
+def log(log_string, exit_code=None, level=INFO, **fields):
+    """
+    log
+
+    function used to dump strings into the log file
+
+    :param log_string: the string to be dumped to log file
+    :param exit_code: allows us to log an exit code and exit with that code, logs both errors and successes
+    :param level: the level of the message
+    :param fields: extra fields written with the message when logging JSON
+    """
+
+    _LOGGER.log(log_string, level, **fields)
+
+    # if an exit code is provided we can log that exit code and exit using that code
+    if exit_code is not None:
+        _LOGGER.log("The program exited with exit code: " + str(exit_code), ERROR if exit_code else INFO)
+        _LOGGER.close()
+        exit(exit_code)
+
+
+def main():
+    """
+    main
+
+    Records Mineralpedia, or benchmarks against the archive and compares the results against the baseline, with the
+    given environment variables.
+    """
+
+    if MODE == "record":
+        counts = record(ARCHIVE, RECORD_PAGES, RECORD_MINERALS, RECORD_IMAGES, RECORD_RATE_LIMIT)
+        print("Recorded " + json.dumps(counts) + " into " + os.path.abspath(ARCHIVE))
+        log("Recording is complete.", 0)
+
+    if MODE != "bench":
+        log("Invalid mode " + str(MODE) + ", exiting.", -1, ERROR)
+
+    if not os.path.isfile(ARCHIVE):
+        counts = synthesize(ARCHIVE)
+        print("There is no recording at " + os.path.abspath(ARCHIVE) + ", built a synthetic one: " + json.dumps(counts))
+
+    results, runs = bench_suite(
+        ARCHIVE, REPEATS, CRAWL_WORKERS, DOWNLOAD_WORKERS, LATENCY, JITTER, ERROR_RATE, SEED
+    )
+
+    print("\nresult\t\t\tmedian of " + str(len(runs)))
+    for name, value in results.items():
+        print(name.ljust(24) + (format(value, ".2f") if isinstance(value, float) else str(value)))
+
+    failed = [run["exit_codes"] for run in runs if run["failed"]]
+    if failed:
+        print("\nRuns failed, with the exit codes of their crawl and download: " + str(failed))
+
+    # results of failed runs are never stored as the baseline
+    if failed and (UPDATE_BASELINE or not os.path.isfile(BASELINE)):
+        log("Benchmark runs failed, the results are not stored as the baseline.", 1, ERROR)
+
+    if UPDATE_BASELINE or not os.path.isfile(BASELINE):
+        with open(BASELINE, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+        print("\nStored the results as the baseline at " + os.path.abspath(BASELINE))
+        log("Benchmarks are complete.", 0)
+
+    with open(BASELINE, encoding="utf-8") as file:
+        baseline = json.load(file)
+
+    rows = compare(results, baseline, TOLERANCE)
+    print("\nresult\t\t\tbaseline\tnow\t\tchange")
+    for name, old, new, change, regression in rows:
+        print(
+            name.ljust(24) + format(old, ".2f") + "\t\t" + format(new, ".2f") + "\t\t" + format(100 * change, "+.1f")
+            + "%" + ("\tREGRESSION" if regression else "")
+        )
+
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions or failed:
+        log("Benchmarks found regressions in: " + ", ".join(regressions) if regressions else "Benchmark runs failed.",
+            1, ERROR)
+    log("Benchmarks are complete without regressions.", 0)
+
+
+if __name__ == "__main__":
+    """
+    Executes main if not being imported.
+    """
+    main()
@@ -0,0 +1,301 @@
+"""
+MineralPydiaShard.py
+
+This program packs the images downloaded by MineralPydiaImageWrangle.py into training shards for the mineral classifier.
+
+Every image is decoded and validated, and resized to each of the configured sizes (the shorter side is scaled to the
+size and the centre is cropped square) on a pool of worker processes. The resized images are written, with the labels
+of their mineral from the crawl output, into large sequential tar files in the WebDataset layout: every sample is a
+group of consecutive members sharing a key,
+    <key>.<size>.jpg - the image resized to each size
+    <key>.json       - the mineral's name, habit, color, streak, class, fracture and hardness, and the image's uri
+so a loader can stream a few large files instead of opening thousands of loose images every epoch. A shards.json index
+lists every shard with its number of samples.
+
+Images that cannot be decoded are logged and left out. Decoding and resizing need Pillow.
+"""
+
+# packing
+from concurrent.futures import ProcessPoolExecutor
+import tarfile
+import json
+import io
+
+# crawl output and images
+from MineralPydiaOutput import read_images, read_minerals
+from MineralPydiaStore import ImageStore, INDEX_NAME
+
+# logging
+from MineralPydiaLog import Logger, INFO, WARNING, ERROR
+import time
+import os
+
+# Pillow is only needed to decode and resize
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+"""
+ENVIRONMENT VARIABLES
+
+CSV_PATH - the crawl output the labels are read from, either the csv or a .parquet/.feather output.
+IMG_DUMP_PATH - the directory the images were downloaded to.
+SHARD_PATH - the directory the shards are written to.
+SIZES - the sizes in pixels each image is resized to, one square image per size in every sample.
+SHARD_SIZE - the number of megabytes after which a new shard is started.
+PROCESSES - the number of worker processes decoding and resizing images. If left None one per CPU is used.
+QUALITY - the JPEG quality the resized images are written with.
+LOG_LEVEL - the lowest level of message written to the log, "DEBUG", "INFO", "WARNING" or "ERROR".
+LOG_FORMAT - "text" for the plain text log, "json" for one JSON object per line.
+"""
+CSV_PATH = "./MineralPydiaCrawlData.csv"
+IMG_DUMP_PATH = "./img_dump"
+SHARD_PATH = "./shards"
+SIZES = [224]
+SHARD_SIZE = 256
+PROCESSES = None
+QUALITY = 90
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "text"
+
+# name of the shards, numbered from 0
+SHARD_NAME = "minerals-{:06d}.tar"
+
+# name of the index listing every shard
+SHARD_INDEX = "shards.json"
+
+# images handed to a worker process at a time
+CHUNK = 16
+
+# writes the log from a background thread
+_LOGGER = Logger("MineralPydiaShard.log", LOG_LEVEL, LOG_FORMAT)
+
+
+# packs the images into shards
+def pack_shards(
+        csv_path, img_dump_path, shard_path, sizes=(224,), shard_size=256, processes=None, quality=90
+):
+    """
+    pack_shards
+
+    Decodes, resizes and packs every downloaded image into shards with the labels of its mineral.
+
+    :param csv_path: the path of the csv, or of the parquet or feather output, to read the labels from.
+    :param img_dump_path: the directory the images were downloaded to, either a content store or flat.
+    :param shard_path: the directory to write the shards to.
+    :param sizes: the sizes in pixels each image is resized to.
+    :param shard_size: the number of megabytes after which a new shard is started.
+    :param processes: the number of worker processes, None for one per CPU.
+    :param quality: the JPEG quality of the resized images.
+    :return: the list of shard index entries, each with the shard's name and number of samples.
+    """
+
+    if Image is None:
+        log("Pillow is required to pack shards, exiting packing.", -1, ERROR)
+
+    # the labels of every mineral, keyed on its name
+    try:
+        minerals = read_minerals(csv_path).set_index("name", drop=False)
+    except OSError:
+        log("Could not read the crawl output at the following path: " + os.path.abspath(csv_path), -4, ERROR)
+
+    samples = _samples(csv_path, img_dump_path)
+    log("Packing " + str(len(samples)) + " images into shards at " + os.path.abspath(shard_path))
+
+    os.makedirs(shard_path, exist_ok=True)
+    start = time.perf_counter()
+    index = []
+    writer = None
+    written = 0
+    failed = 0
+
+    # images are decoded and resized in parallel but come back in order, so the shards are the same every run
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        jobs = ((path, tuple(sizes), quality) for _, _, _, path in samples)
+        for (key, name, uri, path), result in zip(samples, executor.map(_resize, jobs, chunksize=CHUNK)):
+
+            if isinstance(result, str):
+                log("Could not decode the image at " + path + ": " + result, level=WARNING, uri=uri, image=path)
+                failed += 1
+                continue
+
+            # start a new shard once the current one is full
+            if writer is None or writer.fileobj.tell() >= shard_size * 1024 * 1024:
+                if writer is not None:
+                    writer.close()
+                index.append({"shard": SHARD_NAME.format(len(index)), "samples": 0})
+                writer = tarfile.open(os.path.join(shard_path, index[-1]["shard"]), "w")
+
+            labels = _labels(minerals, name)
+            labels["uri"] = uri
+
+            for size, data in zip(sizes, result):
+                _add(writer, key + "." + str(size) + ".jpg", data)
+            _add(writer, key + ".json", json.dumps(labels).encode("utf-8"))
+
+            index[-1]["samples"] += 1
+            written += 1
+
+    if writer is not None:
+        writer.close()
+
+    with open(os.path.join(shard_path, SHARD_INDEX), "w", encoding="utf-8") as file:
+        json.dump({"sizes": list(sizes), "shards": index}, file, indent=4)
+
+    elapsed = time.perf_counter() - start
+    log(
+        "Packed " + str(written) + " images into " + str(len(index)) + " shards in " + format(elapsed, ".2f")
+        + " seconds, " + str(failed) + " images could not be decoded.",
+        samples=written, shards=len(index), failed=failed, seconds=elapsed
+    )
+
+    return index
+
+
+# lists the images to pack
+def _samples(csv_path, img_dump_path):
+    """
+    _samples
+
+    Lists every downloaded image with the mineral it belongs to. Images in a content store are found through its index,
+    images in a flat image dump by their name.
+
+    :param csv_path: the crawl output, used for flat image dumps.
+    :param img_dump_path: the directory the images were downloaded to.
+    :return: a list of (sample key, mineral name, image uri, image path) in mineral and uri order.
+    """
+
+    if os.path.isfile(os.path.join(img_dump_path, INDEX_NAME)):
+        store = ImageStore(img_dump_path)
+        images = [(name, uri, path) for name, uri, _, path in store.images()]
+        store.close()
+    else:
+        images = sorted(
+            (name, uri, os.path.join(img_dump_path, filename))
+            for name, uri, filename in read_images(csv_path).itertuples(index=False)
+            if os.path.isfile(os.path.join(img_dump_path, filename))
+        )
+
+    # keys must not contain dots, the first dot separates the key from the member's extension
+    samples = []
+    counts = dict()
+    for name, uri, path in images:
+        counts[name] = counts.get(name, -1) + 1
+        samples.append((str(name).replace(".", "_") + "_" + str(counts[name]), name, uri, path))
+
+    return samples
+
+
+# labels of a mineral
+def _labels(minerals, name):
+    """
+    _labels
+
+    :param minerals: the minerals DataFrame indexed on name.
+    :param name: the name of the mineral.
+    :return: a dictionary of the mineral's labels, only its name if it is not in the crawl output.
+    """
+
+    if name not in minerals.index:
+        return {"name": name}
+
+    row = minerals.loc[name]
+    labels = dict((column, None if row[column] != row[column] else row[column]) for column in minerals.columns)
+    labels["hardness"] = None if labels["hardness"] is None else float(labels["hardness"])
+
+    return labels
+
+
+# adds a member to a shard
+def _add(writer, name, data):
+    """
+    _add
+
+    Adds a member to a shard with a fixed owner and timestamp, so packing the same images gives the same bytes.
+
+    :param writer: the open tarfile.
+    :param name: the name of the member.
+    :param data: the bytes of the member.
+    """
+
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o444
+    info.mtime = 0
+    writer.addfile(info, io.BytesIO(data))
+
+
+# decodes and resizes one image, run in a worker process
+def _resize(job):
+    """
+    _resize
+
+    Decodes an image and resizes it to every size, scaling the shorter side to the size and cropping the centre square.
+
+    :param job: a tuple of the image path, the sizes and the JPEG quality.
+    :return: a list of the JPEG bytes of every size, or a string describing why the image could not be decoded.
+    """
+
+    path, sizes, quality = job
+
+    try:
+        with Image.open(path) as image:
+            image.load()
+            image = image.convert("RGB")
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        return repr(e)
+
+    results = []
+    for size in sizes:
+        scale = size / min(image.size)
+        width, height = max(size, round(image.width * scale)), max(size, round(image.height * scale))
+        left, top = (width - size) // 2, (height - size) // 2
+
+        resized = image.resize((width, height), Image.BILINEAR).crop((left, top, left + size, top + size))
+
+        buffer = io.BytesIO()
+        resized.save(buffer, "JPEG", quality=quality)
+        results.append(buffer.getvalue())
+
+    return results
+
+
+# logging
+def log(log_string, exit_code=None, level=INFO, **fields):
+    """
+    log
+
+    function used to dump strings into the log file
+
+    :param log_string: the string to be dumped to log file
+    :param exit_code: allows us to log an exit code and exit with that code, logs both errors and successes
+    :param level: the level of the message
+    :param fields: extra fields written with the message when logging JSON
+    """
+
+    _LOGGER.log(log_string, level, **fields)
+
+    # if an exit code is provided we can log that exit code and exit using that code
+    if exit_code is not None:
+        _LOGGER.log("The program exited with exit code: " + str(exit_code), ERROR if exit_code else INFO)
+        _LOGGER.close()
+        exit(exit_code)
+
+
+def main():
+    """
+    main
+
+    Packs the shards with the given environment variables.
+    """
+    pack_shards(CSV_PATH, IMG_DUMP_PATH, SHARD_PATH, SIZES, SHARD_SIZE, PROCESSES, QUALITY)
+    log("All images have been packed.", 0)
+
+
+if __name__ == "__main__":
+    """
+    Executes main if not being imported.
+    """
+    main()
@@ -0,0 +1,342 @@
+"""
+MineralPydiaSnapshot.py
+
+Versioned snapshots of the minerals collected by MineralPydiaCrawl.py, and the changes between them.
+
+Every crawl output overwrites the last one, so everything downstream has to reload and re-index the whole table even
+when only a couple of minerals changed. A snapshot keeps the minerals of one crawl, one JSON object per mineral in a
+gzipped file numbered after the snapshots before it, with the SHA-256 of each mineral's canonical form. Two snapshots
+are compared by their hashes first, so only the minerals whose hash differs are looked at field by field, and the
+result is a compact changeset:
+    added     - the full record of every new mineral
+    removed   - the name of every mineral that is gone
+    changed   - for every changed mineral, the new value of each field that changed and the image uris added to and
+                removed from it
+    images    - every (mineral, image uri) pair added or removed, all the image wrangler needs to apply the change
+A snapshot identical to the latest one is not stored again.
+"""
+
+# snapshots
+import hashlib
+import json
+import gzip
+
+# logging
+from datetime import datetime
+import time
+import os
+
+
+"""
+ENVIRONMENT VARIABLES
+
+CSV_PATH - the crawl output to snapshot, either the csv or a .parquet/.feather output.
+SNAPSHOT_PATH - the directory the snapshots and changesets are kept in.
+FROM_VERSION - the snapshot to compare from. If left None the snapshot before TO_VERSION is used.
+TO_VERSION - the snapshot to compare to. If left None CSV_PATH is snapshotted and compared against the latest snapshot.
+"""
+CSV_PATH = "./MineralPydiaCrawlData.csv"
+SNAPSHOT_PATH = "./snapshots"
+FROM_VERSION = None
+TO_VERSION = None
+
+# the fields of a mineral, in the order they are hashed
+FIELDS = ["habit", "color", "streak", "class", "fracture", "hardness", "hardness_text"]
+
+# fields only some outputs keep, left out of the record where missing so a csv hashes as it did before they were added
+OPTIONAL_FIELDS = ["hardness_text"]
+
+# name of the index listing every snapshot
+SNAPSHOT_INDEX = "snapshots.json"
+
+# name of each snapshot and changeset
+SNAPSHOT_NAME = "{version}.jsonl.gz"
+CHANGESET_NAME = "{old}..{new}.json"
+
+
+# canonical form of a mineral
+def canonical(name, mineral_info):
+    """
+    canonical
+
+    The form a mineral is stored and hashed in. Missing values are None, or left out for OPTIONAL_FIELDS, hardness is a
+    float and the image uris are in page order without repeats.
+
+    :param name: the name of the mineral.
+    :param mineral_info: the dictionary of mineral data built by MineralPydiaCrawl._fill_dict.
+    :return: a dictionary of the name, every one of FIELDS, the images and the hash of them all.
+    """
+
+    record = {"name": name}
+    for field in FIELDS:
+        value = mineral_info.get(field)
+
+        # missing values read back from a table are NaN
+        if value is None or value != value:
+            if field not in OPTIONAL_FIELDS:
+                record[field] = None
+        elif field == "hardness":
+            record[field] = float(value)
+        else:
+            record[field] = str(value)
+
+    record["images"] = list(dict.fromkeys(uri for uri in mineral_info.get("images", []) if uri is not None))
+
+    # the order images are listed in is not a change, the hash is of them sorted
+    hashed = dict(record, images=sorted(record["images"]))
+    record["hash"] = hashlib.sha256(json.dumps(hashed, sort_keys=True).encode("utf-8")).hexdigest()
+
+    return record
+
+
+# reads the minerals of a crawl output
+def read_output(path):
+    """
+    read_output
+
+    Reads a crawl output into the same shape as the crawler's mineral dictionary.
+
+    :param path: the path of the csv, or of the parquet or feather output.
+    :return: a dictionary of every mineral's name to its dictionary of mineral data.
+    """
+
+    from MineralPydiaOutput import read_minerals, read_images
+
+    minerals = dict(
+        (row["name"], dict(((field, row[field]) for field in FIELDS), images=[]))
+        for row in read_minerals(path).to_dict("records")
+    )
+    for name, uri in read_images(path)[["name", "image_uri"]].itertuples(index=False):
+        if name in minerals:
+            minerals[name]["images"].append(uri)
+
+    return minerals
+
+
+# lists the stored snapshots
+def snapshots(snapshot_path):
+    """
+    snapshots
+
+    :param snapshot_path: the directory the snapshots are kept in.
+    :return: a list of every snapshot's index entry, oldest first, each with its version, creation time, source, number
+             of minerals and images, and digest.
+    """
+
+    try:
+        with open(os.path.join(snapshot_path, SNAPSHOT_INDEX), encoding="utf-8") as file:
+            return json.load(file)["snapshots"]
+    except FileNotFoundError:
+        return []
+
+
+# loads a snapshot
+def load(snapshot_path, version):
+    """
+    load
+
+    :param snapshot_path: the directory the snapshots are kept in.
+    :param version: the version of the snapshot.
+    :return: a dictionary of every mineral's name to its canonical record.
+    """
+
+    with gzip.open(os.path.join(snapshot_path, SNAPSHOT_NAME.format(version=version)), "rt", encoding="utf-8") as file:
+        records = (json.loads(line) for line in file)
+        return dict((record["name"], record) for record in records)
+
+
+# stores a snapshot
+def take(snapshot_path, minerals, source=None):
+    """
+    take
+
+    Stores the minerals as a new snapshot, unless they are identical to the latest snapshot.
+
+    :param snapshot_path: the directory the snapshots are kept in, created if missing.
+    :param minerals: a dictionary of every mineral's name to its dictionary of mineral data.
+    :param source: the crawl output the minerals came from, recorded in the index.
+    :return: a tuple of the version of the snapshot and True if it was new, or the latest version and False if the
+             minerals were identical to it.
+    """
+
+    records = [canonical(name, minerals[name]) for name in sorted(minerals)]
+    digest = hashlib.sha256("".join(record["hash"] for record in records).encode("utf-8")).hexdigest()
+
+    index = snapshots(snapshot_path)
+    if index and index[-1]["digest"] == digest:
+        return index[-1]["version"], False
+
+    os.makedirs(snapshot_path, exist_ok=True)
+    version = "v" + format(len(index) + 1, "06d")
+
+    # written under a temporary name first, so a snapshot is either whole or not there at all
+    path = os.path.join(snapshot_path, SNAPSHOT_NAME.format(version=version))
+    with gzip.open(path + ".part", "wt", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+    os.replace(path + ".part", path)
+
+    index.append({
+        "version": version,
+        "created": datetime.now().isoformat(),
+        "source": None if source is None else os.path.abspath(source),
+        "minerals": len(records),
+        "images": sum(len(record["images"]) for record in records),
+        "digest": digest
+    })
+    with open(os.path.join(snapshot_path, SNAPSHOT_INDEX) + ".part", "w", encoding="utf-8") as file:
+        json.dump({"snapshots": index}, file, indent=4)
+    os.replace(os.path.join(snapshot_path, SNAPSHOT_INDEX) + ".part", os.path.join(snapshot_path, SNAPSHOT_INDEX))
+
+    return version, True
+
+
+# compares two snapshots
+def diff(old, new):
+    """
+    diff
+
+    Compares two snapshots by the hash of every mineral, only minerals whose hash differs are compared field by field.
+
+    :param old: the snapshot compared from, as returned by load.
+    :param new: the snapshot compared to, as returned by load.
+    :return: the changeset, a dictionary of the added, removed and changed minerals and the added and removed images.
+    """
+
+    added = [new[name] for name in sorted(new.keys() - old.keys())]
+    removed = sorted(old.keys() - new.keys())
+    changed = []
+    images = {"added": [], "removed": []}
+
+    for record in added:
+        images["added"].extend([record["name"], uri] for uri in record["images"])
+    for name in removed:
+        images["removed"].extend([name, uri] for uri in old[name]["images"])
+
+    for name in sorted(new.keys() & old.keys()):
+        if new[name]["hash"] == old[name]["hash"]:
+            continue
+
+        fields = dict(
+            (field, new[name].get(field)) for field in FIELDS if new[name].get(field) != old[name].get(field)
+        )
+        old_images, new_images = set(old[name]["images"]), set(new[name]["images"])
+        images_added = [uri for uri in new[name]["images"] if uri not in old_images]
+        images_removed = [uri for uri in old[name]["images"] if uri not in new_images]
+
+        # a mineral whose images were only reordered hashes the same, so something here always differs
+        changed.append({"name": name, "fields": fields, "images_added": images_added, "images_removed": images_removed})
+        images["added"].extend([name, uri] for uri in images_added)
+        images["removed"].extend([name, uri] for uri in images_removed)
+
+    return {"added": added, "removed": removed, "changed": changed, "images": images}
+
+
+# snapshots the minerals and writes the changeset against the latest snapshot
+def record(snapshot_path, minerals, source=None):
+    """
+    record
+
+    Stores the minerals as a new snapshot and writes the changeset from the snapshot before it, e.g. after a crawl.
+
+    :param snapshot_path: the directory the snapshots and changesets are kept in.
+    :param minerals: a dictionary of every mineral's name to its dictionary of mineral data.
+    :param source: the crawl output the minerals came from, recorded in the index.
+    :return: a tuple of the snapshot's version, and the path of the changeset or None if this is the first snapshot or
+             nothing changed.
+    """
+
+    version, new = take(snapshot_path, minerals, source)
+    index = snapshots(snapshot_path)
+    if not new or len(index) < 2:
+        return version, None
+
+    return version, write_changeset(snapshot_path, index[-2]["version"], version)
+
+
+# writes the changeset between two stored snapshots
+def write_changeset(snapshot_path, old_version, new_version):
+    """
+    write_changeset
+
+    :param snapshot_path: the directory the snapshots and changesets are kept in.
+    :param old_version: the version compared from.
+    :param new_version: the version compared to.
+    :return: the path of the changeset.
+    """
+
+    changeset = diff(load(snapshot_path, old_version), load(snapshot_path, new_version))
+    changeset = dict({"from": old_version, "to": new_version}, **changeset)
+
+    path = os.path.join(snapshot_path, CHANGESET_NAME.format(old=old_version, new=new_version))
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(changeset, file)
+
+    return path
+
+
+# reads a changeset
+def read_changeset(path):
+    """
+    read_changeset
+
+    :param path: the path of a changeset written by write_changeset.
+    :return: the changeset.
+    """
+
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+# describes a changeset
+def summary(changeset):
+    """
+    summary
+
+    :param changeset: a changeset.
+    :return: a one line description of the number of minerals and images added, removed and changed.
+    """
+
+    return (
+        str(len(changeset["added"])) + " minerals added, " + str(len(changeset["removed"])) + " removed, "
+        + str(len(changeset["changed"])) + " changed, " + str(len(changeset["images"]["added"])) + " images added, "
+        + str(len(changeset["images"]["removed"])) + " removed"
+    )
+
+
+def main():
+    """
+    main
+
+    Snapshots the crawl output and writes the changeset from the latest snapshot, or writes the changeset between two
+    stored snapshots, with the given environment variables.
+    """
+
+    start = time.perf_counter()
+
+    if TO_VERSION is None:
+        version, path = record(SNAPSHOT_PATH, read_output(CSV_PATH), CSV_PATH)
+        if path is None:
+            print("Snapshot " + version + " of " + os.path.abspath(CSV_PATH) + " has no changeset, it is either the "
+                  "first snapshot or identical to the latest one.")
+            return
+    else:
+        versions = [entry["version"] for entry in snapshots(SNAPSHOT_PATH)]
+        if TO_VERSION not in versions or (FROM_VERSION is None and versions.index(TO_VERSION) == 0):
+            print("There is no snapshot to compare " + str(TO_VERSION) + " with in " + os.path.abspath(SNAPSHOT_PATH))
+            return
+
+        old = FROM_VERSION if FROM_VERSION is not None else versions[versions.index(TO_VERSION) - 1]
+        path = write_changeset(SNAPSHOT_PATH, old, TO_VERSION)
+
+    print(
+        summary(read_changeset(path)) + ", written to " + os.path.abspath(path) + " in "
+        + format(time.perf_counter() - start, ".2f") + " seconds"
+    )
+
+
+if __name__ == "__main__":
+    """
+    Executes main if not being imported.
+    """
+    main()
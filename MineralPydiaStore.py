@@ -0,0 +1,314 @@
+"""
+MineralPydiaStore.py
+
+Content addressed image store used by MineralPydiaImageWrangle.py.
+
+Naming downloaded images after the last segment of their uri lets different images with the same filename overwrite
+each other, and stores the same photo once for every uri it is served under. The store instead names every image by
+the SHA-256 of its bytes, in a directory sharded on the first two bytes of the hash:
+    <root>/objects/ab/cd/abcd...
+so identical bytes are only ever stored once, however many uris or minerals they belong to.
+
+An index (a small SQLite database) records the download state and hash of every uri, and maps every (mineral, uri)
+pair to its uri, so the image of any pair can be found from its hash. Named copies for browsing can be made as hard
+links, which take no extra space.
+"""
+
+# storage
+import sqlite3
+import threading
+import hashlib
+import shutil
+import os
+
+# timestamps
+from datetime import datetime
+
+# image statuses, shared with the manifest
+from MineralPydiaManifest import COMPLETE
+
+
+# default name of the index inside the store
+INDEX_NAME = "index.sqlite"
+
+
+# class ImageStore
+class ImageStore:
+    """
+    ImageStore
+
+    Thread safe content addressed store of images and its index.
+    """
+
+    def __init__(self, root, index_path=None):
+        """
+        __init__
+
+        Opens the store, creating it if it does not already exist.
+
+        :param root: the directory the store is kept in.
+        :param index_path: path of the index database, if None it is kept in the root of the store.
+        """
+
+        self.root = root
+        self._objects = os.path.join(root, "objects")
+        self._tmp = os.path.join(root, "tmp")
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._tmp, exist_ok=True)
+
+        # a single connection shared by all download threads, every access goes through the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            index_path if index_path is not None else os.path.join(root, INDEX_NAME), check_same_thread=False
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS uris ("
+            "uri TEXT PRIMARY KEY, "
+            "sha256 TEXT, "
+            "size INTEGER, "
+            "status TEXT NOT NULL, "
+            "updated TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS refs ("
+            "mineral TEXT NOT NULL, "
+            "uri TEXT NOT NULL, "
+            "PRIMARY KEY (mineral, uri))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS uris_sha256 ON uris (sha256)")
+        self._conn.commit()
+
+    def blob_path(self, sha256):
+        """
+        blob_path
+
+        :param sha256: the hex SHA-256 of an image.
+        :return: the path the image is stored at.
+        """
+
+        return os.path.join(self._objects, sha256[:2], sha256[2:4], sha256)
+
+    def part_path(self, uri):
+        """
+        part_path
+
+        :param uri: the uri of an image.
+        :return: the path the image is downloaded to before its hash is known.
+        """
+
+        return os.path.join(self._tmp, hashlib.sha1(uri.encode("utf-8")).hexdigest() + ".part")
+
+    def get(self, uri):
+        """
+        get
+
+        Looks up the record of a uri.
+
+        :param uri: the uri of the image.
+        :return: a dictionary with the sha256, size and status of the uri, or None if it has never been seen.
+        """
+
+        with self._lock:
+            row = self._conn.execute("SELECT sha256, size, status FROM uris WHERE uri = ?", (uri,)).fetchone()
+
+        if row is None:
+            return None
+
+        return {"sha256": row[0], "size": row[1], "status": row[2]}
+
+    def is_complete(self, uri):
+        """
+        is_complete
+
+        Checks if the image of a uri has already been stored in full. The index must say so and the stored image must
+        still be the size that was recorded.
+
+        :param uri: the uri of the image.
+        :return: True if the uri does not need to be downloaded again.
+        """
+
+        record = self.get(uri)
+        if record is None or record["status"] != COMPLETE:
+            return False
+
+        path = self.blob_path(record["sha256"])
+        return os.path.isfile(path) and os.path.getsize(path) == record["size"]
+
+    def mark(self, uri, status, size=None, sha256=None):
+        """
+        mark
+
+        Records the current state of a uri, replacing any earlier record.
+
+        :param uri: the uri of the image.
+        :param status: one of PARTIAL, COMPLETE or FAILED.
+        :param size: the size of the image in bytes, if known.
+        :param sha256: the hex SHA-256 of the image, if known.
+        """
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uris (uri, sha256, size, status, updated) VALUES (?, ?, ?, ?, ?)",
+                (uri, sha256, size, status, datetime.now().isoformat())
+            )
+            self._conn.commit()
+
+    def commit(self, uri, part, sha256, size):
+        """
+        commit
+
+        Moves a finished download into the store under its hash. If the same bytes are already stored the download is
+        thrown away instead.
+
+        :param uri: the uri the image was downloaded from.
+        :param part: the path the image was downloaded to.
+        :param sha256: the hex SHA-256 of the image.
+        :param size: the size of the image in bytes.
+        :return: True if the bytes were new to the store, False if they were already stored.
+        """
+
+        path = self.blob_path(sha256)
+
+        if os.path.isfile(path) and os.path.getsize(path) == size:
+            os.remove(part)
+            stored = False
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(part, path)
+            stored = True
+
+        self.mark(uri, COMPLETE, size, sha256)
+        return stored
+
+    def reference(self, mineral, uri):
+        """
+        reference
+
+        Records that an image uri belongs to a mineral.
+
+        :param mineral: the name of the mineral.
+        :param uri: the uri of the image.
+        """
+
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO refs (mineral, uri) VALUES (?, ?)", (mineral, uri))
+            self._conn.commit()
+
+    def unreference(self, mineral, uri):
+        """
+        unreference
+
+        Forgets that an image uri belongs to a mineral. The image stays stored, it may belong to other minerals.
+
+        :param mineral: the name of the mineral.
+        :param uri: the uri of the image.
+        """
+
+        with self._lock:
+            self._conn.execute("DELETE FROM refs WHERE mineral = ? AND uri = ?", (mineral, uri))
+            self._conn.commit()
+
+    def images(self, mineral=None):
+        """
+        images
+
+        Lists the stored images of every mineral, or of one mineral.
+
+        :param mineral: the name of a mineral, if None every mineral is listed.
+        :return: a list of (mineral, uri, sha256, path) for every stored image, in mineral and uri order.
+        """
+
+        query = (
+            "SELECT refs.mineral, refs.uri, uris.sha256 FROM refs JOIN uris ON refs.uri = uris.uri "
+            "WHERE uris.status = ?"
+        )
+        parameters = (COMPLETE,)
+        if mineral is not None:
+            query += " AND refs.mineral = ?"
+            parameters += (mineral,)
+
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY refs.mineral, refs.uri", parameters).fetchall()
+
+        return [(row[0], row[1], row[2], self.blob_path(row[2])) for row in rows]
+
+    def path(self, mineral, uri):
+        """
+        path
+
+        :param mineral: the name of the mineral.
+        :param uri: the uri of the image.
+        :return: the path of the stored image, or None if it is not stored.
+        """
+
+        for _, image_uri, _, path in self.images(mineral):
+            if image_uri == uri:
+                return path
+
+        return None
+
+    def link(self, directory):
+        """
+        link
+
+        Makes a named copy of every stored image as <directory>/<mineral>/<last segment of the uri>. Copies are hard
+        links into the store, so they take no extra space, unless the directory is on another file system. Two images
+        of one mineral with the same last segment are told apart by prefixing the start of their hash.
+
+        :param directory: the directory to make the named copies in.
+        :return: the number of named copies made.
+        """
+
+        made = 0
+        names = dict()
+
+        for mineral, uri, sha256, path in self.images():
+            name = uri.split("/")[-1]
+            if names.setdefault((mineral, name), sha256) != sha256:
+                name = sha256[:12] + "_" + name
+
+            target = os.path.join(directory, mineral, name)
+            if os.path.exists(target):
+                continue
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copyfile(path, target)
+            made += 1
+
+        return made
+
+    def counts(self):
+        """
+        counts
+
+        Counts what the store holds.
+
+        :return: a dictionary of the number of uris in each status, the number of distinct images stored, the number of
+                 (mineral, uri) references, the bytes stored and the bytes the uris would take stored separately.
+        """
+
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM uris GROUP BY status").fetchall())
+            counts["images"], counts["stored_bytes"] = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM "
+                "(SELECT sha256, MAX(size) AS size FROM uris WHERE status = ? GROUP BY sha256)", (COMPLETE,)
+            ).fetchone()
+            counts["uri_bytes"] = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM uris WHERE status = ?", (COMPLETE,)
+            ).fetchone()[0]
+            counts["references"] = self._conn.execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+
+        return counts
+
+    def close(self):
+        """
+        close
+
+        Closes the index.
+        """
+
+        with self._lock:
+            self._conn.close()
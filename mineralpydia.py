@@ -0,0 +1,539 @@
+"""
+mineralpydia.py
+
+One command line for every MineralPydia program, e.g.
+    python mineralpydia.py crawl --num-pages 3 --engine http --workers 4
+    python mineralpydia.py download --workers 8
+    python mineralpydia.py query quartz
+    python mineralpydia.py status
+
+Every program is still configured by its module globals, documented under ENVIRONMENT VARIABLES in its own file. The
+subcommands set those globals from arguments and environment variables instead of editing the source: each global NAME
+of a subcommand is read from, in order,
+    --name                              - the argument, e.g. --num-pages or --img-dump-path
+    MINERALPYDIA_<SUBCOMMAND>_<NAME>    - an environment variable for one subcommand, e.g. MINERALPYDIA_CRAWL_WORKERS
+    MINERALPYDIA_<NAME>                 - an environment variable shared by every subcommand, e.g. MINERALPYDIA_CSV_PATH
+and is left as the program's default if none of them are set. A value of "none" sets a global that may be None to None.
+
+Nothing but the standard library is imported until a subcommand runs, and then only the program it runs, so --help,
+query and status start in tens of milliseconds and pandas, pyarrow, selenium and psutil are only loaded by the
+subcommands that use them.
+"""
+
+# argument parsing
+import importlib
+import argparse
+import json
+import sys
+import os
+
+
+# prefix of every environment variable
+ENV_PREFIX = "MINERALPYDIA_"
+
+# values read as None by optional globals
+NONE_VALUES = ("", "none", "null")
+
+# values read as True and False by flags
+TRUE_VALUES = ("1", "true", "yes", "on")
+FALSE_VALUES = ("0", "false", "no", "off")
+
+
+# reads a number of pages
+def _pages(value):
+    """
+    _pages
+
+    :param value: "*" or a positive integer.
+    :return: "*", or the integer.
+    """
+
+    if str(value).strip() == "*":
+        return "*"
+
+    pages = int(value)
+    if pages < 1:
+        raise ValueError("must crawl at least one page")
+
+    return pages
+
+
+# reads a flag
+def _flag(value):
+    """
+    _flag
+
+    :param value: one of TRUE_VALUES or FALSE_VALUES, in any case.
+    :return: True or False.
+    """
+
+    if str(value).strip().lower() in TRUE_VALUES:
+        return True
+    if str(value).strip().lower() in FALSE_VALUES:
+        return False
+
+    raise ValueError("expected one of " + ", ".join(TRUE_VALUES + FALSE_VALUES))
+
+
+# reads a value that may be None
+def _optional(cast):
+    """
+    _optional
+
+    :param cast: reads a value that is not None.
+    :return: a function reading one of NONE_VALUES as None and anything else with cast.
+    """
+
+    def read(value):
+        if str(value).strip().lower() in NONE_VALUES:
+            return None
+        return cast(value)
+
+    read.__name__ = cast.__name__
+    return read
+
+
+# reads a comma separated list
+def _list(cast):
+    """
+    _list
+
+    :param cast: reads one item.
+    :return: a function reading a comma separated list of items with cast.
+    """
+
+    def read(value):
+        return [cast(item) for item in str(value).split(",") if item.strip()]
+
+    read.__name__ = cast.__name__ + " list"
+    return read
+
+
+# the subcommands, each with the module it runs and the globals it sets as (name, type, help)
+# a type of _flag is given as --name and --no-name
+COMMANDS = {
+    "crawl": ("MineralPydiaCrawl", "Crawl Mineralpedia into a csv or columnar output.", [
+        ("OUTPUT", _optional(str), "the crawl output, its extension must match --format"),
+        ("NUM_PAGES", _pages, 'the number of listing pages to crawl, "*" for all of them'),
+        ("ENGINE", str, '"selenium" to render pages in Firefox, "http" to fetch and parse them'),
+        ("WORKERS", int, "the number of workers mineral pages are shared between"),
+        ("LISTING_WORKERS", int, "the number of workers listing pages are shared between"),
+        ("RATE_LIMIT", _optional(float), "the most page requests per second across all workers"),
+        ("ADAPTIVE", _flag, "lower the request rate whenever the site answers 429 or 503"),
+        ("RETRIES", int, "the number of times a page that failed to load is retried"),
+        ("DEAD_LETTERS", _optional(str), "the file pages that could not be loaded are recorded in"),
+        ("CACHE_PATH", _optional(str), "the page cache used by the http engine for incremental re-crawls"),
+        ("REFRESH", str, '"conditional" or "full", how cached pages are refreshed'),
+        ("SINCE", _optional(str), "an ISO timestamp, pages cached since are used without asking the server"),
+        ("FORMAT", str, '"csv", "parquet" or "feather"'),
+        ("CHECKPOINT", _optional(str), "the checkpoint file recording the crawl as it goes"),
+        ("RESUME", _flag, "continue from the checkpoint left by the last run"),
+        ("BROWSER_PAGES", _optional(int), "the pages each browser renders before it is replaced"),
+        ("BROWSER_RSS", _optional(int), "the megabytes each browser uses before it is replaced"),
+        ("BROWSER_PREWARM", int, "the number of browsers kept started ahead of time"),
+        ("FIREFOX", _optional(str), "the path of the Firefox executable"),
+        ("METRICS", _optional(str), "the JSON report of stage timings and counters"),
+        ("METRICS_PORT", _optional(int), "a local port the live metrics are served on"),
+        ("SNAPSHOTS", _optional(str), "a directory every crawl is kept in as a versioned snapshot")
+    ]),
+    "download": ("MineralPydiaImageWrangle", "Download the images of a crawl output.", [
+        ("CSV_PATH", str, "the crawl output to load in"),
+        ("IMG_DUMP_PATH", str, "the directory to download images to"),
+        ("STORE", str, '"content" to store images by the hash of their bytes, "flat" by their uri'),
+        ("LINKS", _optional(str), "a directory to make named hard links of the content store's images in"),
+        ("WORKERS", int, "the number of images downloaded at once"),
+        ("PER_HOST", int, "the most downloads against a single host at once"),
+        ("MANIFEST_PATH", _optional(str), "the download manifest used to skip and resume images"),
+        ("POOL_SIZE", int, "the most kept alive connections per host"),
+        ("RATE_LIMIT", _optional(float), "the most image requests per second against each host"),
+        ("ADAPTIVE", _flag, "lower the request rate against a host whenever it answers 429 or 503"),
+        ("RETRIES", int, "the number of times a download that failed is retried"),
+        ("DEAD_LETTERS", _optional(str), "the file images that could not be downloaded are recorded in"),
+        ("METRICS", _optional(str), "the JSON report of stage timings and counters"),
+        ("METRICS_PORT", _optional(int), "a local port the live metrics are served on"),
+        ("SHARDS", _optional(str), "a directory to pack the downloaded images into training shards in"),
+        ("CHANGESET", _optional(str), "a snapshot changeset, only the images it adds are downloaded")
+    ]),
+    "pipeline": ("MineralPydiaPipeline", "Crawl and download the images in a single process.", [
+        ("NUM_PAGES", _pages, 'the number of listing pages to crawl, "*" for all of them'),
+        ("OUTPUT", _optional(str), "the crawl output"),
+        ("ENGINE", str, '"selenium" to render pages in Firefox, "http" to fetch and parse them'),
+        ("CRAWL_WORKERS", int, "the number of workers mineral pages are shared between"),
+        ("LISTING_WORKERS", int, "the number of workers listing pages are shared between"),
+        ("CACHE_PATH", _optional(str), "the page cache used by the http engine for incremental re-crawls"),
+        ("CRAWL_RATE_LIMIT", _optional(float), "the most page requests per second across all crawl workers"),
+        ("IMG_DUMP_PATH", str, "the directory to download images to"),
+        ("STORE", str, '"content" to store images by the hash of their bytes, "flat" by their uri'),
+        ("DOWNLOAD_WORKERS", int, "the number of images downloaded at once"),
+        ("PER_HOST", int, "the most downloads against a single host at once"),
+        ("QUEUE_SIZE", int, "the most images waiting to be downloaded before the crawl is held back"),
+        ("IMAGE_RATE_LIMIT", _optional(float), "the most image requests per second against each host"),
+        ("RETRIES", int, "the number of times a page or image that failed to load is retried")
+    ]),
+    "distributed": ("MineralPydiaDistributed", "Crawl as one node of a distributed crawl over a shared queue.", [
+        ("ROLE", str, '"coordinator" to seed, work and merge the queue, "worker" to only work it'),
+        ("QUEUE_PATH", str, "the shared work queue"),
+        ("WORKER_ID", _optional(str), "the name this node claims work under"),
+        ("LEASE", float, "the seconds claimed work is held for before other nodes may claim it"),
+        ("POLL", float, "the seconds a node waits before asking again when there is no work"),
+        ("MAX_ATTEMPTS", int, "the number of times an item is claimed before it is given up on"),
+        ("NUM_PAGES", _pages, 'the number of listing pages to crawl, "*" for all of them'),
+        ("OUTPUT", _optional(str), "the merged crawl output"),
+        ("ENGINE", str, '"selenium" to render pages in Firefox, "http" to fetch and parse them'),
+        ("WORKERS", int, "the number of workers on this node"),
+        ("RATE_LIMIT", _optional(float), "the most page requests per second made by this node"),
+        ("IMG_DUMP_PATH", _optional(str), "the content store images are downloaded to")
+    ]),
+    "snapshot": ("MineralPydiaSnapshot", "Snapshot a crawl output and write the changeset from the last one.", [
+        ("CSV_PATH", str, "the crawl output to snapshot"),
+        ("SNAPSHOT_PATH", str, "the directory the snapshots and changesets are kept in"),
+        ("FROM_VERSION", _optional(str), "the snapshot to compare from"),
+        ("TO_VERSION", _optional(str), "the snapshot to compare to, if not given the crawl output is snapshotted")
+    ]),
+    "shard": ("MineralPydiaShard", "Pack the downloaded images into training shards.", [
+        ("CSV_PATH", str, "the crawl output the labels are read from"),
+        ("IMG_DUMP_PATH", str, "the directory the images were downloaded to"),
+        ("SHARD_PATH", str, "the directory the shards are written to"),
+        ("SIZES", _list(int), "the comma separated sizes in pixels each image is resized to"),
+        ("SHARD_SIZE", int, "the number of megabytes after which a new shard is started"),
+        ("PROCESSES", _optional(int), "the number of worker processes decoding and resizing images"),
+        ("QUALITY", int, "the JPEG quality the resized images are written with")
+    ]),
+    "normalize": ("MineralPydiaNormalize", "Normalize a crawl output into token tables.", [
+        ("CSV_PATH", str, "the crawl output to normalize"),
+        ("OUTPUT_PATH", str, "the normalized table")
+    ]),
+    "query": ("MineralPydiaQuery", "Query the minerals of a crawl output, see query --help.", [
+        ("CSV_PATH", str, "the crawl output to query"),
+        ("INDEX_PATH", _optional(str), "the directory the index is kept in")
+    ]),
+    "bench": ("MineralPydiaBench", "Benchmark the crawler and downloader against a local stand-in site.", [
+        ("NUM_IMAGES", int, "the number of images to download in each run"),
+        ("IMAGE_SIZE", int, "the size of each served image in bytes"),
+        ("LATENCY", float, "the seconds the stand-in waits before answering each request"),
+        ("WORKER_COUNTS", _list(int), "the comma separated download worker counts to benchmark"),
+        ("PER_HOST", int, "the per host concurrency limit handed to the downloader"),
+        ("POOL_SIZE", int, "the number of kept alive connections per host handed to the downloader"),
+        ("SITE_PAGES", int, "the number of listing pages on the stand-in site"),
+        ("SITE_MINERALS", int, "the number of minerals on each stand-in listing page"),
+        ("CRAWL_WORKER_COUNTS", _list(int), "the comma separated crawl worker counts to benchmark"),
+        ("SAVED_PAGES", _optional(str), "a directory of saved mineral pages to time field extraction over"),
+        ("QUERY_CSV", str, "the crawl output to time queries and normalization over"),
+        ("QUERY_REPEATS", int, "the number of times each query is timed"),
+        ("NORMALIZE_ROWS", int, "the number of rows normalized")
+    ]),
+    "replay": ("MineralPydiaReplay", "Record Mineralpedia, or benchmark against a recording and a baseline.", [
+        ("MODE", str, '"record" to record Mineralpedia, "bench" to benchmark against the recording'),
+        ("ARCHIVE", str, "the fixture archive"),
+        ("RECORD_PAGES", _pages, 'the number of listing pages to record, "*" for all of them'),
+        ("RECORD_MINERALS", _optional(int), "the most mineral pages to record"),
+        ("RECORD_IMAGES", _flag, "record the images of every recorded mineral too"),
+        ("RECORD_RATE_LIMIT", float, "the most requests per second made while recording"),
+        ("LATENCY", float, "the seconds the replay server waits before answering each request"),
+        ("JITTER", float, "the most extra seconds added to the latency of each request"),
+        ("ERROR_RATE", float, "the fraction of requests answered with 503"),
+        ("SEED", int, "the seed of the jitter and errors"),
+        ("CRAWL_WORKERS", int, "the crawl worker count benchmarked"),
+        ("DOWNLOAD_WORKERS", int, "the download worker count benchmarked"),
+        ("REPEATS", int, "the number of runs, the median of each result is reported"),
+        ("BASELINE", str, "the stored results compared against"),
+        ("UPDATE_BASELINE", _flag, "store the results as the new baseline instead of comparing them"),
+        ("TOLERANCE", float, "the fraction a result may be worse than the baseline before it is a regression")
+    ])
+}
+
+# commands whose remaining arguments are handed to the program's own parser
+PASSTHROUGH = ("query",)
+
+# the globals read by status, they are not any one program's so they are only set from arguments and the environment
+STATUS = [
+    ("OUTPUT", str, "the crawl output, its checkpoint, metrics and dead letters are kept next to it"),
+    ("IMG_DUMP_PATH", str, "the directory images are downloaded to"),
+    ("QUEUE_PATH", str, "the shared work queue of a distributed crawl"),
+    ("SNAPSHOT_PATH", str, "the directory snapshots are kept in")
+]
+STATUS_DEFAULTS = {
+    "OUTPUT": "./MineralPydiaCrawlData.csv",
+    "IMG_DUMP_PATH": "./img_dump",
+    "QUEUE_PATH": "./MineralPydiaQueue.sqlite",
+    "SNAPSHOT_PATH": "./snapshots"
+}
+
+
+# builds the argument parser
+def parser():
+    """
+    parser
+
+    :return: the argument parser of every subcommand.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="mineralpydia", description="Crawl Mineralpedia, download its images and query the results.",
+        epilog="Every option can also be set with MINERALPYDIA_<SUBCOMMAND>_<NAME> or MINERALPYDIA_<NAME>, "
+               "e.g. MINERALPYDIA_CRAWL_NUM_PAGES=3."
+    )
+    parser.add_argument("--log-level", help='the lowest level logged, "DEBUG", "INFO", "WARNING" or "ERROR"')
+    parser.add_argument("--log-format", help='"text" for the plain text logs, "json" for one JSON object per line')
+    commands = parser.add_subparsers(dest="command", metavar="command", required=True)
+
+    for command, (module, description, options) in COMMANDS.items():
+        subparser = commands.add_parser(
+            command, help=description, description=description + " Options left out keep the defaults of " + module
+            + ".py.", add_help=command not in PASSTHROUGH,
+            allow_abbrev=False
+        )
+        _add_options(subparser, options)
+
+    subparser = commands.add_parser(
+        "status", help="Show how far the crawl, downloads, queue and snapshots have got.",
+        description="Show how far the crawl, downloads, queue and snapshots have got."
+    )
+    _add_options(subparser, STATUS)
+    subparser.add_argument("--json", action="store_true", help="print the status as JSON")
+
+    return parser
+
+
+# adds the options of a list of globals to a parser
+def _add_options(parser, options):
+    """
+    _add_options
+
+    :param parser: the parser of a subcommand.
+    :param options: a list of (name, type, help) of the globals it sets.
+    """
+
+    for name, cast, help in options:
+        option = "--" + name.lower().replace("_", "-")
+        if cast is _flag:
+            parser.add_argument(
+                option, dest=name, action=argparse.BooleanOptionalAction, default=argparse.SUPPRESS, help=help
+            )
+        else:
+            parser.add_argument(
+                option, dest=name, type=cast, default=argparse.SUPPRESS, metavar=name, help=help
+            )
+
+
+# resolves the values of a subcommand's globals
+def resolve(command, options, args, environ=os.environ):
+    """
+    resolve
+
+    :param command: the name of the subcommand.
+    :param options: a list of (name, type, help) of the globals it sets.
+    :param args: the parsed arguments.
+    :param environ: the environment variables.
+    :return: a dictionary of every global given as an argument or environment variable to its value.
+    :raises ValueError: if an environment variable cannot be read.
+    """
+
+    values = dict()
+    for name, cast, _ in options:
+        if hasattr(args, name):
+            values[name] = getattr(args, name)
+            continue
+
+        for variable in (ENV_PREFIX + command.upper() + "_" + name, ENV_PREFIX + name):
+            if variable in environ:
+                try:
+                    values[name] = cast(environ[variable])
+                except ValueError as e:
+                    raise ValueError(variable + "=" + environ[variable] + ": " + str(e))
+                break
+
+    return values
+
+
+# gathers the state of a crawl and its downloads
+def status(output, img_dump_path, queue_path, snapshot_path):
+    """
+    status
+
+    Reads how far the crawl, downloads, distributed queue and snapshots have got, only reading what is on disk and
+    without importing any of the heavy dependencies. Anything that does not exist is left out.
+
+    :param output: the crawl output.
+    :param img_dump_path: the directory images are downloaded to.
+    :param queue_path: the shared work queue.
+    :param snapshot_path: the directory snapshots are kept in.
+    :return: a JSON serializable dictionary of the state of each part.
+    """
+
+    state = dict()
+    stem = os.path.splitext(output)[0]
+
+    # the checkpoint records every listing page and mineral as the crawl goes
+    crawl = dict()
+    if os.path.isfile(stem + ".checkpoint.jsonl"):
+        crawl["pages"] = None
+        crawl["listing_pages"] = crawl["minerals"] = crawl["skipped"] = 0
+        with open(stem + ".checkpoint.jsonl", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                if record["type"] == "count":
+                    crawl["pages"] = record["pages"]
+                elif record["type"] == "page":
+                    crawl["listing_pages"] += 1
+                elif record["type"] == "mineral":
+                    crawl["minerals"] += 1
+                elif record["type"] == "skipped":
+                    crawl["skipped"] += 1
+
+    for name, path in (("output", output), ("metrics", stem + ".metrics.json")):
+        if os.path.isfile(path):
+            crawl[name] = {"path": os.path.abspath(path), "bytes": os.path.getsize(path)}
+    crawl.update(_run(stem + ".metrics.json", stem + ".dead_letters.jsonl"))
+    if crawl:
+        state["crawl"] = crawl
+
+    # the content store's index, or the flat store's manifest
+    images = dict()
+    if os.path.isfile(os.path.join(img_dump_path, "index.sqlite")):
+        from MineralPydiaStore import ImageStore
+
+        store = ImageStore(img_dump_path)
+        images = dict(store="content", **store.counts())
+        store.close()
+    elif os.path.isfile(os.path.join(img_dump_path, "manifest.sqlite")):
+        from MineralPydiaManifest import ImageManifest
+
+        manifest = ImageManifest(os.path.join(img_dump_path, "manifest.sqlite"))
+        images = dict(store="flat", **manifest.counts())
+        manifest.close()
+
+    images.update(_run(os.path.join(img_dump_path, "metrics.json"), os.path.join(img_dump_path, "dead_letters.jsonl")))
+    if images:
+        state["images"] = images
+
+    if os.path.isfile(queue_path):
+        from MineralPydiaQueue import WorkQueue, MINERAL, IMAGE
+
+        work = WorkQueue(queue_path)
+        state["queue"] = {"minerals": work.counts(MINERAL), "images": work.counts(IMAGE), "seeded": work.get("seeded")}
+        work.close()
+
+    from MineralPydiaSnapshot import snapshots
+
+    index = snapshots(snapshot_path)
+    if index:
+        state["snapshots"] = {"count": len(index), "latest": index[-1]}
+
+    return state
+
+
+# reads the metrics and dead letters of a run
+def _run(metrics_path, dead_letters_path):
+    """
+    _run
+
+    :param metrics_path: the JSON report of the run.
+    :param dead_letters_path: the dead letters of the run.
+    :return: a dictionary of when the run started, how long it took and its counters, and the number of dead letters,
+             leaving out whichever file does not exist.
+    """
+
+    run = dict()
+
+    if os.path.isfile(metrics_path):
+        try:
+            with open(metrics_path, encoding="utf-8") as file:
+                report = json.load(file)
+            run["started"] = report.get("started")
+            run["elapsed"] = report.get("elapsed")
+            run["counters"] = dict((name, counter["total"]) for name, counter in report.get("counters", {}).items())
+        except (OSError, ValueError):
+            pass
+
+    if os.path.isfile(dead_letters_path):
+        with open(dead_letters_path, encoding="utf-8") as file:
+            run["dead_letters"] = sum(1 for line in file if line.strip())
+
+    return run
+
+
+# prints the state gathered by status
+def _print_status(state):
+    """
+    _print_status
+
+    :param state: the dictionary returned by status.
+    """
+
+    if not state:
+        print("Nothing has been crawled, downloaded, queued or snapshotted yet.")
+        return
+
+    for part, values in state.items():
+        print(part)
+        for name, value in values.items():
+            if isinstance(value, dict):
+                value = ", ".join(str(key) + " " + str(item) for key, item in value.items())
+            print("    " + name + ": " + str(value))
+
+
+def main(argv=None):
+    """
+    main
+
+    Runs the subcommand given on the command line.
+
+    :param argv: the arguments, if None the arguments of the process.
+    """
+
+    argv = sys.argv[1:] if argv is None else argv
+    cli = parser()
+    args, rest = cli.parse_known_args(argv)
+
+    if rest and args.command not in PASSTHROUGH:
+        cli.error("unrecognized arguments: " + " ".join(rest))
+
+    level = args.log_level or os.environ.get(ENV_PREFIX + "LOG_LEVEL")
+    output_format = args.log_format or os.environ.get(ENV_PREFIX + "LOG_FORMAT")
+
+    if args.command == "status":
+        try:
+            values = dict(STATUS_DEFAULTS, **resolve("status", STATUS, args))
+        except ValueError as e:
+            cli.error(str(e))
+
+        state = status(values["OUTPUT"], values["IMG_DUMP_PATH"], values["QUEUE_PATH"], values["SNAPSHOT_PATH"])
+        if args.json:
+            print(json.dumps(state, indent=4))
+        else:
+            _print_status(state)
+        return
+
+    module_name, _, options = COMMANDS[args.command]
+    try:
+        values = resolve(args.command, options, args)
+    except ValueError as e:
+        cli.error(str(e))
+
+    # only now is the program, and whatever it depends on, imported
+    module = importlib.import_module(module_name)
+    for name, value in values.items():
+        setattr(module, name, value)
+
+    # the programs create their loggers when they are imported, so they are configured afterwards
+    if level is not None or output_format is not None:
+        from MineralPydiaLog import configure
+
+        configure(level.upper() if level is not None else None, output_format)
+
+    if args.command in PASSTHROUGH:
+        sys.argv = [cli.prog + " " + args.command] + rest
+
+    module.main()
+
+
+if __name__ == "__main__":
+    """
+    Executes main if not being imported.
+    """
+    main()